@@ -2,11 +2,13 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 
 OPENAI_CLIENT = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Used by async views, e.g. the streaming chatbot
+OPENAI_ASYNC_CLIENT = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "cvapp.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -65,6 +68,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # The web server and the process_jobs worker write to the same file;
+        # wait for the other side's lock instead of failing after 5 seconds.
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -106,3 +112,147 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+
+# PDF text extraction
+# "hybrid" reads the embedded text layer and only OCRs pages without usable
+# text; "ocr" rasterizes and OCRs every page.
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "hybrid")
+# A page's text layer is used only if it has at least this many visible
+# characters, and at least this share of them are letters or digits.
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "20"))
+PDF_TEXT_MIN_ALNUM_RATIO = float(os.getenv("PDF_TEXT_MIN_ALNUM_RATIO", "0.6"))
+
+# Number of processes used to OCR the pages of a single PDF in parallel. The
+# pool is shared by all requests in a server process; 1 OCRs sequentially.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+# Pages rendered per pdftoppm call. Rendered pages are OCR'd and freed one at
+# a time, so this bounds temporary disk use rather than memory.
+OCR_RENDER_BATCH_PAGES = int(os.getenv("OCR_RENDER_BATCH_PAGES", "4"))
+# "tesserocr" keeps an initialized Tesseract instance per OCR worker and
+# passes page images to it in memory (requires the optional tesserocr
+# package); "pytesseract" runs the tesseract command once per page. "auto"
+# uses tesserocr when it is installed.
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+# "adaptive" probes each page at low resolution first: blank pages are
+# skipped, the rest are rendered in grayscale at a resolution that makes a
+# typical text line about OCR_TARGET_LINE_PIXELS tall (within OCR_MIN_DPI and
+# OCR_MAX_DPI), binarized, and OCR'd with a page segmentation mode chosen from
+# their layout. "off" renders in color at 200 DPI and lets Tesseract decide.
+# Compare the two on your own CVs with `manage.py benchmark_ocr`.
+OCR_PREPROCESSING = os.getenv("OCR_PREPROCESSING", "off")
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "150"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "300"))
+OCR_TARGET_LINE_PIXELS = int(os.getenv("OCR_TARGET_LINE_PIXELS", "36"))
+
+# Legacy .doc extraction
+# .doc files go through the extractors in DOC_EXTRACTORS in turn until one
+# returns text: "textract" and "antiword" run the antiword converter,
+# "olefile" reads the document in pure Python. Each attempt runs in one of
+# DOC_EXTRACTION_WORKERS reusable worker processes and is killed after
+# DOC_EXTRACTION_TIMEOUT seconds. DOC_EXTRACTION_MEMORY_LIMIT caps the virtual
+# address space (RLIMIT_AS) of each worker and of each converter it starts,
+# in bytes. Workers start from a small fork server, not from the server
+# process, so the cap bounds the extraction rather than the server's size;
+# it counts mapped memory, so keep it well above what the files need.
+DOC_EXTRACTORS = os.getenv("DOC_EXTRACTORS", "textract,olefile")
+DOC_EXTRACTION_WORKERS = int(os.getenv("DOC_EXTRACTION_WORKERS", "2"))
+DOC_EXTRACTION_TIMEOUT = float(os.getenv("DOC_EXTRACTION_TIMEOUT", "30"))
+DOC_EXTRACTION_MEMORY_LIMIT = int(
+    os.getenv("DOC_EXTRACTION_MEMORY_LIMIT", "1073741824")
+)
+
+# Upload limits, checked while the files are received (see cvapp.uploads):
+# larger files, and files past the total for one request, are rejected.
+CV_UPLOAD_MAX_FILE_SIZE = int(os.getenv("CV_UPLOAD_MAX_FILE_SIZE", "10485760"))
+CV_UPLOAD_MAX_REQUEST_SIZE = int(os.getenv("CV_UPLOAD_MAX_REQUEST_SIZE", "52428800"))
+
+# Number of files of one upload that are extracted and parsed concurrently.
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+# CV parsing
+# "llm" parses every CV with GPT-4; "local" only uses the rule-based parser;
+# "tiered" runs the rule-based parser first and sends GPT-4 only the sections
+# whose confidence (0 to 1) is below CV_PARSER_CONFIDENCE_THRESHOLD.
+CV_PARSER_MODE = os.getenv("CV_PARSER_MODE", "llm")
+CV_PARSER_CONFIDENCE_THRESHOLD = float(
+    os.getenv("CV_PARSER_CONFIDENCE_THRESHOLD", "0.6")
+)
+
+# Batched GPT-4 parsing, used by the ingest_cvs command: up to this many CVs
+# are parsed by a single request. Each CV reserves
+# LLM_PARSE_OUTPUT_TOKENS_PER_CV tokens of the reply (the request's
+# max_tokens), and the prompt plus the reply stay within LLM_PARSE_BATCH_TOKENS,
+# which is kept below the model's context (LLM_PARSE_CONTEXT_TOKENS) to leave
+# room for the error of the token estimate.
+LLM_PARSE_BATCH_SIZE = int(os.getenv("LLM_PARSE_BATCH_SIZE", "3"))
+LLM_PARSE_BATCH_TOKENS = int(os.getenv("LLM_PARSE_BATCH_TOKENS", "7000"))
+LLM_PARSE_OUTPUT_TOKENS_PER_CV = int(os.getenv("LLM_PARSE_OUTPUT_TOKENS_PER_CV", "800"))
+LLM_PARSE_CONTEXT_TOKENS = int(os.getenv("LLM_PARSE_CONTEXT_TOKENS", "8192"))
+
+# Background ingestion
+# When enabled, upload_cv only stores the files and queues them; run
+# `python manage.py process_jobs` to extract and parse them.
+CV_BACKGROUND_INGESTION = os.getenv("CV_BACKGROUND_INGESTION", "False") == "True"
+# Seconds an idle worker waits before polling the queue again.
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "1"))
+# Running jobs older than this (in seconds) are requeued when a worker starts.
+INGESTION_JOB_STALE_AFTER = int(os.getenv("INGESTION_JOB_STALE_AFTER", "900"))
+
+
+# Chatbot retrieval
+# CV text is split into chunks of this many words (overlapping by the second
+# value), and each question is sent with only the best-matching chunks.
+CHATBOT_CHUNK_WORDS = int(os.getenv("CHATBOT_CHUNK_WORDS", "120"))
+CHATBOT_CHUNK_OVERLAP_WORDS = int(os.getenv("CHATBOT_CHUNK_OVERLAP_WORDS", "20"))
+CHATBOT_RETRIEVAL_TOP_K = int(os.getenv("CHATBOT_RETRIEVAL_TOP_K", "8"))
+
+# Conversation history sent with each question. Recent messages are kept
+# verbatim within this many tokens; older ones are folded into a running
+# summary of at most CHATBOT_SUMMARY_TOKEN_BUDGET tokens.
+CHATBOT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHATBOT_HISTORY_TOKEN_BUDGET", "1500"))
+CHATBOT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHATBOT_SUMMARY_TOKEN_BUDGET", "300"))
+
+# Chatbot response cache
+# Replies are cached by the CV excerpts, history and normalized question they
+# answer. Set CHATBOT_CACHE_BACKEND to a shared backend (e.g.
+# django.core.cache.backends.redis.RedisCache with CHATBOT_CACHE_LOCATION set
+# to the server URL) to share replies between workers; the default in-memory
+# cache is per process and evicts the least recently used entries once it
+# holds CHATBOT_CACHE_MAX_ENTRIES.
+CHATBOT_CACHE_ENABLED = os.getenv("CHATBOT_CACHE_ENABLED", "True") == "True"
+CHATBOT_CACHE_TTL = int(os.getenv("CHATBOT_CACHE_TTL", "3600"))
+CHATBOT_CACHE_BACKEND = os.getenv(
+    "CHATBOT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+CHATBOT_CACHE_MAX_ENTRIES = int(os.getenv("CHATBOT_CACHE_MAX_ENTRIES", "1000"))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "chatbot": {
+        "BACKEND": CHATBOT_CACHE_BACKEND,
+        "LOCATION": os.getenv("CHATBOT_CACHE_LOCATION", "chatbot-replies"),
+        "TIMEOUT": CHATBOT_CACHE_TTL,
+    },
+}
+if CHATBOT_CACHE_BACKEND.endswith("LocMemCache"):
+    # Evict a single least recently used entry at a time, rather than the
+    # default third of the cache
+    CACHES["chatbot"]["OPTIONS"] = {
+        "MAX_ENTRIES": CHATBOT_CACHE_MAX_ENTRIES,
+        "CULL_FREQUENCY": CHATBOT_CACHE_MAX_ENTRIES,
+    }
+
+# Candidate search
+# Results per page of the search/ endpoint, by default and at most.
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+
+# Instrumentation
+# When enabled, the time spent in each pipeline stage, the pages of each PDF
+# and the tokens of each GPT-4 call are recorded in per-process histograms,
+# exposed in the Prometheus text format at /metrics/, and each response gets a
+# Server-Timing header with the stages it ran.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
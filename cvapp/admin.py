@@ -1,5 +1,19 @@
 from django.contrib import admin
 
-from .models import CVDocument
+from .models import (
+    ChatMessage,
+    Conversation,
+    CVDocument,
+    Employer,
+    IngestionJob,
+    Institution,
+    Skill,
+)
 
 admin.site.register(CVDocument)
+admin.site.register(IngestionJob)
+admin.site.register(Conversation)
+admin.site.register(ChatMessage)
+admin.site.register(Skill)
+admin.site.register(Employer)
+admin.site.register(Institution)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CvappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cvapp'
+
+    def ready(self):
+        from . import fulltext
+
+        # Later migrations that rebuild cvapp_cvdocument drop the FTS triggers
+        post_migrate.connect(fulltext.restore_triggers_after_migrate, sender=self)
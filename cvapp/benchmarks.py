@@ -0,0 +1,716 @@
+import difflib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.messages import constants as message_constants
+from django.contrib.messages import get_messages
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from docx import Document
+from docx.oxml import parse_xml
+from pdf2image import convert_from_path
+from PIL import Image
+
+from .ingest import find_cv_files
+from .utils.document_parser import parse_cv
+from .utils.ocr_engines import ENGINES, available_engines
+from .utils.ocr_parser import (
+    extract_text,
+    extract_text_from_doc,
+    extract_text_from_docx,
+    extract_text_from_pdf,
+)
+
+STAGES = (
+    "extract_text_from_pdf",
+    "extract_text_from_docx",
+    "python_docx_paragraphs",
+    "extract_text_from_doc",
+    "parse_cv",
+    "legacy_parse_cv",
+    "upload_cv",
+)
+# Stages timed on CV texts rather than files
+PARSE_STAGES = ("parse_cv", "legacy_parse_cv")
+# Bump when the layout of the results changes
+RESULTS_VERSION = 3
+# Settings that change what is measured; results taken with different values
+# are not comparable
+COMPARABLE_META = ("parser_mode", "llm_latency")
+
+WORDS = (
+    "delivered scalable services team leadership stakeholder analysis "
+    "migration platform reliability customers reporting automation design "
+    "testing budget mentoring research quality operations"
+).split()
+# OCR_PREPROCESSING modes compared by compare_ocr_preprocessing; the first is
+# the baseline the speedup is relative to
+OCR_MODES = ("off", "adaptive")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Lines per page of the synthetic PDFs, at 16pt leading on an A4 page
+PDF_LINES_PER_PAGE = 45
+
+# Text that synthetic DOCX files keep outside their body paragraphs, where
+# many CV templates put contact details and skills. The DOCX stages report
+# which of these places their output covered.
+DOCX_MARKERS = {
+    "header": "Jane Doe, Senior Engineer",
+    "text box": "linkedin.com/in/janedoe",
+    "table": "Skills\tPython, Django, PostgreSQL, Docker",
+    "footer": "References available on request",
+}
+DOCX_STAGES = ("extract_text_from_docx", "python_docx_paragraphs")
+TEXT_BOX_XML = """
+<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+     xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006">
+  <w:r><mc:AlternateContent>
+    <mc:Choice Requires="wps"><w:drawing><w:txbxContent>
+      <w:p><w:r><w:t>{text}</w:t></w:r></w:p>
+    </w:txbxContent></w:drawing></mc:Choice>
+    <mc:Fallback><w:pict><w:txbxContent>
+      <w:p><w:r><w:t>{text}</w:t></w:r></w:p>
+    </w:txbxContent></w:pict></mc:Fallback>
+  </mc:AlternateContent></w:r>
+</w:p>
+"""
+
+FAKE_PARSE = {
+    "personal_info": {
+        "name": "Jane Doe",
+        "emails": ["jane.doe@example.com"],
+        "phones": ["+44 555 123 4567"],
+    },
+    "education": ["BSc Computer Science, University of Leeds"],
+    "work_experience": ["Engineer at Company 1"],
+    "skills": ["Python", "Django"],
+    "projects": ["CV analyzer"],
+    "certifications": ["AWS Solutions Architect"],
+}
+
+
+class FakeOpenAIClient:
+    """
+    Stands in for settings.OPENAI_CLIENT: every chat completion waits
+    `latency` seconds and answers with a fixed, valid parse (one per CV for
+    batched prompts), so the pipeline can be timed without calling GPT-4.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        numbers = re.findall(r"#### CV (\d+) ####", messages[-1]["content"])
+        reply = {number: FAKE_PARSE for number in numbers} if numbers else FAKE_PARSE
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))
+            ]
+        )
+
+
+def make_text_pdf(page_texts):
+    """
+    Builds a minimal born-digital PDF with one page per entry in `page_texts`.
+    Pages with an empty string have no text layer at all, like a scanned page.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, None]
+    objects[2] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    kids = []
+    for text in page_texts:
+        lines = [f"({line}) Tj 0 -16 Td".encode("latin-1") for line in text.split("\n")]
+        stream = b"BT /F1 12 Tf 50 780 Td " + b" ".join(lines) + b" ET" if text else b""
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(kids),
+        len(kids),
+    )
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return pdf
+
+
+def synthetic_cv(size_kb, seed=0):
+    """
+    Builds a CV of roughly `size_kb` kilobytes: contact details, a long work
+    history and the other usual sections. Lines are short enough to fit on a
+    PDF page.
+    """
+    rng = random.Random(seed)
+    lines = [
+        "Jane Doe",
+        "jane.doe@example.com | +44 555 123 4567",
+        "",
+        "Work Experience",
+    ]
+    while sum(len(line) + 1 for line in lines) < size_kb * 1024:
+        words = " ".join(rng.choice(WORDS) for _ in range(8))
+        lines.append(f"Engineer at Company {len(lines)}: {words}")
+    lines += [
+        "",
+        "Education",
+        "BSc Computer Science, University of Leeds",
+        "",
+        "Skills",
+        "Python, Django, PostgreSQL, Docker",
+        "",
+        "Projects",
+        "CV analyzer",
+        "",
+        "Certifications",
+        "AWS Solutions Architect",
+    ]
+    return "\n".join(lines)
+
+
+def write_synthetic_files(directory, text, name):
+    """
+    Writes `text` as a text-layer PDF and as a DOCX file in `directory` and
+    returns their paths. The DOCX file is laid out like a CV template, with
+    DOCX_MARKERS in its header, a text box, a table and its footer.
+    """
+    lines = text.split("\n")
+    pages = [
+        "\n".join(lines[start : start + PDF_LINES_PER_PAGE])
+        for start in range(0, len(lines), PDF_LINES_PER_PAGE)
+    ]
+    pdf_path = os.path.join(directory, f"{name}.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(make_text_pdf(pages))
+
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = DOCX_MARKERS["header"]
+    document.sections[0].footer.paragraphs[0].text = DOCX_MARKERS["footer"]
+    body = document.element.body
+    body.insert(
+        len(body) - 1, parse_xml(TEXT_BOX_XML.format(text=DOCX_MARKERS["text box"]))
+    )
+    table = document.add_table(rows=1, cols=2)
+    for cell, value in zip(table.rows[0].cells, DOCX_MARKERS["table"].split("\t")):
+        cell.text = value
+    for line in lines:
+        document.add_paragraph(line)
+    docx_path = os.path.join(directory, f"{name}.docx")
+    document.save(docx_path)
+    return pdf_path, docx_path
+
+
+def build_inputs(directory, sample_dir, sizes, stages=STAGES):
+    """
+    Collects the inputs of every stage. The sample corpus is used as is, and
+    synthetic CVs of each size in `sizes` (in kilobytes) are written to
+    `directory`. The sample texts for the PARSE_STAGES are only extracted
+    when one of them is among `stages`.
+
+    Returns a dict mapping each stage to a list of (input name, items) pairs,
+    where items are file paths (texts for the PARSE_STAGES), and a dict of
+    inputs that could not be prepared, mapping "stage:input" to the reason.
+    """
+    inputs = {stage: [] for stage in STAGES}
+    unavailable = {}
+
+    samples = [os.path.join(sample_dir, name) for name in find_cv_files(sample_dir)]
+    by_extension = {}
+    for path in samples:
+        by_extension.setdefault(os.path.splitext(path)[1].lower(), []).append(path)
+    for stage, extension in (
+        ("extract_text_from_pdf", ".pdf"),
+        ("extract_text_from_docx", ".docx"),
+        ("python_docx_paragraphs", ".docx"),
+        ("extract_text_from_doc", ".doc"),
+    ):
+        if extension in by_extension:
+            inputs[stage].append(("sample", by_extension[extension]))
+        else:
+            unavailable[f"{stage}:sample"] = f"no {extension} files in {sample_dir}"
+    if samples:
+        inputs["upload_cv"].append(("sample", samples))
+    if samples and set(PARSE_STAGES) & set(stages):
+        try:
+            texts = [extract_text(path) for path in samples]
+        except Exception as e:
+            for stage in PARSE_STAGES:
+                unavailable[f"{stage}:sample"] = f"text extraction failed: {e}"
+        else:
+            for stage in PARSE_STAGES:
+                inputs[stage].append(("sample", texts))
+    elif not samples:
+        for stage in (*PARSE_STAGES, "upload_cv"):
+            unavailable[f"{stage}:sample"] = f"no CV files in {sample_dir}"
+
+    for size_kb in sizes:
+        name = f"synthetic-{size_kb}kb"
+        text = synthetic_cv(size_kb)
+        pdf_path, docx_path = write_synthetic_files(directory, text, name)
+        inputs["extract_text_from_pdf"].append((name, [pdf_path]))
+        inputs["extract_text_from_docx"].append((name, [docx_path]))
+        inputs["python_docx_paragraphs"].append((name, [docx_path]))
+        for stage in PARSE_STAGES:
+            inputs[stage].append((name, [text]))
+        inputs["upload_cv"].append((name, [pdf_path, docx_path]))
+    return inputs, unavailable
+
+
+@contextmanager
+def test_database():
+    """
+    Runs the block against a fresh, migrated test database that is destroyed
+    afterwards, so the upload_cv stage neither needs the configured database
+    to be migrated nor touches its data. Under manage.py test, which already
+    set up a test database, the block runs against that one.
+    """
+    try:
+        setup_test_environment()
+    except RuntimeError:
+        yield
+        return
+    old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def upload_files(paths):
+    """
+    Posts `paths` to the upload_cv view in one request, inside a transaction
+    that is rolled back, so every run starts without cached results and no
+    documents are left behind. Raises if any file was not processed.
+    """
+    client = Client()
+    files = [open(path, "rb") for path in paths]
+    try:
+        with transaction.atomic():
+            response = client.post(reverse("upload_cv"), {"file": files})
+            transaction.set_rollback(True)
+    finally:
+        for f in files:
+            f.close()
+    errors = [
+        str(message)
+        for message in get_messages(response.wsgi_request)
+        if message.level == message_constants.ERROR
+    ]
+    if errors or response.status_code != 302:
+        raise Exception(
+            errors[0] if errors else f"upload_cv returned {response.status_code}"
+        )
+
+
+def python_docx_paragraphs(file_path):
+    """
+    The DOCX extractor as it was before streaming (see docx_text): a full
+    python-docx document, of which only the body paragraphs are read. Kept
+    as a reference for the speed and coverage of extract_text_from_docx.
+    """
+    document = Document(file_path)
+    return "\n".join([paragraph.text for paragraph in document.paragraphs])
+
+
+def legacy_parse_cv(text):
+    """
+    The rule-based parser as it was before the single-pass segmenter (see
+    document_parser.segment_sections): one uncompiled search over the whole
+    text per section, plus a full split for the name. Kept as a reference
+    for the speed and output of parse_cv.
+    """
+    personal_info = {}
+    email_pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
+    personal_info["emails"] = re.findall(email_pattern, text)
+    phone_pattern = r"\b(?:\+?(\d{1,3})[-.\s]?)?(\d{3})[-.\s]?(\d{3})[-.\s]?(\d{4})\b"
+    phones = re.findall(phone_pattern, text)
+    personal_info["phones"] = ["".join(match) for match in phones]
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    if lines:
+        personal_info["name"] = lines[0]
+
+    def section_lines(pattern):
+        section = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+        if not section:
+            return []
+        lines = section.group(1).strip().split("\n")
+        return [line.strip() for line in lines if line.strip()]
+
+    skills = []
+    skills_section = re.search(
+        r"Skills(.*?)(?:\n\s*\n|\Z)", text, re.DOTALL | re.IGNORECASE
+    )
+    if skills_section:
+        skills = [
+            skill.strip()
+            for skill in re.split(r",|\n", skills_section.group(1))
+            if skill.strip()
+        ]
+
+    return {
+        "personal_info": personal_info,
+        "education": section_lines(r"Education(.*?)(?:\n\s*\n|\Z)"),
+        "work_experience": section_lines(
+            r"(?:Experience|Work Experience)(.*?)(?:\n\s*\n|\Z)"
+        ),
+        "skills": skills,
+        "projects": section_lines(r"Projects(.*?)(?:\n\s*\n|\Z)"),
+        "certifications": section_lines(r"Certifications(.*?)(?:\n\s*\n|\Z)"),
+    }
+
+
+def found_docx_markers(text):
+    """
+    Returns the places of DOCX_MARKERS (see write_synthetic_files) found in
+    extracted text.
+    """
+    return [place for place, marker in DOCX_MARKERS.items() if marker in text]
+
+
+STAGE_FUNCTIONS = {
+    "extract_text_from_pdf": extract_text_from_pdf,
+    "extract_text_from_docx": extract_text_from_docx,
+    "python_docx_paragraphs": python_docx_paragraphs,
+    "extract_text_from_doc": extract_text_from_doc,
+    "parse_cv": parse_cv,
+    "legacy_parse_cv": legacy_parse_cv,
+}
+
+
+def time_stage(stage, items, repeat):
+    """
+    Runs a stage over all of `items` once to warm up, then `repeat` times,
+    and returns the timings in seconds. Raises if the warm-up run fails.
+    """
+    if stage == "upload_cv":
+
+        def run():
+            upload_files(items)
+
+    else:
+
+        def run():
+            for item in items:
+                STAGE_FUNCTIONS[stage](item)
+
+    run()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return {
+        "items": len(items),
+        "runs": repeat,
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+    }
+
+
+def run_benchmarks(
+    sample_dir, sizes=(10, 100), repeat=5, llm_latency=0.5, stages=STAGES, progress=None
+):
+    """
+    Times each of `stages` on the sample corpus in `sample_dir` and on
+    synthetic CVs of each size in `sizes` (in kilobytes).
+
+    GPT-4 is replaced by a FakeOpenAIClient waiting `llm_latency` seconds per
+    request, and uploaded files go to a temporary MEDIA_ROOT and, for the
+    upload_cv stage, to a test database (see test_database). A stage that
+    fails on an input (e.g. because Tesseract or antiword is not installed)
+    is recorded as skipped with the reason, instead of stopping the run.
+    The DOCX stages also record which DOCX_MARKERS they "found" in the
+    synthetic files, and legacy_parse_cv whether it gives the "same_output"
+    as parse_cv.
+
+    `progress(name, result)` is called after each input. Returns a dict with
+    the run's settings under "meta" and, under "results", the timings of each
+    "stage:input" in seconds.
+    """
+    meta = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parser_mode": settings.CV_PARSER_MODE,
+        "llm_latency": llm_latency,
+        "repeat": repeat,
+        "sizes": list(sizes),
+    }
+    results = {}
+    directory = tempfile.mkdtemp(prefix="cv-benchmark-")
+    database = test_database() if "upload_cv" in stages else nullcontext()
+    try:
+        with database, override_settings(
+            OPENAI_CLIENT=FakeOpenAIClient(llm_latency),
+            MEDIA_ROOT=os.path.join(directory, "media"),
+            CV_BACKGROUND_INGESTION=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            inputs, unavailable = build_inputs(directory, sample_dir, sizes, stages)
+            for stage in stages:
+                for key, reason in unavailable.items():
+                    if key.startswith(f"{stage}:"):
+                        results[key] = {"skipped": reason}
+                        if progress:
+                            progress(key, results[key])
+                for name, items in inputs[stage]:
+                    key = f"{stage}:{name}"
+                    try:
+                        results[key] = time_stage(stage, items, repeat)
+                        if stage in DOCX_STAGES and name != "sample":
+                            text = STAGE_FUNCTIONS[stage](items[0])
+                            results[key]["found"] = found_docx_markers(text)
+                        if stage == "legacy_parse_cv":
+                            results[key]["same_output"] = all(
+                                legacy_parse_cv(text) == parse_cv(text)
+                                for text in items
+                            )
+                    except Exception as e:
+                        results[key] = {"skipped": str(e)}
+                    if progress:
+                        progress(key, results[key])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, tolerance=0.25, min_delta=0.005):
+    """
+    Compares the median timings of two runs of run_benchmarks.
+
+    A result is a regression when its median is more than `tolerance` (a
+    fraction) above the baseline's and at least `min_delta` seconds slower,
+    so that noise on very fast stages is not reported. Returns one dict per
+    result of `current` with its "name", "baseline" and "current" medians
+    (None when missing or skipped), their "ratio" and a "status": "ok",
+    "regression", "new" or "skipped".
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name, {}).get("median")
+        after = result.get("median")
+        row = {"name": name, "baseline": before, "current": after, "ratio": None}
+        if after is None:
+            row["status"] = "skipped"
+        elif before is None:
+            row["status"] = "new"
+        else:
+            row["ratio"] = after / before if before else None
+            slower = after > before * (1 + tolerance) and after - before >= min_delta
+            row["status"] = "regression" if slower else "ok"
+        rows.append(row)
+    return rows
+
+
+def incomparable_settings(current, baseline):
+    """
+    Returns the names of the settings that differ between two runs and make
+    their timings incomparable.
+    """
+    return [
+        name
+        for name in COMPARABLE_META
+        if current["meta"].get(name) != baseline["meta"].get(name)
+    ]
+
+
+def character_accuracy(reference, text):
+    """
+    Returns 1 minus the character error rate of `text` against `reference`,
+    with runs of whitespace counted as one space. The number of edits comes
+    from a difflib alignment, which approximates the Levenshtein distance
+    without its quadratic cost on long pages. Can be negative when `text` is
+    mostly noise.
+    """
+    reference = WHITESPACE_PATTERN.sub(" ", reference).strip()
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()
+    if not reference:
+        return 1.0 if not text else 0.0
+    matcher = difflib.SequenceMatcher(None, reference, text, autojunk=False)
+    edits = sum(
+        max(end1 - start1, end2 - start2)
+        for tag, start1, end1, start2, end2 in matcher.get_opcodes()
+        if tag != "equal"
+    )
+    return 1 - edits / len(reference)
+
+
+def compare_ocr_preprocessing(
+    sample_dir, ground_truth_dir=None, repeat=1, modes=OCR_MODES, progress=None
+):
+    """
+    OCRs every page of each PDF in `sample_dir` with each OCR_PREPROCESSING
+    mode in `modes`, sequentially, and reports their speed and accuracy.
+
+    Accuracy (see character_accuracy) is measured against "<name>.txt" in
+    `ground_truth_dir` (default: `sample_dir`) when it exists, and otherwise
+    against the output of the first mode, in which case it only shows how
+    much the other modes change the text.
+
+    `progress(row)` is called after each file. Returns a dict with the run's
+    settings under "meta", one row per file under "files" (with "seconds"
+    and "accuracy" per mode, or "skipped" with the reason) and, under
+    "summary", the total seconds and mean accuracy per mode over the files
+    that were measured, the "speedup" of each mode over the first and its
+    "accuracy_change".
+    """
+    ground_truth_dir = ground_truth_dir or sample_dir
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "modes": list(modes),
+        "repeat": repeat,
+        "min_dpi": settings.OCR_MIN_DPI,
+        "max_dpi": settings.OCR_MAX_DPI,
+        "target_line_pixels": settings.OCR_TARGET_LINE_PIXELS,
+    }
+    rows = []
+    for name in find_cv_files(sample_dir):
+        if os.path.splitext(name)[1].lower() != ".pdf":
+            continue
+        row = {"name": name}
+        try:
+            texts, row["seconds"] = {}, {}
+            for mode in modes:
+                with override_settings(
+                    PDF_EXTRACTION_MODE="ocr", OCR_PREPROCESSING=mode, OCR_WORKERS=1
+                ):
+                    timings = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        texts[mode] = extract_text_from_pdf(
+                            os.path.join(sample_dir, name)
+                        )
+                        timings.append(time.perf_counter() - started)
+                row["seconds"][mode] = statistics.median(timings)
+        except Exception as e:
+            row = {"name": name, "skipped": str(e)}
+        else:
+            truth_path = os.path.join(
+                ground_truth_dir, os.path.splitext(name)[0] + ".txt"
+            )
+            if os.path.exists(truth_path):
+                with open(truth_path, encoding="utf-8") as f:
+                    reference = f.read()
+                row["reference"] = "ground truth"
+            else:
+                reference = texts[modes[0]]
+                row["reference"] = modes[0]
+            row["accuracy"] = {
+                mode: character_accuracy(reference, text)
+                for mode, text in texts.items()
+            }
+        rows.append(row)
+        if progress:
+            progress(row)
+
+    measured = [row for row in rows if "skipped" not in row]
+    summary = {}
+    if measured:
+        seconds = {
+            mode: sum(row["seconds"][mode] for row in measured) for mode in modes
+        }
+        accuracy = {
+            mode: statistics.mean(row["accuracy"][mode] for row in measured)
+            for mode in modes
+        }
+        summary = {
+            "files": len(measured),
+            "seconds": seconds,
+            "accuracy": accuracy,
+            "speedup": {
+                mode: seconds[modes[0]] / seconds[mode] if seconds[mode] else None
+                for mode in modes
+            },
+            "accuracy_change": {
+                mode: accuracy[mode] - accuracy[modes[0]] for mode in modes
+            },
+        }
+    return {"meta": meta, "files": rows, "summary": summary}
+
+
+def compare_ocr_engines(sample_dir, engines=tuple(ENGINES), progress=None):
+    """
+    Renders every page of the PDFs in `sample_dir` once, as OCR does by
+    default, then OCRs all of the pages with each engine in `engines` (see
+    ocr_engines) and reports their per-page latency.
+
+    Each engine starts fresh, so its first page includes loading Tesseract.
+    Engines that are not installed are recorded as skipped. `progress(name,
+    result)` is called after each engine. Returns a dict with "pages", and
+    under "engines", per engine, "first_page", "median" and "mean" seconds
+    per page and the "speedup" of its median over the first engine's (or
+    "skipped" with the reason).
+    """
+    directory = tempfile.mkdtemp(prefix="cv-ocr-benchmark-")
+    try:
+        paths = []
+        for name in find_cv_files(sample_dir):
+            if os.path.splitext(name)[1].lower() == ".pdf":
+                paths += convert_from_path(
+                    os.path.join(sample_dir, name),
+                    output_folder=directory,
+                    paths_only=True,
+                )
+        results = {}
+        for name in engines:
+            if name not in available_engines():
+                results[name] = {"skipped": f"{name} is not installed"}
+            else:
+                engine = ENGINES[name]()
+                timings = []
+                for path in paths:
+                    with Image.open(path) as image:
+                        image.load()
+                        started = time.perf_counter()
+                        engine.image_to_string(image)
+                        timings.append(time.perf_counter() - started)
+                results[name] = {
+                    "first_page": timings[0] if timings else None,
+                    "median": statistics.median(timings) if timings else None,
+                    "mean": statistics.mean(timings) if timings else None,
+                }
+            if progress:
+                progress(name, results[name])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    baseline = results[engines[0]].get("median")
+    for result in results.values():
+        if "median" in result:
+            result["speedup"] = (
+                baseline / result["median"] if baseline and result["median"] else None
+            )
+    return {"pages": len(paths), "engines": results}
@@ -0,0 +1,171 @@
+import html
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+# The FTS5 table created by migration 0009 (SQLite only)
+FTS_TABLE = "cvapp_cvdocument_fts"
+# The triggers that keep it in sync, as created by migration 0009. Django's
+# SQLite schema editor drops them whenever a later migration rebuilds the
+# cvapp_cvdocument table, so restore_triggers() recreates them after migrate.
+TRIGGERS = {
+    "cvapp_cvdocument_fts_insert": """
+        CREATE TRIGGER cvapp_cvdocument_fts_insert AFTER INSERT ON cvapp_cvdocument
+        BEGIN
+            INSERT INTO cvapp_cvdocument_fts(rowid, extracted_text)
+            VALUES (new.id, new.extracted_text);
+        END
+    """,
+    "cvapp_cvdocument_fts_delete": """
+        CREATE TRIGGER cvapp_cvdocument_fts_delete AFTER DELETE ON cvapp_cvdocument
+        BEGIN
+            INSERT INTO cvapp_cvdocument_fts(
+                cvapp_cvdocument_fts, rowid, extracted_text
+            )
+            VALUES ('delete', old.id, old.extracted_text);
+        END
+    """,
+    "cvapp_cvdocument_fts_update": """
+        CREATE TRIGGER cvapp_cvdocument_fts_update
+        AFTER UPDATE OF extracted_text ON cvapp_cvdocument
+        BEGIN
+            INSERT INTO cvapp_cvdocument_fts(
+                cvapp_cvdocument_fts, rowid, extracted_text
+            )
+            VALUES ('delete', old.id, old.extracted_text);
+            INSERT INTO cvapp_cvdocument_fts(rowid, extracted_text)
+            VALUES (new.id, new.extracted_text);
+        END
+    """,
+}
+# Words of context around the matches in each snippet
+SNIPPET_TOKENS = 16
+# Placeholders that mark matches in snippet(), replaced once the text is escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# A quoted phrase, or a single word
+QUERY_TERM_PATTERN = re.compile(r'"([^"]*)"|(\w+)')
+
+
+def is_available():
+    """
+    Whether the full-text index exists, i.e. the default database is SQLite.
+    """
+    return connection.vendor == "sqlite"
+
+
+def to_match_query(query):
+    """
+    Turns a user's search into an FTS5 query that matches documents with all
+    of its words and "quoted phrases". Every term is quoted, so operators and
+    punctuation in the input are searched for literally instead of being
+    parsed as FTS5 syntax. Returns "" when there is nothing to search for.
+    """
+    terms = []
+    for phrase, word in QUERY_TERM_PATTERN.findall(query):
+        term = phrase.strip() or word
+        if term:
+            terms.append('"%s"' % term.replace('"', '""'))
+    return " ".join(terms)
+
+
+def search_text(query, limit=20, offset=0):
+    """
+    Searches the extracted text of every CV for `query` (see to_match_query).
+
+    Returns (count, results): the number of matching documents, and up to
+    `limit` of them from `offset`, best match first, as dicts with the
+    document "id", its BM25 "rank" (lower is better) and an HTML "snippet"
+    of the text around the matches, which are wrapped in <mark> tags.
+    """
+    match = to_match_query(query)
+    if not match:
+        return 0, []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+        )
+        count = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT rowid, bm25({FTS_TABLE}), "
+            f"snippet({FTS_TABLE}, 0, %s, %s, %s, %s) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s",
+            [MATCH_START, MATCH_END, "…", SNIPPET_TOKENS, match, limit, offset],
+        )
+        rows = cursor.fetchall()
+    return count, [
+        {"id": rowid, "rank": rank, "snippet": _snippet_html(snippet)}
+        for rowid, rank, snippet in rows
+    ]
+
+
+def _snippet_html(snippet):
+    return (
+        html.escape(snippet or "")
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
+
+
+def rebuild_index():
+    """
+    Rebuilds the full-text index from the stored documents, e.g. after rows
+    were written with the triggers missing. Returns the number of documents.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute("SELECT count(*) FROM cvapp_cvdocument")
+        return cursor.fetchone()[0]
+
+
+def optimize_index():
+    """
+    Merges the index's internal segments into one, which makes queries
+    faster after many inserts and deletes.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def restore_triggers(using=DEFAULT_DB_ALIAS):
+    """
+    Recreates the index's triggers that are missing from the database. Rows
+    written without them were not indexed, so the index then needs a
+    rebuild. Does nothing before migration 0009 has created the index, or on
+    databases other than SQLite. Returns the names of the triggers created.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return []
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE name = %s OR type = 'trigger'",
+            [FTS_TABLE],
+        )
+        existing = cursor.fetchall()
+        if ("table", FTS_TABLE) not in existing:
+            return []
+        names = {name for kind, name in existing if kind == "trigger"}
+        missing = [name for name in TRIGGERS if name not in names]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+    return missing
+
+
+def restore_triggers_after_migrate(
+    sender, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs
+):
+    """
+    post_migrate receiver that restores the triggers of the migrated
+    database (see restore_triggers) and rebuilds its index if any were
+    missing.
+    """
+    restored = restore_triggers(using)
+    if not restored:
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    if verbosity >= 1:
+        print(f"Restored the full-text index triggers: {', '.join(restored)}")
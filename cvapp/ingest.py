@@ -0,0 +1,305 @@
+import json
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from django.core.files import File
+from django.db import connections, transaction
+
+from .models import CVDocument
+from .pipeline import (
+    get_parser_version,
+    hash_text,
+    hash_uploaded_file,
+    parse_texts,
+)
+from .search import index_document
+from .uploads import SNIFF_BYTES, sniff_file_type
+from .utils.ocr_parser import extract_text_timed, get_extractor_version
+
+SUPPORTED_EXTENSIONS = (".pdf", ".doc", ".docx")
+STAGES = ("hash", "extract", "parse", "write")
+
+
+def find_cv_files(directory):
+    """
+    Returns the paths (relative to `directory`) of all PDF, DOC and DOCX files
+    below it, in a stable order.
+    """
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+
+def load_checkpoint(checkpoint_path, directory):
+    """
+    Returns the set of files already ingested from `directory` according to
+    the checkpoint file. A missing checkpoint, or one written for another
+    directory, is treated as empty.
+    """
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return set()
+    if checkpoint.get("directory") != os.path.abspath(directory):
+        return set()
+    return set(checkpoint.get("done", []))
+
+
+def save_checkpoint(checkpoint_path, directory, done):
+    """
+    Records the files ingested so far. The file is replaced atomically, so an
+    interrupted run never leaves a truncated checkpoint behind.
+    """
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump({"directory": os.path.abspath(directory), "done": sorted(done)}, f)
+    os.replace(temporary_path, checkpoint_path)
+
+
+class _Item:
+    """
+    A file moving through the ingestion stages.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.content_hash = None
+        self.file_type = None
+        self.text = None
+        self.parsed = None
+        self.sources = None
+        # Later files with the same bytes, which take this file's results
+        self.duplicates = []
+
+
+def ingest_directory(
+    directory,
+    checkpoint_path,
+    workers=None,
+    parse_concurrency=4,
+    batch_size=50,
+    parse_batch_size=1,
+    progress=None,
+):
+    """
+    Stores every CV file below `directory` as a CVDocument with its extracted
+    text and parsed data.
+
+    Text extraction runs in a pool of `workers` processes (by default one per
+    CPU) and parsing in `parse_concurrency` threads, so OCR of one file
+    overlaps with the GPT-4 call of another. With `parse_batch_size` above
+    1, extracted texts are parsed in groups of that size (see parse_texts),
+    which in "llm" mode share GPT-4 requests. Rows are written in
+    transactions of `batch_size`, and after each one the checkpoint is
+    updated; files it lists are skipped, so an interrupted run resumes where
+    it stopped. Files already stored under
+    the current extractor (and parser) version reuse those results, as in
+    upload_cv, and files with the same bytes as one still in flight wait for
+    its results instead of being extracted again. Files are extracted
+    according to the type sniffed from their first bytes, or their extension
+    when it is not recognised. A file that fails is reported and retried on
+    the next run.
+
+    `progress(done, total)` is called after each batch. Returns a dict with
+    the counts, the failures as (file, error) pairs, the elapsed time and the
+    seconds spent in each stage (summed over workers).
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    extractor_version = get_extractor_version()
+    parser_version = get_parser_version()
+    names = find_cv_files(directory)
+    done = load_checkpoint(checkpoint_path, directory)
+    todo = [
+        _Item(name, os.path.join(directory, name)) for name in names if name not in done
+    ]
+    stats = {
+        "files": len(names),
+        "skipped": len(names) - len(todo),
+        "ingested": 0,
+        "cached": 0,
+        "failed": [],
+        "seconds": dict.fromkeys(STAGES, 0.0),
+    }
+    batch = []
+    # The file being processed for each content hash, until it is written
+    in_flight = {}
+
+    def write_batch():
+        write_started = time.perf_counter()
+        with transaction.atomic():
+            for item in batch:
+                text_hash = hash_text(item.text)
+                with open(item.path, "rb") as f:
+                    cv_doc = CVDocument.objects.create(
+                        file=File(f, name=os.path.basename(item.name)),
+                        content_hash=item.content_hash,
+                        file_type=item.file_type,
+                        extracted_text=item.text,
+                        text_hash=text_hash,
+                        extractor_version=extractor_version,
+                        parsed_data=item.parsed,
+                        parsed_text_hash=text_hash,
+                        parser_version=parser_version,
+                        parse_sources=item.sources,
+                    )
+                index_document(cv_doc)
+                if in_flight.get(item.content_hash) is item:
+                    del in_flight[item.content_hash]
+        done.update(item.name for item in batch)
+        save_checkpoint(checkpoint_path, directory, done)
+        stats["ingested"] += len(batch)
+        stats["seconds"]["write"] += time.perf_counter() - write_started
+        batch.clear()
+        if progress:
+            progress(stats["skipped"] + stats["ingested"], stats["files"])
+
+    def finish(item):
+        batch.append(item)
+        for duplicate in item.duplicates:
+            _copy_results(item, duplicate)
+            batch.append(duplicate)
+        stats["cached"] += len(item.duplicates)
+        item.duplicates = []
+        if len(batch) >= batch_size:
+            write_batch()
+
+    def fail(item, error):
+        stats["failed"] += [(i.name, error) for i in [item] + item.duplicates]
+        del in_flight[item.content_hash]
+
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as extract_pool, ThreadPoolExecutor(
+        max_workers=parse_concurrency
+    ) as parse_pool:
+        # Only a bounded number of files are in flight, so memory use does
+        # not grow with the size of the directory
+        max_in_flight = workers * 2 + parse_concurrency
+        queued = iter(todo)
+        exhausted = False
+        pending = {}
+        to_parse = []
+
+        def submit_parse(force=False):
+            while to_parse and (force or len(to_parse) >= parse_batch_size):
+                items = to_parse[:parse_batch_size]
+                del to_parse[:parse_batch_size]
+                future = parse_pool.submit(_timed_parse, [item.text for item in items])
+                pending[future] = ("parse", items)
+
+        while True:
+            while len(pending) < max_in_flight:
+                item = next(queued, None)
+                if item is None:
+                    exhausted = True
+                    break
+                hash_started = time.perf_counter()
+                with open(item.path, "rb") as f:
+                    item.file_type = sniff_file_type(f.read(SNIFF_BYTES))
+                    f.seek(0)
+                    item.content_hash = hash_uploaded_file(File(f))
+                first = in_flight.setdefault(item.content_hash, item)
+                if first is item:
+                    _lookup_cached(item, extractor_version, parser_version)
+                stats["seconds"]["hash"] += time.perf_counter() - hash_started
+                if first is not item:
+                    # Byte-identical to a file that is already being processed
+                    if first.parsed is None:
+                        first.duplicates.append(item)
+                    else:
+                        # Finished, and waiting to be written
+                        stats["cached"] += 1
+                        _copy_results(first, item)
+                        finish(item)
+                elif item.parsed is not None:
+                    stats["cached"] += 1
+                    finish(item)
+                elif item.text is not None:
+                    to_parse.append(item)
+                    submit_parse()
+                else:
+                    future = extract_pool.submit(
+                        extract_text_timed, item.path, item.file_type
+                    )
+                    pending[future] = ("extract", [item])
+            submit_parse()
+            if exhausted and not any(
+                stage == "extract" for stage, _ in pending.values()
+            ):
+                # Nothing more is coming for an incomplete parse group
+                submit_parse(force=True)
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, items = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for item in items:
+                        fail(item, e)
+                    continue
+                if stage == "extract":
+                    items[0].text, seconds = result
+                    stats["seconds"]["extract"] += seconds
+                    to_parse.append(items[0])
+                    continue
+                results, seconds = result
+                stats["seconds"]["parse"] += seconds
+                for item, parsed in zip(items, results):
+                    if isinstance(parsed, Exception):
+                        fail(item, parsed)
+                    else:
+                        item.parsed, item.sources = parsed
+                        finish(item)
+
+    if batch:
+        write_batch()
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def _copy_results(source, item):
+    item.text = source.text
+    item.parsed = source.parsed
+    item.sources = source.sources
+
+
+def _lookup_cached(item, extractor_version, parser_version):
+    """
+    Fills in the text (and parsed data) of an item from a document with the
+    same bytes, if one was already processed by the current versions.
+    """
+    cached = CVDocument.objects.with_cached_parse(
+        item.content_hash, extractor_version, parser_version
+    ).first()
+    if cached is None:
+        cached = CVDocument.objects.with_cached_text(
+            item.content_hash, extractor_version
+        ).first()
+        if cached is not None:
+            item.text = cached.extracted_text
+        return
+    item.text = cached.extracted_text
+    item.parsed = cached.parsed_data
+    item.sources = cached.parse_sources
+
+
+def _timed_parse(texts):
+    started = time.perf_counter()
+    results = parse_texts(texts)
+    return results, time.perf_counter() - started
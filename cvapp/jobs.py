@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import IngestionJob
+from .pipeline import process_document
+
+
+def enqueue_document(cv_doc):
+    """
+    Queues a stored CVDocument for extraction and parsing by the worker.
+    """
+    return IngestionJob.objects.create(document=cv_doc)
+
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running and returns it, or None if the
+    queue is empty.
+
+    The claim is a conditional UPDATE on the job's status, so when several
+    workers race for the same job only one of them gets it. This works on
+    SQLite, which has no SELECT ... FOR UPDATE.
+    """
+    while True:
+        job_id = (
+            IngestionJob.objects.filter(status=IngestionJob.QUEUED)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = IngestionJob.objects.filter(
+            pk=job_id, status=IngestionJob.QUEUED
+        ).update(
+            status=IngestionJob.RUNNING,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return IngestionJob.objects.select_related("document").get(pk=job_id)
+
+
+def run_job(job):
+    """
+    Extracts and parses the job's document and records the outcome.
+    """
+    try:
+        process_document(job.document)
+    except Exception as e:
+        job.status = IngestionJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = IngestionJob.DONE
+        job.error = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+    return job
+
+
+def requeue_stale_jobs(older_than_seconds):
+    """
+    Puts jobs that have been running for longer than `older_than_seconds` back
+    in the queue, e.g. after a worker was killed mid-job. Returns their count.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    return IngestionJob.objects.filter(
+        status=IngestionJob.RUNNING, started_at__lt=cutoff
+    ).update(status=IngestionJob.QUEUED, started_at=None)
+
+
+def latest_jobs(document_ids):
+    """
+    Returns {document_id: IngestionJob} with the most recent job of each
+    document. Documents that were never queued are left out.
+    """
+    jobs = IngestionJob.objects.filter(document_id__in=document_ids).order_by("id")
+    return {job.document_id: job for job in jobs}
@@ -0,0 +1,165 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cvapp.benchmarks import STAGES, compare, incomparable_settings, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Times each stage of the CV pipeline on the sample corpus and on "
+        "synthetic CVs, with GPT-4 replaced by a fake client, and compares the "
+        "results with a stored baseline. Fails if a stage got slower. The first "
+        "run, without a baseline, stores its results as the baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--samples",
+            default=os.path.join(settings.BASE_DIR, "data", "sample_cvs"),
+            help="Directory of sample CV files (default: data/sample_cvs).",
+        )
+        parser.add_argument(
+            "--sizes",
+            default="10,100",
+            help="Sizes of the synthetic CVs in kilobytes, comma separated.",
+        )
+        parser.add_argument(
+            "--stages",
+            default=",".join(STAGES),
+            help=f"Stages to run, comma separated (default: {','.join(STAGES)}).",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed runs per input."
+        )
+        parser.add_argument(
+            "--llm-latency",
+            type=float,
+            default=0.5,
+            help="Seconds the fake OpenAI client takes per request.",
+        )
+        parser.add_argument(
+            "--output", default=None, help="Write the results as JSON to this file."
+        )
+        parser.add_argument(
+            "--baseline",
+            default=os.path.join(settings.BASE_DIR, "benchmarks", "baseline.json"),
+            help="Results to compare with (default: benchmarks/baseline.json).",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing.",
+        )
+        parser.add_argument(
+            "--no-compare",
+            action="store_true",
+            help="Only time the stages, without comparing with a baseline.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Fraction by which a median may exceed the baseline's.",
+        )
+        parser.add_argument(
+            "--min-delta",
+            type=float,
+            default=0.005,
+            help="Slowdowns of fewer seconds than this are never regressions.",
+        )
+
+    def handle(self, *args, **options):
+        stages = [stage.strip() for stage in options["stages"].split(",")]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise CommandError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size]
+        except ValueError:
+            raise CommandError(f"Invalid sizes: {options['sizes']}")
+
+        def progress(name, result):
+            if "skipped" in result:
+                self.stdout.write(f"{name:<40} skipped: {result['skipped']}")
+            else:
+                notes = ""
+                if "found" in result:
+                    notes += f", found {', '.join(result['found']) or 'body only'}"
+                if "same_output" in result:
+                    notes += (
+                        ", same output as parse_cv"
+                        if result["same_output"]
+                        else ", output differs from parse_cv"
+                    )
+                self.stdout.write(
+                    f"{name:<40} {result['median'] * 1000:10.1f} ms "
+                    f"(min {result['min'] * 1000:.1f}, {result['items']} item(s)"
+                    f"{notes})"
+                )
+
+        current = run_benchmarks(
+            options["samples"],
+            sizes=sizes,
+            repeat=options["repeat"],
+            llm_latency=options["llm_latency"],
+            stages=stages,
+            progress=progress,
+        )
+        if options["output"]:
+            self._write(options["output"], current)
+
+        baseline_path = options["baseline"]
+        if options["save_baseline"]:
+            self._write(baseline_path, current)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline {baseline_path}"))
+            return
+        if options["no_compare"]:
+            return
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            # Timings are machine-specific, so the baseline is recorded on the
+            # machine that runs the comparison rather than shipped
+            self._write(baseline_path, current)
+            self.stdout.write(
+                self.style.WARNING(
+                    f"No baseline at {baseline_path}; saved these results as the "
+                    "baseline. Later runs are compared with it."
+                )
+            )
+            return
+
+        mismatched = incomparable_settings(current, baseline)
+        if mismatched:
+            raise CommandError(
+                f"The baseline was taken with different {', '.join(mismatched)}; "
+                "rerun with the same settings or save a new baseline."
+            )
+        rows = compare(current, baseline, options["tolerance"], options["min_delta"])
+        self.stdout.write(f"\nCompared with {baseline_path}:")
+        for row in rows:
+            if row["ratio"] is None:
+                self.stdout.write(f"  {row['name']:<40} {row['status']}")
+            else:
+                self.stdout.write(
+                    f"  {row['name']:<40} {row['baseline'] * 1000:10.1f} -> "
+                    f"{row['current'] * 1000:10.1f} ms ({row['ratio']:.2f}x) "
+                    f"{row['status']}"
+                )
+        regressions = [row["name"] for row in rows if row["status"] == "regression"]
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} stage(s) slower than the baseline: "
+                + ", ".join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def _write(self, path, results):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
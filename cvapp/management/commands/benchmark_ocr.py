@@ -0,0 +1,109 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cvapp.benchmarks import OCR_MODES, compare_ocr_engines, compare_ocr_preprocessing
+
+
+class Command(BaseCommand):
+    help = (
+        "OCRs every page of the sample PDFs with and without adaptive OCR "
+        "preprocessing (OCR_PREPROCESSING) and reports the speedup and the "
+        "change in character accuracy. With --engines, compares the per-page "
+        "latency of the OCR engines (OCR_ENGINE) instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--samples",
+            default=os.path.join(settings.BASE_DIR, "data", "sample_cvs"),
+            help="Directory of sample PDFs (default: data/sample_cvs).",
+        )
+        parser.add_argument(
+            "--ground-truth",
+            default=None,
+            help=(
+                "Directory with the correct text of each sample as <name>.txt "
+                "(default: the samples directory). Samples without one are "
+                f'compared with the "{OCR_MODES[0]}" output.'
+            ),
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Timed runs per file and mode."
+        )
+        parser.add_argument(
+            "--engines",
+            action="store_true",
+            help="Compare the per-page latency of the OCR engines.",
+        )
+        parser.add_argument(
+            "--output", default=None, help="Write the results as JSON to this file."
+        )
+
+    def handle(self, *args, **options):
+        if options["engines"]:
+            results = self._compare_engines(options)
+        else:
+            results = self._compare_preprocessing(options)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+
+    def _compare_engines(self, options):
+        def progress(name, result):
+            if "skipped" in result:
+                self.stdout.write(f"{name:<15} skipped: {result['skipped']}")
+            elif result["median"] is not None:
+                self.stdout.write(
+                    f"{name:<15} {result['median'] * 1000:8.1f} ms per page "
+                    f"(mean {result['mean'] * 1000:.1f}, first page "
+                    f"{result['first_page'] * 1000:.1f})"
+                )
+
+        try:
+            results = compare_ocr_engines(options["samples"], progress=progress)
+        except Exception as e:
+            raise CommandError(f"Could not OCR the sample PDFs: {e}")
+        if not results["pages"]:
+            raise CommandError(f"No PDF pages in {options['samples']}.")
+        baseline, *others = results["engines"]
+        for name in others:
+            speedup = results["engines"][name].get("speedup")
+            if speedup:
+                self.stdout.write(
+                    f"\n{name}: {speedup:.2f}x faster per page than {baseline} "
+                    f"over {results['pages']} page(s)"
+                )
+        return results
+
+    def _compare_preprocessing(self, options):
+        def progress(row):
+            if "skipped" in row:
+                self.stdout.write(f"{row['name']:<30} skipped: {row['skipped']}")
+                return
+            columns = "  ".join(
+                f"{mode} {row['seconds'][mode]:7.2f} s {row['accuracy'][mode]:6.1%}"
+                for mode in OCR_MODES
+            )
+            self.stdout.write(f"{row['name']:<30} {columns}  (vs {row['reference']})")
+
+        results = compare_ocr_preprocessing(
+            options["samples"],
+            ground_truth_dir=options["ground_truth"],
+            repeat=options["repeat"],
+            progress=progress,
+        )
+        summary = results["summary"]
+        if not summary:
+            raise CommandError("No sample PDF could be OCR'd.")
+        for mode in OCR_MODES[1:]:
+            self.stdout.write(
+                f"\n{mode}: {summary['speedup'][mode]:.2f}x faster than "
+                f"{OCR_MODES[0]} over {summary['files']} file(s), character "
+                f"accuracy {summary['accuracy'][mode]:.1%} "
+                f"({summary['accuracy_change'][mode]:+.1%})"
+            )
+        return results
@@ -0,0 +1,92 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cvapp.ingest import STAGES, ingest_directory
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingests every PDF, DOC and DOCX file below a directory: extracts and "
+        "parses them and stores them as CV documents. Interrupted runs resume "
+        "from a checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory to search for CV files.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processes used for text extraction (default: one per CPU).",
+        )
+        parser.add_argument(
+            "--parse-concurrency",
+            type=int,
+            default=settings.UPLOAD_CONCURRENCY,
+            help="Files parsed at the same time.",
+        )
+        parser.add_argument(
+            "--llm-batch-size",
+            type=int,
+            default=settings.LLM_PARSE_BATCH_SIZE,
+            help=(
+                "CVs parsed together; in the llm parser mode they share GPT-4 "
+                "requests (1 sends one request per CV)."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Documents written per database transaction.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=None,
+            help=(
+                "File recording the files already ingested "
+                "(default: .ingest_cvs_checkpoint.json in the directory)."
+            ),
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and ingest every file again.",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory.")
+        checkpoint = options["checkpoint"] or os.path.join(
+            directory, ".ingest_cvs_checkpoint.json"
+        )
+        if options["restart"] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        stats = ingest_directory(
+            directory,
+            checkpoint,
+            workers=options["workers"],
+            parse_concurrency=options["parse_concurrency"],
+            batch_size=options["batch_size"],
+            parse_batch_size=options["llm_batch_size"],
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} files"),
+        )
+
+        for name, error in stats["failed"]:
+            self.stderr.write(f"{name} failed: {error}")
+        processed = stats["ingested"] + len(stats["failed"])
+        rate = processed / stats["elapsed"] if stats["elapsed"] else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ingested {stats['ingested']} file(s) "
+                f"({stats['cached']} from cache), {len(stats['failed'])} failed, "
+                f"{stats['skipped']} already done, in {stats['elapsed']:.1f}s "
+                f"({rate:.2f} files/sec)"
+            )
+        )
+        for stage in STAGES:
+            self.stdout.write(f"  {stage:<8} {stats['seconds'][stage]:8.2f}s")
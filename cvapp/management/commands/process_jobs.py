@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cvapp.jobs import claim_next_job, requeue_stale_jobs, run_job
+from cvapp.models import IngestionJob
+
+
+class Command(BaseCommand):
+    help = "Processes queued CV ingestion jobs (text extraction and parsing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling for new jobs.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.INGESTION_POLL_INTERVAL,
+            help="Seconds to wait before checking an empty queue again.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(settings.INGESTION_JOB_STALE_AFTER)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+
+            started = time.perf_counter()
+            run_job(job)
+            elapsed = time.perf_counter() - started
+            if job.status == IngestionJob.DONE:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Job {job.pk}: document {job.document_id} done in {elapsed:.1f}s"
+                    )
+                )
+            else:
+                self.stderr.write(
+                    f"Job {job.pk}: document {job.document_id} failed: {job.error}"
+                )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cvapp import fulltext
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the SQLite full-text index over the extracted text of all "
+        "stored CV documents, recreating the triggers that keep it in sync if "
+        "they are missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--optimize",
+            action="store_true",
+            help="Also merge the index into a single segment for faster queries.",
+        )
+
+    def handle(self, *args, **options):
+        if not fulltext.is_available():
+            raise CommandError("Full-text search requires the SQLite database.")
+        started = time.perf_counter()
+        restored = fulltext.restore_triggers()
+        if restored:
+            self.stdout.write(f"Recreated missing trigger(s): {', '.join(restored)}")
+        count = fulltext.rebuild_index()
+        if options["optimize"]:
+            fulltext.optimize_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {count} document(s) in {time.perf_counter() - started:.2f}s"
+            )
+        )
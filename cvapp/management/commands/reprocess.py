@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cvapp.reprocess import count_stale_documents, reprocess_stale_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Brings stored CV documents up to date with the current extractor and "
+        "parser versions, running only the stages that are stale: e.g. a "
+        "prompt change re-parses the stored text without extracting it again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.UPLOAD_CONCURRENCY,
+            help="Documents extracted and parsed at the same time.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many documents are stale.",
+        )
+
+    def handle(self, *args, **options):
+        stale_text, stale_parse = count_stale_documents()
+        self.stdout.write(
+            f"{stale_text} document(s) with stale text, "
+            f"{stale_parse} with stale parsed data."
+        )
+        if options["dry_run"]:
+            return
+
+        stats = reprocess_stale_documents(
+            concurrency=max(1, options["concurrency"]),
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} documents"),
+        )
+
+        for pk, error in stats["failed"]:
+            self.stderr.write(f"Document {pk} failed: {error}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reprocessed {stats['reprocessed']} document(s), "
+                f"{len(stats['failed'])} failed, in {stats['elapsed']:.1f}s: "
+                f"{stats['extracted']} extraction(s), {stats['parsed']} parse(s), "
+                f"{stats['parses_kept']} parse(s) kept as the text did not change"
+            )
+        )
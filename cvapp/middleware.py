@@ -0,0 +1,61 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .utils import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request per view and adds a Server-Timing
+    header listing the time spent in each pipeline stage it ran (see
+    metrics.timed). Does nothing unless METRICS_ENABLED is set.
+
+    Supports both sync and async requests, so under ASGI async views are not
+    adapted to run in a thread because of it (nor the other way round).
+
+    For streaming responses the header is sent before the body, so it only
+    covers the work done before streaming started.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timings, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.record(request, response, timings, started)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timings, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.record(request, response, timings, started)
+
+    def record(self, request, response, timings, started):
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
+        metrics.observe("request_seconds", total, view=view)
+        response["Server-Timing"] = metrics.server_timing(timings, total)
+        return response
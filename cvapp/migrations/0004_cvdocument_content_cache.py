@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cvapp', '0003_cvdocument_parsed_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cvdocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='cvdocument',
+            name='extractor_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='cvdocument',
+            name='parser_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cvapp", "0006_conversation_chatmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cvdocument",
+            name="parse_sources",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+from cvapp.search import extract_terms
+
+
+def index_parsed_documents(apps, schema_editor):
+    """
+    Fills the lookup tables from the documents parsed before they existed.
+    """
+    CVDocument = apps.get_model("cvapp", "CVDocument")
+    models_by_kind = {
+        "skills": apps.get_model("cvapp", "Skill"),
+        "employers": apps.get_model("cvapp", "Employer"),
+        "institutions": apps.get_model("cvapp", "Institution"),
+    }
+    documents = CVDocument.objects.filter(parsed_data__isnull=False).only("parsed_data")
+    for cv_doc in documents.iterator():
+        terms = extract_terms(cv_doc.parsed_data)
+        for kind, model in models_by_kind.items():
+            model.objects.bulk_create(
+                [model(name=name) for name in terms[kind]], ignore_conflicts=True
+            )
+            getattr(cv_doc, kind).set(model.objects.filter(name__in=terms[kind]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cvapp", "0007_cvdocument_parse_sources"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Employer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                "ordering": ["name"],
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="Institution",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                "ordering": ["name"],
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="Skill",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                "ordering": ["name"],
+                "abstract": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="cvdocument",
+            name="employers",
+            field=models.ManyToManyField(
+                blank=True, related_name="documents", to="cvapp.employer"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cvdocument",
+            name="institutions",
+            field=models.ManyToManyField(
+                blank=True, related_name="documents", to="cvapp.institution"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cvdocument",
+            name="skills",
+            field=models.ManyToManyField(
+                blank=True, related_name="documents", to="cvapp.skill"
+            ),
+        ),
+        migrations.RunPython(index_parsed_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# An external-content FTS5 index over CVDocument.extracted_text: the index
+# stores no copy of the text, and triggers keep it in sync with every insert,
+# update and delete, including bulk updates and deletes that bypass save().
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE cvapp_cvdocument_fts USING fts5(
+        extracted_text,
+        content='cvapp_cvdocument',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER cvapp_cvdocument_fts_insert AFTER INSERT ON cvapp_cvdocument
+    BEGIN
+        INSERT INTO cvapp_cvdocument_fts(rowid, extracted_text)
+        VALUES (new.id, new.extracted_text);
+    END
+    """,
+    """
+    CREATE TRIGGER cvapp_cvdocument_fts_delete AFTER DELETE ON cvapp_cvdocument
+    BEGIN
+        INSERT INTO cvapp_cvdocument_fts(cvapp_cvdocument_fts, rowid, extracted_text)
+        VALUES ('delete', old.id, old.extracted_text);
+    END
+    """,
+    """
+    CREATE TRIGGER cvapp_cvdocument_fts_update
+    AFTER UPDATE OF extracted_text ON cvapp_cvdocument
+    BEGIN
+        INSERT INTO cvapp_cvdocument_fts(cvapp_cvdocument_fts, rowid, extracted_text)
+        VALUES ('delete', old.id, old.extracted_text);
+        INSERT INTO cvapp_cvdocument_fts(rowid, extracted_text)
+        VALUES (new.id, new.extracted_text);
+    END
+    """,
+    # Index the documents stored so far
+    "INSERT INTO cvapp_cvdocument_fts(cvapp_cvdocument_fts) VALUES ('rebuild')",
+]
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS cvapp_cvdocument_fts_update",
+    "DROP TRIGGER IF EXISTS cvapp_cvdocument_fts_delete",
+    "DROP TRIGGER IF EXISTS cvapp_cvdocument_fts_insert",
+    "DROP TABLE IF EXISTS cvapp_cvdocument_fts",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FTS5 is specific to SQLite; other databases keep working without it
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cvapp", "0008_search_terms"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
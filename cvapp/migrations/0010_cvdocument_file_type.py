@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cvapp", "0009_cvdocument_fulltext"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cvdocument",
+            name="file_type",
+            field=models.CharField(blank=True, max_length=8, null=True),
+        ),
+    ]
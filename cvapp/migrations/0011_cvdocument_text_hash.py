@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:11
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_extracted_texts(apps, schema_editor):
+    """
+    Records the hash of the text of documents extracted before it was
+    stored. Their parsed data was always parsed from that text.
+    """
+    CVDocument = apps.get_model("cvapp", "CVDocument")
+    documents = CVDocument.objects.filter(extracted_text__isnull=False).only(
+        "extracted_text", "parsed_data"
+    )
+    for cv_doc in documents.iterator():
+        cv_doc.text_hash = hashlib.sha256(
+            cv_doc.extracted_text.encode("utf-8")
+        ).hexdigest()
+        if cv_doc.parsed_data is not None:
+            cv_doc.parsed_text_hash = cv_doc.text_hash
+        cv_doc.save(update_fields=["text_hash", "parsed_text_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cvapp", "0010_cvdocument_file_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cvdocument",
+            name="parsed_text_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="cvdocument",
+            name="text_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_extracted_texts, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,56 @@
 from django.db import models
+from django.db.models import F, Q
+
+
+class CVDocumentQuerySet(models.QuerySet):
+    def with_cached_text(self, content_hash, extractor_version):
+        """
+        Documents with the same bytes whose text came from the same extractor.
+        """
+        return self.filter(
+            content_hash=content_hash,
+            extractor_version=extractor_version,
+            extracted_text__isnull=False,
+        ).order_by("-id")
+
+    def with_cached_parse(self, content_hash, extractor_version, parser_version):
+        """
+        Documents with the same bytes and text that were parsed by the same
+        parser, from that text.
+        """
+        return self.with_cached_text(content_hash, extractor_version).filter(
+            parser_version=parser_version,
+            parsed_data__isnull=False,
+            parsed_text_hash=F("text_hash"),
+        )
+
+    def with_stale_text(self, extractor_version):
+        """
+        Documents without text, or whose text came from another extractor.
+        """
+        return self.filter(
+            Q(extracted_text__isnull=True) | ~Q(extractor_version=extractor_version)
+        )
+
+    def with_stale_parse(self, parser_version):
+        """
+        Documents without parsed data, or whose parsed data came from another
+        parser or from text other than their current text.
+        """
+        return self.filter(
+            Q(parsed_data__isnull=True)
+            | ~Q(parser_version=parser_version)
+            | ~Q(parsed_text_hash=F("text_hash"))
+        )
+
+    def stale(self, extractor_version, parser_version):
+        """
+        Documents with at least one stage to run again (see with_stale_text
+        and with_stale_parse).
+        """
+        return self.with_stale_text(extractor_version) | self.with_stale_parse(
+            parser_version
+        )
 
 
 class CVDocument(models.Model):
@@ -6,6 +58,140 @@ class CVDocument(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     extracted_text = models.TextField(blank=True, null=True)
     parsed_data = models.JSONField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # "pdf", "doc" or "docx", sniffed from the content at upload; when empty
+    # the file is extracted according to its extension
+    file_type = models.CharField(max_length=8, blank=True, null=True)
+    extractor_version = models.CharField(max_length=64, blank=True, null=True)
+    parser_version = models.CharField(max_length=64, blank=True, null=True)
+    # SHA-256 of extracted_text, and of the text parsed_data was parsed from:
+    # when re-extraction changes the text they differ, and the parse is stale
+    text_hash = models.CharField(max_length=64, blank=True, null=True)
+    parsed_text_hash = models.CharField(max_length=64, blank=True, null=True)
+    # Which parser tier ("local" or "llm") produced each section of parsed_data
+    parse_sources = models.JSONField(blank=True, null=True)
+    # Lookup tables filled from parsed_data by cvapp.search.index_document
+    skills = models.ManyToManyField("Skill", related_name="documents", blank=True)
+    employers = models.ManyToManyField("Employer", related_name="documents", blank=True)
+    institutions = models.ManyToManyField(
+        "Institution", related_name="documents", blank=True
+    )
+
+    objects = CVDocumentQuerySet.as_manager()
 
     def __str__(self):
         return f"CV Document uploaded at {self.uploaded_at}"
+
+
+class SearchTerm(models.Model):
+    """
+    A value found in parsed CVs, stored once in normalized form (see
+    cvapp.search.normalize_term) and linked to every document that has it,
+    so candidates are found through indexed joins rather than by scanning
+    parsed_data.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        abstract = True
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class Skill(SearchTerm):
+    pass
+
+
+class Employer(SearchTerm):
+    pass
+
+
+class Institution(SearchTerm):
+    pass
+
+
+class IngestionJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    document = models.ForeignKey(
+        CVDocument, on_delete=models.CASCADE, related_name="ingestion_jobs"
+    )
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True
+    )
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return (
+            f"Ingestion job {self.pk} ({self.status}) for document {self.document_id}"
+        )
+
+
+class Conversation(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Running summary of the messages that are no longer sent verbatim, and
+    # how many messages (from the start) it covers
+    summary = models.TextField(blank=True, default="")
+    summarized_count = models.PositiveIntegerField(default=0)
+
+    def history(self):
+        """
+        Returns the messages as a list of {"role", "content"} dicts, oldest first.
+        """
+        return list(self.messages.values("role", "content"))
+
+    def add_exchange(self, user_message, assistant_reply):
+        """
+        Stores a question and its answer.
+        """
+        ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(
+                    conversation=self, role=ChatMessage.USER, content=user_message
+                ),
+                ChatMessage(
+                    conversation=self,
+                    role=ChatMessage.ASSISTANT,
+                    content=assistant_reply,
+                ),
+            ]
+        )
+
+    def __str__(self):
+        return f"Conversation started at {self.created_at}"
+
+
+class ChatMessage(models.Model):
+    USER = "user"
+    ASSISTANT = "assistant"
+    ROLE_CHOICES = [(USER, "User"), (ASSISTANT, "Assistant")]
+
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="messages"
+    )
+    role = models.CharField(max_length=16, choices=ROLE_CHOICES)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["conversation", "id"])]
+
+    def __str__(self):
+        return f"{self.role} message in conversation {self.conversation_id}"
@@ -0,0 +1,245 @@
+import contextvars
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .models import CVDocument
+from .search import index_document
+from .utils import metrics
+from .utils.document_parser import LOCAL_PARSER_VERSION, SECTIONS
+from .utils.llm_parser import PARSER_VERSION, parse_cv_with_gpt, parse_cvs_with_gpt
+from .utils.ocr_parser import extract_text, get_extractor_version
+from .utils.tiered_parser import parse_cv_tiered
+
+
+def hash_uploaded_file(uploaded_file):
+    """
+    Computes the SHA-256 of an uploaded file chunk by chunk, without loading
+    the whole file into memory.
+    """
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """
+    Returns the SHA-256 of extracted text, which ties parsed data to the
+    text it was parsed from (see CVDocument.text_hash).
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def process_document(cv_doc):
+    """
+    Fills in extracted_text and parsed_data for a stored CVDocument.
+
+    When another document with the same content hash was already extracted
+    (and parsed) by the current extractor (and parser) version, its results are
+    reused instead of running OCR and the GPT call again.
+    """
+    error = process_documents([cv_doc])[0]
+    if error is not None:
+        raise error
+    return cv_doc
+
+
+def process_documents(cv_docs):
+    """
+    Processes several stored CVDocuments concurrently, with at most
+    UPLOAD_CONCURRENCY files being extracted and parsed at once.
+
+    Returns one entry per document, in the same order: None if the document
+    was processed and saved, or the exception that stopped it. A failure only
+    affects its own document. Files with the same content are processed once.
+    Saved documents are indexed for candidate search (see cvapp.search).
+
+    Cache lookups and saves run on the calling thread; the worker threads only
+    run extraction and parsing, so they never need a database connection.
+    """
+    extractor_version = get_extractor_version()
+    parser_version = get_parser_version()
+
+    # Group identical files so each distinct content is only processed once
+    groups = {}
+    for cv_doc in cv_docs:
+        groups.setdefault(cv_doc.content_hash or f"pk:{cv_doc.pk}", []).append(cv_doc)
+    for group in groups.values():
+        for _ in group[1:]:
+            _record_hit("extract")
+            _record_hit("parse")
+
+    workers = max(1, min(settings.UPLOAD_CONCURRENCY, len(groups)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            # Each task runs in a copy of the request's context, so the stages
+            # it times appear in the request's Server-Timing header
+            key: executor.submit(
+                contextvars.copy_context().run,
+                _run_stages,
+                group[0].file.path,
+                group[0].file_type,
+                *_lookup_cached(group[0], extractor_version, parser_version),
+            )
+            for key, group in groups.items()
+        }
+
+    errors = {}
+    for key, group in groups.items():
+        try:
+            text, parsed, sources = futures[key].result()
+        except Exception as e:
+            for cv_doc in group:
+                errors[cv_doc.pk] = e
+            continue
+        text_hash = hash_text(text)
+        with metrics.timed("save"):
+            for cv_doc in group:
+                cv_doc.extracted_text = text
+                cv_doc.text_hash = text_hash
+                cv_doc.extractor_version = extractor_version
+                cv_doc.parsed_data = parsed
+                cv_doc.parsed_text_hash = text_hash
+                cv_doc.parser_version = parser_version
+                cv_doc.parse_sources = sources
+                cv_doc.save()
+                index_document(cv_doc)
+    return [errors.get(cv_doc.pk) for cv_doc in cv_docs]
+
+
+def get_parser_version():
+    """
+    Returns the version string stored with parsed data for the configured
+    CV_PARSER_MODE. Switching mode, or changing the threshold in tiered mode,
+    makes earlier parses stale.
+    """
+    mode = settings.CV_PARSER_MODE
+    if mode == "local":
+        return f"local-{LOCAL_PARSER_VERSION}"
+    if mode == "tiered":
+        threshold = settings.CV_PARSER_CONFIDENCE_THRESHOLD
+        return f"tiered-{LOCAL_PARSER_VERSION}-{PARSER_VERSION}-{threshold}"
+    return PARSER_VERSION
+
+
+def parse_text(text):
+    """
+    Parses extracted CV text according to CV_PARSER_MODE and returns
+    (parsed, sources).
+
+    - "llm": GPT-4 parses the whole CV.
+    - "local": only the rule-based parser runs; no network call is made.
+    - "tiered": the rule-based parser runs first and GPT-4 is asked only for
+      the sections scoring below CV_PARSER_CONFIDENCE_THRESHOLD.
+    """
+    mode = settings.CV_PARSER_MODE
+    if mode == "local":
+        return parse_cv_tiered(text)
+    if mode == "tiered":
+        return parse_cv_tiered(
+            text, parse_cv_with_gpt, settings.CV_PARSER_CONFIDENCE_THRESHOLD
+        )
+    return parse_cv_with_gpt(text), dict.fromkeys(SECTIONS, "llm")
+
+
+def parse_texts(texts):
+    """
+    Parses several extracted CV texts, like parse_text, and returns one entry
+    per text: (parsed, sources), or the exception that stopped it.
+
+    In "llm" mode the texts are packed into batched GPT-4 requests; the other
+    modes parse each text on its own, since their GPT-4 requests (if any) ask
+    for different sections of each CV.
+    """
+    if settings.CV_PARSER_MODE in ("local", "tiered"):
+        results = []
+        for text in texts:
+            try:
+                results.append(parse_text(text))
+            except Exception as e:
+                results.append(e)
+        return results
+    return [
+        (
+            result
+            if isinstance(result, Exception)
+            else (result, dict.fromkeys(SECTIONS, "llm"))
+        )
+        for result in parse_cvs_with_gpt(texts)
+    ]
+
+
+def _lookup_cached(cv_doc, extractor_version, parser_version):
+    """
+    Returns (text, parsed, sources) from an earlier upload of the same bytes.
+    Text or parsed data is None when it has to be computed.
+    """
+    if not cv_doc.content_hash:
+        return None, None, None
+    others = CVDocument.objects.exclude(pk=cv_doc.pk)
+
+    cached = others.with_cached_parse(
+        cv_doc.content_hash, extractor_version, parser_version
+    ).first()
+    if cached:
+        _record_hit("extract")
+        _record_hit("parse")
+        return cached.extracted_text, cached.parsed_data, cached.parse_sources
+
+    cached = others.with_cached_text(cv_doc.content_hash, extractor_version).first()
+    if cached:
+        _record_hit("extract")
+        return cached.extracted_text, None, None
+    return None, None, None
+
+
+def _run_stages(file_path, file_type, text, parsed, sources):
+    """
+    Extracts and/or parses whatever the cache could not provide.
+    """
+    if text is None:
+        started = time.perf_counter()
+        text = extract_text(file_path, file_type)
+        _record_miss("extract", time.perf_counter() - started)
+    if parsed is None:
+        started = time.perf_counter()
+        parsed, sources = parse_text(text)
+        _record_miss("parse", time.perf_counter() - started)
+    return text, parsed, sources
+
+
+def cache_stats():
+    """
+    Summarises the document cache counters per stage ("extract" and "parse").
+
+    Saved time is estimated from the average duration of the misses, i.e. what
+    each hit would have cost had it been computed.
+    """
+    stats = {}
+    for stage in ("extract", "parse"):
+        hits = metrics.get(f"document_cache_{stage}_hits")
+        misses = metrics.get(f"document_cache_{stage}_misses")
+        miss_seconds = metrics.get(f"document_cache_{stage}_miss_seconds")
+        average = miss_seconds / misses if misses else 0.0
+        stats[stage] = {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "miss_seconds": miss_seconds,
+            "estimated_saved_seconds": hits * average,
+        }
+    return stats
+
+
+def _record_hit(stage):
+    metrics.incr(f"document_cache_{stage}_hits")
+
+
+def _record_miss(stage, seconds):
+    metrics.incr(f"document_cache_{stage}_misses")
+    metrics.incr(f"document_cache_{stage}_miss_seconds", seconds)
+    metrics.record_stage(stage, seconds)
@@ -0,0 +1,182 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.db import transaction
+
+from .models import CVDocument
+from .pipeline import get_parser_version, hash_text, parse_text
+from .search import index_document
+from .utils.ocr_parser import extract_text, get_extractor_version
+
+
+def count_stale_documents():
+    """
+    Returns how many documents have stale text and stale parsed data under
+    the current extractor and parser versions, as (text, parse). A document
+    with stale text may also need parsing again once it is re-extracted.
+    """
+    documents = CVDocument.objects.all()
+    return (
+        documents.with_stale_text(get_extractor_version()).count(),
+        documents.with_stale_parse(get_parser_version()).count(),
+    )
+
+
+def reprocess_stale_documents(concurrency=4, progress=None):
+    """
+    Brings every stale document (see CVDocumentQuerySet.stale) up to date by
+    running only the stages that are out of date.
+
+    Text is extracted again only when it came from another extractor version.
+    Parsing depends on the text: it runs again when the parser version changed,
+    or when re-extraction changed the text, so re-extracting a document whose
+    text comes out the same keeps its parsed data. Documents with the same
+    content are processed once, and results already computed for the same
+    bytes by the current versions are reused.
+
+    Up to `concurrency` documents are extracted and parsed at once; database
+    reads and writes stay on the calling thread. `progress(done, total)` is
+    called as documents finish. Returns a dict with the counts of documents,
+    of extraction and parse runs, of parses kept because the text did not
+    change, the failures as (document id, error) pairs and the elapsed time.
+    """
+    started = time.perf_counter()
+    extractor_version = get_extractor_version()
+    parser_version = get_parser_version()
+
+    # Only ids are loaded up front, so memory use does not grow with the
+    # number of stale documents
+    groups = {}
+    stale = CVDocument.objects.stale(extractor_version, parser_version)
+    for pk, content_hash in stale.order_by("pk").values_list("pk", "content_hash"):
+        groups.setdefault(content_hash or f"pk:{pk}", []).append(pk)
+    stats = {
+        "documents": sum(len(pks) for pks in groups.values()),
+        "reprocessed": 0,
+        "extracted": 0,
+        "parsed": 0,
+        "parses_kept": 0,
+        "failed": [],
+    }
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        queued = iter(groups.values())
+        pending = {}
+        while True:
+            while len(pending) < concurrency:
+                pks = next(queued, None)
+                if pks is None:
+                    break
+                cv_docs = list(CVDocument.objects.filter(pk__in=pks).order_by("pk"))
+                text, parses = _current_results(
+                    cv_docs, extractor_version, parser_version
+                )
+                future = executor.submit(
+                    _run_stale_stages,
+                    cv_docs[0].file.path,
+                    cv_docs[0].file_type,
+                    text,
+                    parses,
+                )
+                pending[future] = cv_docs
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                cv_docs = pending.pop(future)
+                try:
+                    text, text_hash, parsed, sources, stages = future.result()
+                except Exception as e:
+                    stats["failed"] += [(cv_doc.pk, e) for cv_doc in cv_docs]
+                else:
+                    results = (text, text_hash, parsed, sources)
+                    _save(cv_docs, extractor_version, parser_version, *results)
+                    stats["reprocessed"] += len(cv_docs)
+                    if "extract" in stages:
+                        stats["extracted"] += 1
+                        if "parse" not in stages:
+                            stats["parses_kept"] += 1
+                    if "parse" in stages:
+                        stats["parsed"] += 1
+                if progress:
+                    progress(
+                        stats["reprocessed"] + len(stats["failed"]),
+                        stats["documents"],
+                    )
+
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def _current_results(cv_docs, extractor_version, parser_version):
+    """
+    Returns what is still current for a group of documents with the same
+    content: their text, or None if it has to be extracted again, and a dict
+    mapping text hashes to the (parsed, sources) produced from that text by
+    the current parser.
+    """
+    candidates = list(cv_docs)
+    content_hash = cv_docs[0].content_hash
+    if content_hash:
+        others = CVDocument.objects.exclude(pk__in=[cv_doc.pk for cv_doc in cv_docs])
+        candidates += [
+            others.with_cached_parse(
+                content_hash, extractor_version, parser_version
+            ).first(),
+            others.with_cached_text(content_hash, extractor_version).first(),
+        ]
+
+    text = None
+    parses = {}
+    for cv_doc in filter(None, candidates):
+        if (
+            text is None
+            and cv_doc.extracted_text is not None
+            and cv_doc.extractor_version == extractor_version
+        ):
+            text = cv_doc.extracted_text
+        if (
+            cv_doc.parsed_data is not None
+            and cv_doc.parser_version == parser_version
+            and cv_doc.parsed_text_hash
+        ):
+            parses.setdefault(
+                cv_doc.parsed_text_hash, (cv_doc.parsed_data, cv_doc.parse_sources)
+            )
+    return text, parses
+
+
+def _run_stale_stages(file_path, file_type, text, parses):
+    """
+    Extracts the text if it is None, then parses it unless `parses` (see
+    _current_results) already has a parse of that exact text. Returns (text,
+    text hash, parsed, sources, names of the stages that ran).
+    """
+    stages = []
+    if text is None:
+        text = extract_text(file_path, file_type)
+        stages.append("extract")
+    text_hash = hash_text(text)
+    if text_hash in parses:
+        parsed, sources = parses[text_hash]
+    else:
+        parsed, sources = parse_text(text)
+        stages.append("parse")
+    return text, text_hash, parsed, sources, stages
+
+
+def _save(cv_docs, extractor_version, parser_version, text, text_hash, parsed, sources):
+    with transaction.atomic():
+        for cv_doc in cv_docs:
+            parsed_changed = cv_doc.parsed_data != parsed
+            cv_doc.extracted_text = text
+            cv_doc.text_hash = text_hash
+            cv_doc.extractor_version = extractor_version
+            cv_doc.parsed_data = parsed
+            cv_doc.parsed_text_hash = text_hash
+            cv_doc.parser_version = parser_version
+            cv_doc.parse_sources = sources
+            cv_doc.save()
+            if parsed_changed:
+                index_document(cv_doc)
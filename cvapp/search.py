@@ -0,0 +1,132 @@
+import re
+
+from django.db import transaction
+
+from .models import CVDocument, Employer, Institution, Skill
+
+# Lookup table of each kind of search term
+TERM_MODELS = {"skills": Skill, "employers": Employer, "institutions": Institution}
+# Longer values are sentences rather than a skill or a name
+MAX_TERM_CHARS = 100
+
+# Keys GPT-4 uses for the employer or institution of a structured entry
+EMPLOYER_KEYS = ("company", "employer", "organization", "organisation")
+INSTITUTION_KEYS = ("institution", "university", "school", "college")
+SKILL_KEYS = ("name", "skill")
+# "Backend Developer at Acme Ltd: ..." names the employer after "at"
+EMPLOYER_AT_PATTERN = re.compile(r"\bat\s+([^,:;|()]+)")
+INSTITUTION_PATTERN = re.compile(
+    r"\b(?:university|college|school|institute|academy|polytechnic)\b",
+    re.IGNORECASE,
+)
+YEAR_PATTERN = re.compile(r"\b\d{4}\b")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_term(value):
+    """
+    Returns the form a term is stored and searched in: lower-cased, with
+    whitespace collapsed and surrounding punctuation removed. Values that are
+    too long to be a term normalize to "".
+    """
+    term = WHITESPACE_PATTERN.sub(" ", str(value)).strip(" .,;:-").lower()
+    return term if len(term) <= MAX_TERM_CHARS else ""
+
+
+def extract_terms(parsed):
+    """
+    Returns the skills, employers and institutions found in parsed CV data,
+    as a dict of sets of normalized terms.
+
+    Entries may be plain strings (the rule-based parser, and usually GPT-4)
+    or objects. For strings the employer is taken from "<role> at <employer>"
+    or the second of "<role>, <employer>, <years>", and the institution is the
+    comma-separated part naming a university, college or school. This is a
+    best effort: entries that do not follow these forms are not indexed.
+    """
+    if not isinstance(parsed, dict):
+        parsed = {}
+    values = {
+        "skills": [
+            _entry_value(entry, SKILL_KEYS) for entry in _entries(parsed, "skills")
+        ],
+        "employers": [
+            _employer(entry) for entry in _entries(parsed, "work_experience")
+        ],
+        "institutions": [
+            _institution(entry) for entry in _entries(parsed, "education")
+        ],
+    }
+    return {
+        kind: {normalize_term(value) for value in found if value} - {""}
+        for kind, found in values.items()
+    }
+
+
+def _entries(parsed, section):
+    entries = parsed.get(section)
+    return entries if isinstance(entries, list) else []
+
+
+def _entry_value(entry, keys):
+    if isinstance(entry, dict):
+        for key in keys:
+            if isinstance(entry.get(key), str):
+                return entry[key]
+        return None
+    return entry if isinstance(entry, str) else None
+
+
+def _employer(entry):
+    if not isinstance(entry, str):
+        return _entry_value(entry, EMPLOYER_KEYS)
+    match = EMPLOYER_AT_PATTERN.search(entry)
+    if match:
+        return match.group(1)
+    parts = entry.split(",")
+    if len(parts) >= 2 and not YEAR_PATTERN.search(parts[1]):
+        return parts[1]
+    return None
+
+
+def _institution(entry):
+    if not isinstance(entry, str):
+        return _entry_value(entry, INSTITUTION_KEYS)
+    for part in entry.split(","):
+        if INSTITUTION_PATTERN.search(part):
+            return part
+    return None
+
+
+def index_document(cv_doc):
+    """
+    Links a document to the skills, employers and institutions in its
+    parsed_data, creating the terms that are new and replacing any links
+    from an earlier parse.
+    """
+    terms = extract_terms(cv_doc.parsed_data)
+    with transaction.atomic():
+        for kind, model in TERM_MODELS.items():
+            names = terms[kind]
+            model.objects.bulk_create(
+                [model(name=name) for name in names], ignore_conflicts=True
+            )
+            getattr(cv_doc, kind).set(model.objects.filter(name__in=names))
+
+
+def search_documents(skills=(), employers=(), institutions=()):
+    """
+    Returns the documents that have every one of the given skills, employers
+    and institutions, newest first. Each term is one join on an indexed
+    lookup table, so the cost grows with the number of matches rather than
+    the number of documents.
+    """
+    documents = CVDocument.objects.all()
+    for kind, values in (
+        ("skills", skills),
+        ("employers", employers),
+        ("institutions", institutions),
+    ):
+        for term in filter(None, map(normalize_term, values)):
+            documents = documents.filter(**{f"{kind}__name": term})
+    return documents.order_by("-id")
@@ -1,12 +1,125 @@
+import functools
+import hashlib
+import io
 import json
+import multiprocessing
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.messages import get_messages
+from django.core.cache import caches
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, TestCase, override_settings
 from django.urls import reverse
+from docx import Document
+from docx.oxml import parse_xml
+from lxml import etree
+from PIL import Image, ImageDraw
 
+from . import fulltext
+from .benchmarks import character_accuracy, compare, make_text_pdf
 from .forms import CVDocumentForm
-from .models import CVDocument
+from .fulltext import search_text, to_match_query
+from .ingest import load_checkpoint, save_checkpoint
+from .jobs import claim_next_job
+from .middleware import MetricsMiddleware
+from .models import ChatMessage, Conversation, CVDocument, IngestionJob
+from .pipeline import cache_stats, process_documents
+from .search import extract_terms, index_document
+from .uploads import OLE2_MAGIC, ZIP_MAGIC, sniff_file_type
+from .utils import metrics
+from .utils.doc_extraction import (
+    DOC_EXTRACTORS,
+    DocExtractionFailed,
+    DocExtractionPool,
+    DocExtractionTimeout,
+    shutdown_doc_pool,
+)
+from .utils.doc_text import extract_doc_text
+from .utils.docx_text import iter_part_lines
+from .utils.document_parser import (
+    LOCAL_PARSER_VERSION,
+    parse_cv,
+    score_sections,
+    segment_sections,
+)
+from .utils.gpt_chatbot import query_chatbot
+from .utils.history import count_tokens, prepare_history
+from .utils.llm_parser import is_valid_parse, parse_cvs_with_gpt
+from .utils.ocr_engines import (
+    PytesseractEngine,
+    TesserocrEngine,
+    get_engine,
+    resolve_engine_name,
+)
+from .utils.ocr_parser import (
+    extract_text_from_doc,
+    extract_text_from_docx,
+    extract_text_from_pdf,
+    get_extractor_version,
+    get_ocr_pool,
+    is_usable_text,
+    ocr_pdf_pages,
+    shutdown_ocr_pool,
+    split_page_ranges,
+)
+from .utils.ocr_preprocessing import (
+    PSM_AUTO,
+    PSM_SINGLE_COLUMN,
+    PSM_SPARSE_TEXT,
+    binarize,
+    otsu_threshold,
+    plan_page,
+)
+from .utils.response_cache import cache_stats as chatbot_cache_stats
+from .utils.response_cache import normalize_question
+from .utils.retrieval import BM25Index, build_context, chunk_text, tokenize
+
+
+class MediaRootMixin:
+    """
+    Stores the files of each test in a temporary MEDIA_ROOT, removed
+    afterwards, and uploads files through the upload_cv view.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, *files, client=None):
+        """
+        Posts `files` to upload_cv in one request and returns the response.
+        Each file is an uploaded file, a (name, content) pair, or a name, for
+        which a small PDF with the name in its bytes is made.
+        """
+        uploads = []
+        for file in files:
+            if isinstance(file, str):
+                file = (file, b"%PDF-1.4 " + file.encode())
+            if isinstance(file, tuple):
+                file = SimpleUploadedFile(*file)
+            uploads.append(file)
+        return (client or self.client).post(reverse("upload_cv"), {"file": uploads})
 
 
 class TestCVViews(TestCase):
@@ -34,18 +147,22 @@ class TestCVViews(TestCase):
 
     def test_cv_summary(self):
         """
-        The cv_summary view should retrieve the parsed CV data from the session,
-        process it (pretty-print JSON), and pass it to the template.
+        The cv_summary view should load the parsed CV data of the documents
+        referenced by the session, process it (pretty-print JSON), and pass it
+        to the template.
         """
-        dummy_parsed_data = [{"dummy": "data"}]
+        cv_doc = CVDocument.objects.create(
+            file="dummy.pdf", parsed_data={"dummy": "data"}
+        )
         session = self.client.session
-        session["cv_parsed_data"] = dummy_parsed_data
+        session["cv_document_ids"] = [cv_doc.pk]
         session.save()
 
         response = self.client.get(reverse("cv_summary"))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "cvapp/cv_summary.html")
         self.assertIn("cv_parsed_data", response.context)
+        self.assertEqual(len(response.context["cv_parsed_data"]), 1)
         for entry in response.context["cv_parsed_data"]:
             self.assertIn("raw", entry)
             self.assertIn("pretty_json", entry)
@@ -55,13 +172,19 @@ class TestCVViews(TestCase):
 
     def test_clear_chat(self):
         """Calling clear_chat should empty the conversation history and redirect to the chatbot."""
+        conversation = Conversation.objects.create()
+        conversation.add_exchange("hello", "hi")
         session = self.client.session
-        session["conversation_history"] = [{"role": "user", "content": "hello"}]
+        session["conversation_id"] = conversation.pk
         session.save()
         response = self.client.get(reverse("clear_chat"))
         self.assertRedirects(response, reverse("chatbot"))
         session = self.client.session
-        self.assertEqual(session.get("conversation_history"), [])
+        self.assertIsNone(session.get("conversation_id"))
+        self.assertFalse(ChatMessage.objects.exists())
+        self.assertEqual(
+            self.client.get(reverse("chatbot")).context["conversation"], []
+        )
 
     def test_upload_success(self):
         """The upload_success view should render its template."""
@@ -98,3 +221,2236 @@ class TestCVDocumentForm(TestCase):
         )
         form = CVDocumentForm(data={}, files={"file": [file1, file2]})
         self.assertTrue(form.is_valid())
+
+
+class TestDocumentCache(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        metrics.reset()
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={"skills": ["Python"]})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="Jane Doe\nSkills: Python")
+    def test_identical_upload_reuses_text_and_parse(self, mock_extract, mock_parse):
+        """A re-uploaded file should skip both extraction and parsing."""
+        self.assertRedirects(self.upload("cv.pdf"), reverse("cv_summary"))
+        self.assertRedirects(self.upload("cv.pdf"), reverse("cv_summary"))
+
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(mock_parse.call_count, 1)
+        first, second = CVDocument.objects.order_by("id")
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(second.extracted_text, "Jane Doe\nSkills: Python")
+        self.assertEqual(second.parsed_data, {"skills": ["Python"]})
+
+        stats = cache_stats()
+        self.assertEqual(stats["extract"]["hits"], 1)
+        self.assertEqual(stats["extract"]["misses"], 1)
+        self.assertEqual(stats["parse"]["hits"], 1)
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={"skills": []})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="text")
+    def test_different_bytes_are_not_shared(self, mock_extract, mock_parse):
+        self.upload(("cv.pdf", b"%PDF-1.4 first file"))
+        self.upload(("cv.pdf", b"%PDF-1.4 second file"))
+        self.assertEqual(mock_extract.call_count, 2)
+        self.assertEqual(mock_parse.call_count, 2)
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={"skills": []})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="text")
+    def test_parser_version_change_reparses_without_reextracting(
+        self, mock_extract, mock_parse
+    ):
+        self.upload("cv.pdf")
+        with mock.patch("cvapp.pipeline.PARSER_VERSION", "gpt-4-next"):
+            self.upload("cv.pdf")
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(mock_parse.call_count, 2)
+        self.assertEqual(
+            CVDocument.objects.order_by("id").last().parser_version, "gpt-4-next"
+        )
+
+
+WELL_FORMATTED_CV = """Jane Doe
+jane.doe@example.com
+555-123-4567
+
+Education
+BSc Computer Science, University of Leeds
+
+Work Experience
+Backend Developer, Acme Ltd, 2019-2024
+
+Skills
+Python, Django, PostgreSQL
+"""
+
+
+class TestDocumentParser(TestCase):
+    def test_well_formatted_cv(self):
+        self.assertEqual(
+            parse_cv(WELL_FORMATTED_CV),
+            {
+                "personal_info": {
+                    "emails": ["jane.doe@example.com"],
+                    "phones": ["5551234567"],
+                    "name": "Jane Doe",
+                },
+                "education": ["BSc Computer Science, University of Leeds"],
+                "work_experience": ["Backend Developer, Acme Ltd, 2019-2024"],
+                "skills": ["Python", "Django", "PostgreSQL"],
+                "projects": [],
+                "certifications": [],
+            },
+        )
+
+    def test_headings_are_matched_as_before(self):
+        """Headings match anywhere and case-insensitively; content starts right after them."""
+        text = "  \n I have EXPERIENCE in\nbanking\n\nWork Experience\nAcme\n\nSkills: Go,\n  Rust"
+        parsed = parse_cv(text)
+        self.assertEqual(parsed["personal_info"]["name"], "I have EXPERIENCE in")
+        self.assertEqual(parsed["work_experience"], ["in", "banking"])
+        self.assertEqual(parsed["skills"], [": Go", "Rust"])
+
+    def test_synonyms_are_used_when_the_usual_heading_is_missing(self):
+        text = "Jane\n\nEmployment History\nAcme\n\nCore Competencies\nGo, SQL\n\nAcademics\nBSc"
+        parsed = parse_cv(text)
+        self.assertEqual(parsed["work_experience"], ["Acme"])
+        self.assertEqual(parsed["skills"], ["Go", "SQL"])
+        self.assertEqual(parsed["education"], ["BSc"])
+
+        # Synonyms in running text, or next to a usual heading, are ignored
+        text = "Seeking employment.\n\nPortfolio\nSite\n\nProjects\nCV analyzer"
+        self.assertEqual(parse_cv(text)["work_experience"], [])
+        self.assertEqual(parse_cv(text)["projects"], ["CV analyzer"])
+        self.assertEqual(set(segment_sections(text)), {"projects"})
+
+
+class TestTieredParsing(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def upload_document(self):
+        self.upload("cv.pdf")
+        return CVDocument.objects.order_by("id").last()
+
+    def test_well_formatted_cv_scores_high_everywhere(self):
+        scores = score_sections(WELL_FORMATTED_CV, parse_cv(WELL_FORMATTED_CV))
+        self.assertTrue(all(score == 1.0 for score in scores.values()), scores)
+
+    def test_unknown_headings_and_inline_matches_score_low(self):
+        text = (
+            "CURRICULUM VITAE\nI have experience in Python.\n\nEmployment History\nAcme"
+        )
+        scores = score_sections(text, parse_cv(text))
+        self.assertEqual(scores["personal_info"], 0.0)
+        self.assertEqual(scores["work_experience"], 0.2)
+        self.assertEqual(scores["education"], 0.0)
+        self.assertEqual(scores["certifications"], 1.0)
+
+    @override_settings(CV_PARSER_MODE="tiered")
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt")
+    @mock.patch("cvapp.pipeline.extract_text", return_value=WELL_FORMATTED_CV)
+    def test_confident_cv_is_parsed_without_llm(self, mock_extract, mock_parse):
+        cv_doc = self.upload_document()
+        mock_parse.assert_not_called()
+        self.assertEqual(cv_doc.parsed_data["personal_info"]["name"], "Jane Doe")
+        self.assertEqual(
+            cv_doc.parsed_data["skills"], ["Python", "Django", "PostgreSQL"]
+        )
+        self.assertEqual(set(cv_doc.parse_sources.values()), {"local"})
+
+    @override_settings(CV_PARSER_MODE="tiered")
+    @mock.patch(
+        "cvapp.pipeline.parse_cv_with_gpt",
+        return_value={"skills": ["Go"], "education": ["MSc"]},
+    )
+    @mock.patch("cvapp.pipeline.extract_text")
+    def test_only_weak_sections_are_sent_to_llm(self, mock_extract, mock_parse):
+        mock_extract.return_value = WELL_FORMATTED_CV.replace("Skills\n", "Tech: ")
+        cv_doc = self.upload_document()
+
+        mock_parse.assert_called_once_with(
+            mock_extract.return_value, sections=["skills"]
+        )
+        self.assertEqual(cv_doc.parsed_data["skills"], ["Go"])
+        self.assertEqual(
+            cv_doc.parsed_data["education"][0],
+            "BSc Computer Science, University of Leeds",
+        )
+        self.assertEqual(cv_doc.parse_sources["skills"], "llm")
+        self.assertEqual(cv_doc.parse_sources["education"], "local")
+
+    @override_settings(CV_PARSER_MODE="tiered")
+    @mock.patch(
+        "cvapp.pipeline.parse_cv_with_gpt",
+        return_value={
+            "personal_info": ["Jane Doe"],
+            "work_experience": ["Engineer at Acme"],
+            "skills": "Go, Rust",
+        },
+    )
+    @mock.patch("cvapp.pipeline.extract_text")
+    def test_malformed_llm_sections_keep_the_local_value(
+        self, mock_extract, mock_parse
+    ):
+        mock_extract.return_value = "CURRICULUM VITAE\nTech: Go\n\nSkills\nPython"
+        local = parse_cv(mock_extract.return_value)
+        cv_doc = self.upload_document()
+
+        self.assertEqual(
+            mock_parse.call_args.kwargs["sections"],
+            ["personal_info", "education", "work_experience"],
+        )
+        # A list where an object belongs, and a section that was not asked for
+        self.assertEqual(cv_doc.parsed_data["personal_info"], local["personal_info"])
+        self.assertEqual(cv_doc.parsed_data["skills"], ["Python"])
+        # A section missing from the reply is not replaced with null
+        self.assertEqual(cv_doc.parsed_data["education"], [])
+        self.assertEqual(cv_doc.parsed_data["work_experience"], ["Engineer at Acme"])
+        sources = cv_doc.parse_sources
+        self.assertEqual(
+            [section for section in sources if sources[section] == "llm"],
+            ["work_experience"],
+        )
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={"skills": []})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="Tech: Go")
+    def test_parser_mode_is_part_of_the_parser_version(self, mock_extract, mock_parse):
+        llm_doc = self.upload_document()
+        with override_settings(CV_PARSER_MODE="local"):
+            local_doc = self.upload_document()
+
+        mock_parse.assert_called_once()
+        self.assertEqual(llm_doc.parse_sources["skills"], "llm")
+        self.assertEqual(local_doc.parser_version, f"local-{LOCAL_PARSER_VERSION}")
+        self.assertEqual(local_doc.parse_sources["skills"], "local")
+
+
+TEXT_BOX_XML = """
+<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+     xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006">
+  <w:r><w:t xml:space="preserve">Anchored </w:t></w:r>
+  <w:r><mc:AlternateContent>
+    <mc:Choice Requires="wps"><w:drawing><w:txbxContent>
+      <w:p><w:r><w:t>jane.doe@example.com</w:t></w:r></w:p>
+    </w:txbxContent></w:drawing></mc:Choice>
+    <mc:Fallback><w:pict><w:txbxContent>
+      <w:p><w:r><w:t>jane.doe@example.com</w:t></w:r></w:p>
+    </w:txbxContent></w:pict></mc:Fallback>
+  </mc:AlternateContent></w:r>
+  <w:r><w:t>paragraph</w:t></w:r>
+</w:p>
+"""
+
+
+class TestDocxExtraction(TestCase):
+    def save(self, document):
+        handle = tempfile.NamedTemporaryFile(suffix=".docx", delete=False)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        document.save(handle.name)
+        return handle.name
+
+    def test_tables_text_boxes_headers_and_footers_in_order(self):
+        document = Document()
+        document.sections[0].header.paragraphs[0].text = "Jane Doe"
+        document.sections[0].footer.paragraphs[0].text = "References on request"
+        document.add_paragraph("Work Experience")
+        paragraph = document.add_paragraph("Engineer, Acme Ltd")
+        paragraph.add_run().add_tab()
+        paragraph.add_run("2019-2024")
+        document.add_paragraph("")
+        table = document.add_table(rows=2, cols=2)
+        table.cell(0, 0).text = "Skills"
+        table.cell(0, 1).text = "Python, Go"
+        table.cell(1, 0).text = "Languages"
+        table.cell(1, 1).text = "English"
+        table.cell(1, 1).add_paragraph("French")
+        body = document.element.body
+        body.insert(len(body) - 1, parse_xml(TEXT_BOX_XML))
+
+        self.assertEqual(
+            extract_text_from_docx(self.save(document)).split("\n"),
+            [
+                "Jane Doe",
+                "Work Experience",
+                "Engineer, Acme Ltd\t2019-2024",
+                "",
+                "Skills\tPython, Go",
+                "Languages",
+                "English",
+                "French",
+                "jane.doe@example.com",
+                "Anchored paragraph",
+                "References on request",
+            ],
+        )
+
+    def test_headers_repeated_across_sections_are_included_once(self):
+        document = Document()
+        document.add_paragraph("Page one")
+        document.add_section()
+        document.add_paragraph("Page two")
+        for section in document.sections:
+            section.header.is_linked_to_previous = False
+            section.header.paragraphs[0].text = "Jane Doe"
+        text = extract_text_from_docx(self.save(document))
+        self.assertEqual(text.split("\n"), ["Jane Doe", "Page one", "", "Page two"])
+
+    def test_rows_are_freed_as_soon_as_they_are_emitted(self):
+        rows = "".join(
+            f"<w:tr><w:tc><w:p><w:r><w:t>Skill {index}</w:t></w:r></w:p></w:tc></w:tr>"
+            for index in range(500)
+        )
+        part = (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/'
+            f'wordprocessingml/2006/main"><w:body><w:tbl>{rows}</w:tbl>'
+            "</w:body></w:document>"
+        ).encode()
+        parse = etree.iterparse
+        parsed = []
+
+        def iterparse(*args, **kwargs):
+            for event, element in parse(*args, **kwargs):
+                parsed.append(element)
+                yield event, element
+
+        # The parser reads ahead, so only rows before the one just emitted
+        # (the last element handled) are counted
+        kept = []
+        with mock.patch("cvapp.utils.docx_text.etree.iterparse", iterparse):
+            for line in iter_part_lines(io.BytesIO(part)):
+                kept.append(len(list(parsed[-1].itersiblings(preceding=True))))
+        self.assertEqual(len(kept), 500)
+        self.assertEqual(max(kept), 0)
+
+    def test_invalid_file(self):
+        with tempfile.NamedTemporaryFile(suffix=".docx") as handle:
+            handle.write(b"PK\x03\x04 truncated")
+            handle.flush()
+            with self.assertRaisesRegex(Exception, "Error processing DOCX"):
+                extract_text_from_docx(handle.name)
+
+
+def compound_file(streams):
+    """
+    Builds an OLE2 compound file holding `streams` (name -> bytes, at most
+    three), as olefile reads it. Streams are padded with zeros to 4096 bytes,
+    as smaller ones would have to be stored in the mini stream.
+    """
+    end_of_chain, free, no_stream = 0xFFFFFFFE, 0xFFFFFFFF, 0xFFFFFFFF
+    fat = [0xFFFFFFFD, end_of_chain]  # the FAT sector, then the directory
+    directory = b""
+    data = b""
+    names = list(streams)
+    for index, name in enumerate(names, start=1):
+        content = streams[name].ljust(4096, b"\0")
+        first = len(fat)
+        sectors = len(content) // 512
+        fat += list(range(first + 1, first + sectors)) + [end_of_chain]
+        sibling = index + 1 if index < len(names) else no_stream
+        encoded = (name + "\0").encode("utf-16-le")
+        directory += struct.pack(
+            "<64sHBBIII16sIQQIQ",
+            encoded,
+            len(encoded),
+            2,
+            1,
+            no_stream,
+            sibling,
+            no_stream,
+            b"",
+            0,
+            0,
+            0,
+            first,
+            len(content),
+        )
+        data += content
+    root = struct.pack(
+        "<64sHBBIII16sIQQIQ",
+        "Root Entry\0".encode("utf-16-le"),
+        22,
+        5,
+        1,
+        no_stream,
+        no_stream,
+        1,
+        b"",
+        0,
+        0,
+        0,
+        end_of_chain,
+        0,
+    )
+    directory = (root + directory).ljust(512, b"\0")
+    header = struct.pack(
+        "<8s16sHHHHH6sIIIIIIIII",
+        OLE2_MAGIC,
+        b"",
+        0x3E,
+        3,
+        0xFFFE,
+        9,
+        6,
+        b"",
+        0,
+        1,  # FAT sectors
+        1,  # first directory sector
+        0,
+        4096,
+        end_of_chain,
+        0,
+        end_of_chain,
+        0,
+    ) + struct.pack("<109I", 0, *[free] * 108)
+    fat = struct.pack("<128I", *fat, *[free] * (128 - len(fat)))
+    return header + fat + directory + data
+
+
+def word_document(pieces):
+    """
+    Builds a minimal .doc file whose text is made of `pieces`, each stored as
+    8-bit text when cp1252 can encode it and as UTF-16 otherwise.
+    """
+    stream = bytearray(0x800)
+    boundaries = [0]
+    descriptors = b""
+    for piece in pieces:
+        try:
+            encoded = piece.encode("cp1252")
+            offset = len(stream) * 2 | 0x40000000
+        except UnicodeEncodeError:
+            encoded = piece.encode("utf-16-le")
+            offset = len(stream)
+        descriptors += struct.pack("<HIH", 0, offset, 0)
+        stream += encoded + b"\0" * (len(encoded) % 2)
+        boundaries.append(boundaries[-1] + len(piece))
+    plc = struct.pack(f"<{len(boundaries)}I", *boundaries) + descriptors
+    # Starts with a property modifier, which comes before the piece table
+    clx = b"\x01\x02\x00\xaa\xbb\x02" + struct.pack("<I", len(plc)) + plc
+    struct.pack_into("<H8xH", stream, 0, 0xA5EC, 0x0200)
+    struct.pack_into("<II", stream, 0x01A2, 0, len(clx))
+    return compound_file({"WordDocument": bytes(stream), "1Table": clx})
+
+
+def shell_job(script):
+    """
+    A job for the .doc extraction pool that runs `script` as a converter,
+    with the file path as $0. Workers come from a fork server and import
+    their jobs by name, which this module cannot be (it needs Django), so
+    test jobs are built from the standard library.
+    """
+    return functools.partial(os.spawnlp, os.P_WAIT, "sh", "sh", "-c", script)
+
+
+# Starts a converter that records its pid and hangs
+HANGING_JOB = shell_job('echo $$ > "$0.pid"; exec sleep 60')
+
+
+def worker_pid(pool, path):
+    pool.run(shell_job('echo $PPID > "$0.pid"'), path, 5)
+    with open(f"{path}.pid") as handle:
+        return int(handle.read())
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as handle:
+            # The state follows the command name, which is in parentheses
+            return handle.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class TestDocExtraction(TestCase):
+    def setUp(self):
+        metrics.reset()
+        shutdown_doc_pool()
+        self.addCleanup(shutdown_doc_pool)
+        handle = tempfile.NamedTemporaryFile(suffix=".doc", delete=False)
+        handle.write(
+            word_document(
+                [
+                    'Jane Doe\rSkills\x07Python\x07\x07Email: \x13 HYPERLINK "mailto:'
+                    'jane@example.com" \x14jane@example.com\x15\r',
+                    "Łódź, Poland\x0c",
+                ]
+            )
+        )
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        self.path = handle.name
+
+    def test_olefile_reads_pieces_fields_and_tables(self):
+        self.assertEqual(
+            extract_doc_text(self.path).split("\n"),
+            ["Jane Doe", "Skills\tPython", "Email: jane@example.com", "Łódź, Poland"],
+        )
+
+    @override_settings(
+        DOC_EXTRACTORS="failing,hanging,olefile", DOC_EXTRACTION_TIMEOUT=1
+    )
+    def test_falls_back_past_failures_and_timeouts(self):
+        extractors = {"failing": os.listdir, "hanging": HANGING_JOB}
+        with mock.patch.dict(
+            DOC_EXTRACTORS, extractors
+        ), tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cv.doc")
+            shutil.copy(self.path, path)
+            text = extract_text_from_doc(path)
+        self.assertTrue(text.startswith("Jane Doe\nSkills\tPython"))
+        self.assertEqual(metrics.get("doc_extraction_failing_failures"), 1)
+        self.assertEqual(metrics.get("doc_extraction_hanging_timeouts"), 1)
+
+    @override_settings(DOC_EXTRACTORS="failing")
+    def test_error_when_every_extractor_fails(self):
+        with mock.patch.dict(DOC_EXTRACTORS, {"failing": os.listdir}):
+            with self.assertRaisesRegex(
+                Exception, "Error processing DOC: failing: .*Not a directory"
+            ):
+                extract_text_from_doc(self.path)
+
+    def job_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        return os.path.join(directory, "cv.doc")
+
+    def test_workers_start_from_a_fork_server(self):
+        pool = DocExtractionPool(1, None)
+        self.addCleanup(pool.shutdown)
+        with open(f"/proc/{worker_pid(pool, self.job_path())}/status") as handle:
+            status = dict(line.split(":", 1) for line in handle)
+        # Not a fork of this process, with its memory and its threads' locks
+        self.assertNotEqual(int(status["PPid"]), os.getpid())
+
+    def test_timeout_kills_the_worker_and_its_converters(self):
+        pool = DocExtractionPool(1, None)
+        self.addCleanup(pool.shutdown)
+        path = self.job_path()
+        first_pid = worker_pid(pool, path)
+        with self.assertRaises(DocExtractionTimeout):
+            pool.run(HANGING_JOB, path, 1)
+        with open(f"{path}.pid") as handle:
+            converter_pid = int(handle.read())
+        self.assertFalse(is_running(first_pid))
+        self.assertFalse(is_running(converter_pid))
+        self.assertNotEqual(worker_pid(pool, path), first_pid)
+
+    def test_crashed_or_oversized_jobs_fail_and_workers_are_replaced(self):
+        pool = DocExtractionPool(1, 512 * 1024**2)
+        self.addCleanup(pool.shutdown)
+        path = self.job_path()
+        with self.assertRaisesRegex(DocExtractionFailed, "MemoryError"):
+            pool.run(bytearray, 2 * 1024**3, 5)
+        first_pid = worker_pid(pool, path)
+        with self.assertRaisesRegex(DocExtractionFailed, "the worker died"):
+            pool.run(os._exit, 1, 5)
+        self.assertNotEqual(worker_pid(pool, path), first_pid)
+
+
+class TestHybridPdfExtraction(TestCase):
+    def write_pdf(self, page_texts):
+        handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        handle.write(make_text_pdf(page_texts))
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    @mock.patch("cvapp.utils.ocr_parser.ocr_pdf_pages")
+    def test_text_layer_skips_ocr(self, mock_ocr):
+        """Pages with a usable text layer should never be rasterized."""
+        path = self.write_pdf(["Jane Doe\nSkills\nPython, Django, PostgreSQL"])
+        text = extract_text_from_pdf(path)
+        self.assertIn("Jane Doe", text)
+        self.assertIn("Python, Django, PostgreSQL", text)
+        mock_ocr.assert_not_called()
+
+    @mock.patch("cvapp.utils.ocr_parser.ocr_pdf_pages", return_value=["scanned page\n"])
+    def test_only_pages_without_text_are_ocrd(self, mock_ocr):
+        path = self.write_pdf(
+            [
+                "Jane Doe, Senior Engineer at Example Corp",
+                "",
+                "Education: BSc Physics 2015",
+            ]
+        )
+        text = extract_text_from_pdf(path)
+        mock_ocr.assert_called_once_with(path, [2])
+        self.assertLess(text.index("Jane Doe"), text.index("scanned page"))
+        self.assertLess(text.index("scanned page"), text.index("Education"))
+
+    @override_settings(PDF_EXTRACTION_MODE="ocr")
+    @mock.patch("cvapp.utils.ocr_parser.ocr_pdf_pages", return_value=["ocr"])
+    @mock.patch("cvapp.utils.ocr_parser.pdfinfo_from_path", return_value={"Pages": 1})
+    def test_ocr_mode_ignores_text_layer(self, mock_info, mock_ocr):
+        path = self.write_pdf(["Jane Doe, Senior Engineer at Example Corp"])
+        self.assertEqual(extract_text_from_pdf(path), "ocr")
+        mock_ocr.assert_called_once_with(path, [1])
+
+    def test_usable_text_heuristic(self):
+        self.assertFalse(is_usable_text(""))
+        self.assertFalse(is_usable_text("   \n  12 "))
+        self.assertFalse(is_usable_text("(cid:12)(cid:34)(cid:56)(cid:78) " * 5))
+        self.assertTrue(
+            is_usable_text("Software engineer with ten years of experience")
+        )
+
+
+@unittest.skipUnless(
+    multiprocessing.get_start_method() == "fork",
+    "patched OCR functions only reach pool workers started with fork",
+)
+@override_settings(PDF_EXTRACTION_MODE="ocr", OCR_WORKERS=3, OCR_ENGINE="pytesseract")
+class TestParallelOcr(TestCase):
+    def setUp(self):
+        # Workers must be forked after the patches below are in place.
+        shutdown_ocr_pool()
+        self.addCleanup(shutdown_ocr_pool)
+        for target, side_effect in (
+            ("ocr_parser.pdfinfo_from_path", lambda path: {"Pages": 12}),
+            (
+                "ocr_parser.iter_pdf_page_images",
+                lambda path, first, last: ((n, n) for n in range(first, last + 1)),
+            ),
+            (
+                "ocr_engines.pytesseract.image_to_string",
+                lambda image: f"page {image} by {os.getpid()}\n",
+            ),
+        ):
+            patcher = mock.patch(f"cvapp.utils.{target}", side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pages_are_ocrd_in_workers_in_page_order(self):
+        lines = extract_text_from_pdf("scan.pdf").splitlines()
+        self.assertEqual(
+            [line.split(" by ")[0] for line in lines],
+            [f"page {n}" for n in range(1, 13)],
+        )
+        worker_pids = {line.split(" by ")[1] for line in lines}
+        self.assertNotIn(str(os.getpid()), worker_pids)
+
+    def test_pool_is_shared_between_calls(self):
+        pool = get_ocr_pool()
+        extract_text_from_pdf("first.pdf")
+        extract_text_from_pdf("second.pdf")
+        self.assertIs(get_ocr_pool(), pool)
+
+
+class TestStreamingRasterization(TestCase):
+    def fake_convert(
+        self, file_path, first_page, last_page, output_folder, paths_only, **options
+    ):
+        """Stands in for pdftoppm: writes one small image per page and returns paths."""
+        self.rendered.append((first_page, last_page))
+        paths = []
+        for number in range(first_page, last_page + 1):
+            path = os.path.join(output_folder, f"page-{number:04d}.png")
+            Image.new("L", (20, 20), color=number).save(path)
+            paths.append(path)
+        return paths
+
+    def setUp(self):
+        self.rendered = []
+        patcher = mock.patch(
+            "cvapp.utils.ocr_parser.convert_from_path", side_effect=self.fake_convert
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_split_page_ranges(self):
+        self.assertEqual(
+            split_page_ranges([1, 2, 3, 4, 5, 7, 8, 10], 3),
+            [(1, 3), (4, 5), (7, 8), (10, 10)],
+        )
+
+    @override_settings(
+        OCR_WORKERS=1, OCR_RENDER_BATCH_PAGES=4, OCR_ENGINE="pytesseract"
+    )
+    def test_pages_are_rendered_in_ranges_and_freed_one_at_a_time(self):
+        seen = []
+
+        def ocr(image):
+            # Only the page being OCR'd may be on disk at this point.
+            folder = os.path.dirname(image.filename)
+            seen.append((image.getpixel((0, 0)), len(os.listdir(folder))))
+            return f"page {image.getpixel((0, 0))}\n"
+
+        with mock.patch(
+            "cvapp.utils.ocr_engines.pytesseract.image_to_string", side_effect=ocr
+        ):
+            texts = ocr_pdf_pages("scan.pdf", list(range(1, 11)))
+
+        self.assertEqual(texts, [f"page {n}\n" for n in range(1, 11)])
+        self.assertEqual(self.rendered, [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual([count for _, count in seen], [4, 3, 2, 1, 4, 3, 2, 1, 2, 1])
+
+
+def page_image(line_count, line_pixels=8, columns=1, size=(595, 842)):
+    """A page rendered at the 72 DPI probe resolution, with solid bars as text lines."""
+    width, height = size
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    column_width = (width - 120) // columns
+    for line in range(line_count):
+        top = 60 + line * (line_pixels + 6)
+        for column in range(columns):
+            left = 60 + column * column_width
+            draw.rectangle(
+                [left, top, left + column_width - 50, top + line_pixels - 1],
+                fill=(40, 40, 40),
+            )
+    return image
+
+
+class TestOcrPreprocessing(TestCase):
+    def plan(self, image):
+        return plan_page(image, min_dpi=150, max_dpi=300, target_line_pixels=36)
+
+    def test_otsu_threshold_separates_ink_from_paper(self):
+        histogram = [0] * 256
+        histogram[30], histogram[220] = 100, 900
+        self.assertTrue(30 <= otsu_threshold(histogram) < 220)
+
+        gray = Image.new("L", (10, 10), 200)
+        gray.putpixel((0, 0), 60)
+        binary = binarize(gray)
+        self.assertEqual((binary.getpixel((0, 0)), binary.getpixel((5, 5))), (0, 255))
+
+    def test_blank_pages_are_skipped(self):
+        self.assertIsNone(self.plan(Image.new("RGB", (595, 842), "white")))
+        self.assertIsNone(self.plan(Image.new("RGB", (595, 842), (235, 230, 220))))
+
+    def test_resolution_follows_text_size(self):
+        small_text = self.plan(page_image(40, line_pixels=8))
+        large_text = self.plan(page_image(40, line_pixels=14))
+        self.assertEqual(small_text, (300, PSM_SINGLE_COLUMN))
+        self.assertEqual(large_text, (175, PSM_SINGLE_COLUMN))
+
+    def test_large_pages_are_rendered_at_lower_resolution(self):
+        dpi, _ = self.plan(page_image(40, size=(2384, 3370)))  # A0
+        self.assertLess(dpi, 150)
+        self.assertLessEqual(dpi**2 * 2384 * 3370 / 72**2, 12_000_000)
+
+    def test_page_segmentation_mode_follows_layout(self):
+        self.assertEqual(self.plan(page_image(40, columns=2))[1], PSM_AUTO)
+        self.assertEqual(self.plan(page_image(2))[1], PSM_SPARSE_TEXT)
+
+    @override_settings(
+        OCR_PREPROCESSING="adaptive",
+        OCR_WORKERS=1,
+        OCR_RENDER_BATCH_PAGES=4,
+        OCR_ENGINE="pytesseract",
+    )
+    def test_adaptive_ocr_renders_planned_pages_at_their_resolution(self):
+        pages = {1: page_image(40), 2: Image.new("RGB", (595, 842), "white")}
+        pages[3] = page_image(40, line_pixels=14)
+        rendered = []
+
+        def fake_convert(file_path, first_page, last_page, output_folder, **options):
+            rendered.append((first_page, last_page, options["dpi"]))
+            self.assertTrue(options["grayscale"])
+            paths = []
+            for number in range(first_page, last_page + 1):
+                path = os.path.join(output_folder, f"page-{number}.png")
+                pages[number].convert("L").save(path)
+                paths.append(path)
+            return paths
+
+        def ocr(image, config):
+            self.assertEqual(set(image.getdata()), {0, 255})
+            return config
+
+        with mock.patch(
+            "cvapp.utils.ocr_parser.convert_from_path", side_effect=fake_convert
+        ), mock.patch(
+            "cvapp.utils.ocr_engines.pytesseract.image_to_string", side_effect=ocr
+        ):
+            texts = ocr_pdf_pages("scan.pdf", [1, 2, 3])
+
+        self.assertEqual(texts, ["--psm 4", "", "--psm 4"])
+        self.assertEqual(rendered, [(1, 3, 72), (1, 1, 300), (3, 3, 175)])
+
+    def test_preprocessing_settings_change_extractor_version(self):
+        default = get_extractor_version()
+        with override_settings(OCR_PREPROCESSING="adaptive"):
+            adaptive = get_extractor_version()
+            with override_settings(OCR_MAX_DPI=400):
+                self.assertNotEqual(get_extractor_version(), adaptive)
+        self.assertNotEqual(adaptive, default)
+
+    def test_character_accuracy(self):
+        self.assertEqual(character_accuracy("Jane  Doe\n", "Jane Doe"), 1.0)
+        self.assertAlmostEqual(character_accuracy("Jane Doe", "Jone Doe"), 7 / 8)
+        self.assertEqual(character_accuracy("", ""), 1.0)
+
+    def test_benchmark_reports_speedup_and_accuracy_change(self):
+        samples = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, samples)
+        for name in ("a.pdf", "b.pdf"):
+            open(os.path.join(samples, name), "wb").close()
+        with open(os.path.join(samples, "b.txt"), "w") as f:
+            f.write("Jane Doe")
+
+        def extract(path):
+            return "Jane Doe" if settings.OCR_PREPROCESSING == "off" else "Jane Dos"
+
+        out = io.StringIO()
+        with mock.patch("cvapp.benchmarks.extract_text_from_pdf", side_effect=extract):
+            call_command("benchmark_ocr", samples=samples, stdout=out)
+        output = out.getvalue()
+        self.assertIn("(vs off)", output)
+        self.assertIn("(vs ground truth)", output)
+        self.assertIn("character accuracy 87.5% (-12.5%)", output)
+
+
+class FakeTessBaseAPI:
+    """Records how a tesserocr PyTessBaseAPI is created and used."""
+
+    created = []
+
+    def __init__(self, lang):
+        self.created.append((lang, threading.get_ident()))
+        self.calls = []
+
+    def SetPageSegMode(self, psm):
+        self.calls.append(("psm", psm))
+
+    def SetImage(self, image):
+        self.calls.append(("image", image))
+
+    def GetUTF8Text(self):
+        return f"text from {id(self)}"
+
+
+class TestOcrEngines(TestCase):
+    def setUp(self):
+        FakeTessBaseAPI.created = []
+        fake_module = SimpleNamespace(
+            PyTessBaseAPI=FakeTessBaseAPI, PSM=SimpleNamespace(AUTO=3)
+        )
+        for patcher in (
+            mock.patch("cvapp.utils.ocr_engines.tesserocr", fake_module),
+            # Engines created with the fake must not outlive the test
+            mock.patch.dict("cvapp.utils.ocr_engines._engines", clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_engine_resolution_falls_back_to_pytesseract(self):
+        self.assertEqual(resolve_engine_name("auto"), "tesserocr")
+        self.assertEqual(resolve_engine_name("pytesseract"), "pytesseract")
+        with mock.patch("cvapp.utils.ocr_engines.tesserocr", None):
+            self.assertEqual(resolve_engine_name("auto"), "pytesseract")
+            self.assertEqual(resolve_engine_name("tesserocr"), "pytesseract")
+        with self.assertRaises(ValueError):
+            resolve_engine_name("easyocr")
+        self.assertIs(get_engine("tesserocr"), get_engine("auto"))
+
+    def test_tesserocr_reuses_one_instance_per_thread(self):
+        engine = TesserocrEngine()
+        image = Image.new("L", (10, 10), 255)
+        first = engine.image_to_string(image)
+        self.assertEqual(engine.image_to_string(image, psm=11), first)
+        self.assertEqual(len(FakeTessBaseAPI.created), 1)
+        self.assertEqual(
+            engine._local.api.calls,
+            [("psm", 3), ("image", image), ("psm", 11), ("image", image)],
+        )
+
+        thread = threading.Thread(target=engine.image_to_string, args=(image,))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(FakeTessBaseAPI.created), 2)
+        self.assertNotEqual(
+            FakeTessBaseAPI.created[0][1], FakeTessBaseAPI.created[1][1]
+        )
+
+    @mock.patch(
+        "cvapp.utils.ocr_engines.pytesseract.image_to_string", return_value="text"
+    )
+    def test_pytesseract_passes_page_segmentation_mode(self, mock_ocr):
+        image = Image.new("L", (10, 10), 255)
+        PytesseractEngine().image_to_string(image)
+        PytesseractEngine().image_to_string(image, psm=4)
+        self.assertEqual(
+            mock_ocr.call_args_list,
+            [mock.call(image), mock.call(image, config="--psm 4")],
+        )
+
+    @override_settings(PDF_EXTRACTION_MODE="ocr", OCR_WORKERS=1)
+    @mock.patch("cvapp.utils.ocr_parser.pdfinfo_from_path", return_value={"Pages": 3})
+    @mock.patch(
+        "cvapp.utils.ocr_parser.iter_pdf_page_images",
+        side_effect=lambda path, first, last: (
+            (n, Image.new("L", (10, 10), 255)) for n in range(first, last + 1)
+        ),
+    )
+    def test_ocr_uses_the_configured_engine(self, mock_images, mock_info):
+        with override_settings(OCR_ENGINE="tesserocr"):
+            self.assertEqual(extract_text_from_pdf("scan.pdf").count("text from"), 3)
+            tesserocr_version = get_extractor_version()
+        with override_settings(OCR_ENGINE="pytesseract"), mock.patch(
+            "cvapp.utils.ocr_engines.pytesseract.image_to_string",
+            return_value="page\n",
+        ):
+            self.assertEqual(extract_text_from_pdf("scan.pdf"), "page\n" * 3)
+            self.assertNotEqual(get_extractor_version(), tesserocr_version)
+
+    def test_benchmark_compares_per_page_latency(self):
+        samples = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, samples)
+        open(os.path.join(samples, "scan.pdf"), "wb").close()
+
+        def fake_convert(path, output_folder, paths_only):
+            paths = [os.path.join(output_folder, f"{n}.png") for n in range(3)]
+            for page in paths:
+                Image.new("L", (10, 10), 255).save(page)
+            return paths
+
+        out = io.StringIO()
+        with mock.patch(
+            "cvapp.benchmarks.convert_from_path", side_effect=fake_convert
+        ), mock.patch(
+            "cvapp.utils.ocr_engines.pytesseract.image_to_string",
+            side_effect=lambda image: time.sleep(0.01) or "",
+        ):
+            call_command("benchmark_ocr", engines=True, samples=samples, stdout=out)
+        output = out.getvalue()
+        self.assertIn("ms per page", output)
+        self.assertIn("tesserocr: ", output)
+        self.assertIn("faster per page than pytesseract over 3 page(s)", output)
+
+
+PEAK_RSS_SCRIPT = """
+import os, resource, sys
+import django
+django.setup()
+from unittest import mock
+from cvapp.utils.ocr_parser import extract_text_from_pdf
+with mock.patch(
+    "cvapp.utils.ocr_engines.pytesseract.image_to_string",
+    side_effect=lambda image: image.load() and "",
+):
+    extract_text_from_pdf(sys.argv[1])
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+@unittest.skipUnless(shutil.which("pdftoppm"), "poppler (pdftoppm) is not installed")
+class TestRasterizationPeakMemory(TestCase):
+    def peak_rss_kb(self, page_count):
+        """OCRs a synthetic scanned PDF in a fresh interpreter and returns its peak RSS."""
+        handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        # Tiny images saved at 20 DPI give A4-sized pages, rendered at 200 DPI.
+        pages = [Image.new("L", (165, 234), color=255) for _ in range(page_count)]
+        pages[0].save(
+            handle.name, save_all=True, append_images=pages[1:], resolution=20
+        )
+
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE="cv_analyzer.settings",
+            PDF_EXTRACTION_MODE="ocr",
+            OCR_WORKERS="1",
+            OCR_ENGINE="pytesseract",
+        )
+        env.setdefault("SECRET_KEY", "test")
+        env.setdefault("OPENAI_API_KEY", "test")
+        result = subprocess.run(
+            [sys.executable, "-c", PEAK_RSS_SCRIPT, handle.name],
+            capture_output=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+            env=env,
+            text=True,
+        )
+        return int(result.stdout.split()[-1])
+
+    def test_peak_memory_does_not_grow_with_page_count(self):
+        few_pages = self.peak_rss_kb(4)
+        many_pages = self.peak_rss_kb(40)
+        # Holding 40 rendered A4 pages would add ~40 * 11 MB.
+        self.assertLess(many_pages - few_pages, 30 * 1024)
+
+
+@override_settings(CV_BACKGROUND_INGESTION=True)
+class TestBackgroundIngestion(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt")
+    @mock.patch("cvapp.pipeline.extract_text")
+    def test_upload_only_queues_jobs(self, mock_extract, mock_parse):
+        """The upload view should store and queue files without processing them."""
+        self.assertRedirects(self.upload("a.pdf", "b.pdf"), reverse("cv_summary"))
+        mock_extract.assert_not_called()
+        mock_parse.assert_not_called()
+        self.assertEqual(
+            IngestionJob.objects.filter(status=IngestionJob.QUEUED).count(), 2
+        )
+
+        response = self.client.get(reverse("cv_summary"))
+        self.assertTrue(response.context["pending"])
+        status = self.client.get(reverse("job_status")).json()
+        self.assertEqual((status["completed"], status["total"]), (0, 2))
+
+    @mock.patch(
+        "cvapp.pipeline.parse_cv_with_gpt",
+        return_value={"personal_info": {"name": "Jane Doe"}},
+    )
+    @mock.patch("cvapp.pipeline.extract_text", return_value="Jane Doe")
+    def test_worker_processes_queue_and_status_reports_progress(
+        self, mock_extract, mock_parse
+    ):
+        self.upload("a.pdf", "b.pdf")
+        call_command("process_jobs", "--once", stdout=io.StringIO())
+
+        self.assertEqual(mock_parse.call_count, 2)
+        status = self.client.get(reverse("job_status")).json()
+        self.assertEqual((status["completed"], status["total"]), (2, 2))
+        self.assertEqual(
+            [doc["status"] for doc in status["documents"]], ["done", "done"]
+        )
+        self.assertEqual(
+            status["documents"][0]["raw"], {"personal_info": {"name": "Jane Doe"}}
+        )
+        self.assertFalse(self.client.get(reverse("cv_summary")).context["pending"])
+
+    @mock.patch("cvapp.pipeline.extract_text", side_effect=Exception("corrupt PDF"))
+    def test_failed_job_records_error(self, mock_extract):
+        self.upload("a.pdf")
+        call_command(
+            "process_jobs", "--once", stdout=io.StringIO(), stderr=io.StringIO()
+        )
+        job = IngestionJob.objects.get()
+        self.assertEqual(job.status, IngestionJob.FAILED)
+        self.assertEqual(job.error, "corrupt PDF")
+        self.assertEqual(job.attempts, 1)
+
+    def test_a_job_is_claimed_only_once(self):
+        self.upload("a.pdf")
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+
+@override_settings(UPLOAD_CONCURRENCY=3)
+@override_settings(CV_PARSER_MODE="local")
+class TestUploadHandler(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        metrics.reset()
+        patcher = mock.patch("cvapp.pipeline.extract_text", return_value="Jane Doe")
+        self.mock_extract = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload_with_messages(self, *files):
+        response = self.upload(*files)
+        messages = [m.message for m in get_messages(response.wsgi_request)]
+        return response, messages
+
+    def stored_files(self):
+        folder = os.path.join(self.media_root, "cv_documents")
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_sniff_file_type(self):
+        self.assertEqual(sniff_file_type(b"%PDF-1.7\n"), "pdf")
+        self.assertEqual(sniff_file_type(b"\r\n" * 100 + b"%PDF-1.4"), "pdf")
+        self.assertEqual(sniff_file_type(ZIP_MAGIC + b"word/"), "docx")
+        self.assertEqual(sniff_file_type(OLE2_MAGIC), "doc")
+        self.assertIsNone(sniff_file_type(b"<html>"))
+
+    def test_accepted_files_carry_hash_and_sniffed_type(self):
+        content = ZIP_MAGIC + b"docx saved as .pdf"
+        response, messages = self.upload_with_messages(("cv.pdf", content))
+        self.assertRedirects(response, reverse("cv_summary"))
+        self.assertEqual(messages, [])
+        cv_doc = CVDocument.objects.get()
+        self.assertEqual(cv_doc.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(cv_doc.file_type, "docx")
+        self.mock_extract.assert_called_once_with(cv_doc.file.path, "docx")
+
+    def test_mislabeled_and_unsupported_files_are_not_stored(self):
+        response, messages = self.upload_with_messages(
+            ("cv.pdf", b"<html>not a pdf</html>"),
+            ("big.pdf", b"x" * 100_000),
+            ("notes.txt", b"%PDF-1.4"),
+            ("good.pdf", b"%PDF-1.4 good"),
+        )
+        self.assertRedirects(response, reverse("cv_summary"))
+        self.assertEqual(
+            messages,
+            [
+                "Rejected file cv.pdf: not a PDF, DOC or DOCX file.",
+                "Rejected file big.pdf: not a PDF, DOC or DOCX file.",
+                "Rejected file notes.txt: unsupported file extension.",
+            ],
+        )
+        self.assertEqual(CVDocument.objects.count(), 1)
+        self.assertEqual(self.stored_files(), ["good.pdf"])
+        self.assertEqual(metrics.get("uploads_rejected"), 3)
+
+    @override_settings(CV_UPLOAD_MAX_FILE_SIZE=1024, CV_UPLOAD_MAX_REQUEST_SIZE=2048)
+    def test_size_limits_are_enforced_while_receiving(self):
+        response, messages = self.upload_with_messages(
+            ("large.pdf", b"%PDF-1.4" + b" " * 1024),
+            ("first.pdf", b"%PDF-1.4" + b" " * 800),
+            ("second.pdf", b"%PDF-1.4" + b" " * 800),
+        )
+        self.assertRedirects(response, reverse("cv_summary"))
+        self.assertEqual(
+            messages,
+            [
+                "Rejected file large.pdf: larger than 1.0\xa0KB.",
+                "Rejected file second.pdf: the upload is larger than "
+                "2.0\xa0KB in total.",
+            ],
+        )
+        self.assertEqual(self.stored_files(), ["first.pdf"])
+
+    def test_only_rejected_files_redirect_back(self):
+        response, messages = self.upload_with_messages(("cv.docx", b"plain text"))
+        self.assertRedirects(response, reverse("upload_cv"))
+        self.assertEqual(
+            messages, ["Rejected file cv.docx: not a PDF, DOC or DOCX file."]
+        )
+        self.assertFalse(CVDocument.objects.exists())
+
+
+class TestConcurrentUpload(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def parsed_data(self):
+        response = self.client.get(reverse("cv_summary"))
+        return [item["raw"] for item in response.context["cv_parsed_data"]]
+
+    @mock.patch("cvapp.pipeline.extract_text", side_effect=lambda path, file_type: path)
+    def test_files_are_parsed_concurrently_in_upload_order(self, mock_extract):
+        # Every call waits for the other two, so this only passes if all three
+        # files are parsed at the same time.
+        barrier = threading.Barrier(3, timeout=5)
+
+        def parse(text):
+            barrier.wait()
+            return {"file": os.path.basename(text)}
+
+        with mock.patch("cvapp.pipeline.parse_cv_with_gpt", side_effect=parse):
+            response = self.upload("a.pdf", "b.pdf", "c.pdf")
+
+        self.assertRedirects(response, reverse("cv_summary"))
+        self.assertEqual(
+            [entry["file"] for entry in self.parsed_data()],
+            ["a.pdf", "b.pdf", "c.pdf"],
+        )
+
+    @mock.patch("cvapp.pipeline.extract_text", side_effect=lambda path, file_type: path)
+    def test_a_failed_file_keeps_the_others(self, mock_extract):
+        def parse(text):
+            if text.endswith("b.pdf"):
+                raise Exception("rate limited")
+            return {"file": os.path.basename(text)}
+
+        with mock.patch("cvapp.pipeline.parse_cv_with_gpt", side_effect=parse):
+            response = self.upload("a.pdf", "b.pdf", "c.pdf")
+
+        self.assertRedirects(response, reverse("cv_summary"))
+        self.assertEqual(
+            [entry["file"] for entry in self.parsed_data()],
+            ["a.pdf", "c.pdf"],
+        )
+        messages = [m.message for m in get_messages(response.wsgi_request)]
+        self.assertEqual(messages, ["Error processing file b.pdf: rate limited"])
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="text")
+    def test_identical_files_in_one_upload_are_processed_once(
+        self, mock_extract, mock_parse
+    ):
+        self.upload(("a.pdf", b"%PDF-1.4 same"), ("copy-of-a.pdf", b"%PDF-1.4 same"))
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(len(self.parsed_data()), 2)
+
+
+def fake_stream_client(*deltas, error=None):
+    """
+    Returns a stand-in for AsyncOpenAI whose streamed completion yields `deltas`
+    (and then raises `error`, if given).
+    """
+
+    async def stream():
+        for delta in deltas:
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))]
+            )
+        if error:
+            raise error
+
+    async def create(**kwargs):
+        create.calls.append(kwargs)
+        return stream()
+
+    create.calls = []
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+
+
+class TestChatbotStream(TestCase):
+    def setUp(self):
+        caches["chatbot"].clear()
+
+    async def post_and_read(self, message):
+        response = await self.async_client.post(
+            reverse("chatbot_stream"), {"message": message}
+        )
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        return response, body.decode()
+
+    async def test_reply_is_streamed_as_server_sent_events(self):
+        client = fake_stream_client("Jane ", "knows ", "Python.")
+        with override_settings(OPENAI_ASYNC_CLIENT=client):
+            response, body = await self.post_and_read("Who knows Python?")
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        deltas = [
+            json.loads(line[len("data: ") :])["delta"]
+            for line in body.split("\n")
+            if line.startswith('data: {"delta')
+        ]
+        self.assertEqual(deltas, ["Jane ", "knows ", "Python."])
+        self.assertIn("event: done\ndata: ", body)
+        self.assertTrue(client.chat.completions.create.calls[0]["stream"])
+
+    async def test_completed_reply_is_saved_to_history(self):
+        with override_settings(OPENAI_ASYNC_CLIENT=fake_stream_client("Hi", " there")):
+            await self.post_and_read("Hello")
+
+        conversation = await Conversation.objects.aget()
+        self.assertEqual(
+            await sync_to_async(conversation.history)(),
+            [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "Hi there"},
+            ],
+        )
+
+    async def test_api_error_streams_apology(self):
+        client = fake_stream_client("Partial", error=Exception("timeout"))
+        with override_settings(OPENAI_ASYNC_CLIENT=client):
+            _, body = await self.post_and_read("Hello")
+        self.assertIn("trouble processing your request", body)
+
+    async def test_empty_message_is_rejected(self):
+        response = await self.async_client.post(reverse("chatbot_stream"), {})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRetrieval(TestCase):
+    def test_tokenize_keeps_language_names_and_drops_stop_words(self):
+        self.assertEqual(
+            tokenize("Who has C++ and C# experience?"), ["c++", "c#", "experience"]
+        )
+
+    def test_chunk_text_overlaps_windows(self):
+        words = " ".join(str(n) for n in range(10))
+        self.assertEqual(chunk_text(words, 4, 1), ["0 1 2 3", "3 4 5 6", "6 7 8 9"])
+        self.assertEqual(chunk_text("", 4, 1), [])
+
+    def test_bm25_ranks_matching_chunks_first(self):
+        index = BM25Index(
+            [
+                ("Candidate #1", "Java developer, Spring, Hibernate"),
+                ("Candidate #2", "Kubernetes and Docker, some Java"),
+                ("Candidate #3", "Kubernetes operator, Kubernetes certified"),
+            ]
+        )
+        self.assertEqual(
+            [i for _, i in index.search("kubernetes experience", 5)], [2, 1]
+        )
+        self.assertEqual(index.search("haskell", 5), [])
+
+    def test_context_labels_candidates_and_falls_back_to_first_chunks(self):
+        index = BM25Index(
+            [("Candidate #1 (Ann)", "Python Django"), ("Candidate #2 (Bob)", "Go")]
+        )
+        self.assertEqual(
+            build_context(index, "python", 5), "Candidate #1 (Ann):\nPython Django"
+        )
+        self.assertIn("Candidate #2 (Bob):\nGo", build_context(index, "summarise", 5))
+
+
+@override_settings(CHATBOT_CHUNK_WORDS=30, CHATBOT_RETRIEVAL_TOP_K=2)
+class TestChatbotRetrieval(TestCase):
+    def setUp(self):
+        self.client = Client()
+        caches["chatbot"].clear()
+        self.openai = mock.MagicMock()
+        self.openai.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))]
+        )
+        patcher = override_settings(OPENAI_CLIENT=self.openai)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def create_documents(self, texts):
+        documents = [
+            CVDocument.objects.create(
+                file=f"cv{n}.pdf",
+                extracted_text=text,
+                parsed_data={"personal_info": {"name": f"Person {n}"}},
+            )
+            for n, text in enumerate(texts)
+        ]
+        session = self.client.session
+        session["cv_document_ids"] = [doc.pk for doc in documents]
+        session.save()
+        return documents
+
+    def system_prompt(self):
+        messages = self.openai.chat.completions.create.call_args.kwargs["messages"]
+        return messages[0]["content"]
+
+    def test_only_relevant_candidates_are_sent(self):
+        self.create_documents(
+            [
+                "Accountant with ten years in audit",
+                "Site reliability engineer, Kubernetes",
+            ]
+        )
+        self.client.post(reverse("chatbot"), {"message": "Who knows Kubernetes?"})
+        prompt = self.system_prompt()
+        self.assertIn("Candidate #2 (Person 1)", prompt)
+        self.assertNotIn("Accountant", prompt)
+
+    def test_index_is_rebuilt_for_new_parses_and_chunk_settings(self):
+        (cv_doc,) = self.create_documents([" ".join(["Kubernetes"] * 40)])
+        self.client.post(reverse("chatbot"), {"message": "Kubernetes"})
+        self.assertIn("Candidate #1 (Person 0)", self.system_prompt())
+
+        # Parsed again from new text of the same length
+        CVDocument.objects.filter(pk=cv_doc.pk).update(
+            parsed_data={"personal_info": {"name": "Jane Doe"}},
+            parsed_text_hash="new",
+        )
+        self.client.post(reverse("chatbot"), {"message": "Kubernetes"})
+        self.assertIn("Candidate #1 (Jane Doe)", self.system_prompt())
+        self.assertEqual(self.system_prompt().count("Kubernetes"), 2 * 30)
+
+        with self.settings(CHATBOT_CHUNK_WORDS=5, CHATBOT_CHUNK_OVERLAP_WORDS=0):
+            self.client.post(reverse("chatbot"), {"message": "Kubernetes"})
+        self.assertEqual(self.system_prompt().count("Kubernetes"), 2 * 5)
+
+    def test_prompt_size_does_not_grow_with_number_of_cvs(self):
+        filler = " ".join(["experience"] * 200)
+        self.create_documents([f"Python developer {filler}"] * 5)
+        self.client.post(reverse("chatbot"), {"message": "Python"})
+        small = len(self.system_prompt())
+
+        self.create_documents([f"Python developer {filler}"] * 100)
+        self.client.post(reverse("chatbot"), {"message": "Python"})
+        self.assertLessEqual(len(self.system_prompt()), small + 50)
+
+
+@override_settings(CHATBOT_HISTORY_TOKEN_BUDGET=100)
+class TestHistoryBudget(TestCase):
+    def turns(self, count):
+        # Each message costs 25 content tokens + 4 overhead tokens
+        return [
+            {"role": "user" if n % 2 == 0 else "assistant", "content": f"{n:02d}" * 50}
+            for n in range(count)
+        ]
+
+    def test_short_history_is_sent_verbatim(self):
+        summarize = mock.Mock()
+        history = self.turns(3)
+        window = prepare_history(history, "", 0, summarize)
+        self.assertEqual(window["messages"], history)
+        self.assertEqual(window["usage"]["saved_tokens"], 0)
+        summarize.assert_not_called()
+
+    def test_older_turns_are_summarized_once(self):
+        summarize = mock.Mock(return_value="summary")
+        history = self.turns(6)
+        window = prepare_history(history, "", 0, summarize)
+
+        self.assertEqual(window["messages"], history[3:])
+        summarize.assert_called_once_with("", history[:3])
+        self.assertEqual(window["summarized_count"], 3)
+        self.assertEqual(
+            window["usage"]["sent_tokens"], 3 * 29 + count_tokens("summary")
+        )
+        self.assertEqual(window["usage"]["history_tokens"], 6 * 29)
+
+        # Two more messages: only the newly overflowing ones are summarized
+        history += self.turns(2)
+        window = prepare_history(history, "summary", 3, summarize)
+        summarize.assert_called_with("summary", history[3:5])
+        self.assertEqual(window["messages"], history[5:])
+
+    def test_chatbot_sends_summary_and_reports_usage(self):
+        openai = mock.MagicMock()
+        openai.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="reply"))]
+        )
+        caches["chatbot"].clear()
+        conversation = Conversation.objects.create()
+        for user, assistant in zip(self.turns(6)[::2], self.turns(6)[1::2]):
+            conversation.add_exchange(user["content"], assistant["content"])
+        session = self.client.session
+        session["conversation_id"] = conversation.pk
+        session.save()
+
+        with override_settings(OPENAI_CLIENT=openai):
+            response = self.client.post(reverse("chatbot"), {"message": "And now?"})
+
+        summary_call, chat_call = openai.chat.completions.create.call_args_list
+        messages = chat_call.kwargs["messages"]
+        self.assertTrue(messages[1]["content"].startswith("Summary of the earlier"))
+        self.assertEqual(len(messages), 2 + 3 + 1)
+        self.assertIn("saved_tokens=", response["X-Chat-History-Tokens"])
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.summarized_count, 3)
+        self.assertEqual(len(conversation.history()), 8)
+
+
+class TestSessionReferences(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        caches["chatbot"].clear()
+
+    @mock.patch("cvapp.pipeline.parse_cv_with_gpt", return_value={"skills": ["x"]})
+    @mock.patch("cvapp.pipeline.extract_text", return_value="long text " * 10000)
+    def test_session_only_holds_ids(self, mock_extract, mock_parse):
+        """CV text, parsed data and chat history should stay out of the session."""
+        self.upload("cv.pdf")
+        openai = mock.MagicMock()
+        openai.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="reply"))]
+        )
+        with override_settings(OPENAI_CLIENT=openai):
+            self.client.post(reverse("chatbot"), {"message": "Hello"})
+
+        session = self.client.session
+        self.assertEqual(
+            set(session.keys()) - {"_messages"}, {"cv_document_ids", "conversation_id"}
+        )
+        conversation = Conversation.objects.get(pk=session["conversation_id"])
+        self.assertEqual(
+            conversation.history(),
+            [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "reply"},
+            ],
+        )
+
+
+class TestChatbotCache(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        caches["chatbot"].clear()
+        metrics.reset()
+        self.openai = mock.MagicMock()
+        self.openai.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Ann does."))]
+        )
+        patcher = override_settings(OPENAI_CLIENT=self.openai)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        document = CVDocument.objects.create(
+            file="cv.pdf",
+            extracted_text="Python developer",
+            parsed_data={"personal_info": {"name": "Ann"}},
+        )
+        self.document_ids = [document.pk]
+
+    def ask(self, message):
+        # Each question starts a new conversation over the same CVs, like a
+        # different user asking it
+        client = Client()
+        session = client.session
+        session["cv_document_ids"] = self.document_ids
+        session.save()
+        response = client.post(reverse("chatbot"), {"message": message})
+        return response.context["conversation"][-1]["content"]
+
+    def test_normalize_question(self):
+        self.assertEqual(
+            normalize_question("  Who has  Python experience? "),
+            "who has python experience",
+        )
+
+    def test_repeated_question_is_answered_from_cache(self):
+        self.assertEqual(self.ask("Who has Python experience?"), "Ann does.")
+        self.assertEqual(self.ask("who has python experience"), "Ann does.")
+        self.assertEqual(self.openai.chat.completions.create.call_count, 1)
+        stats = chatbot_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertGreaterEqual(stats["saved_seconds"], 0)
+
+    def test_different_cvs_or_history_miss_the_cache(self):
+        self.ask("Who has Python experience?")
+        other = CVDocument.objects.create(file="b.pdf", extracted_text="Python tester")
+        self.document_ids = [other.pk]
+        self.ask("Who has Python experience?")
+
+        # A follow-up in the same conversation has a different history
+        session = self.client.session
+        session["cv_document_ids"] = self.document_ids
+        session.save()
+        self.client.post(reverse("chatbot"), {"message": "Hello"})
+        self.client.post(reverse("chatbot"), {"message": "Who has Python experience?"})
+        self.assertEqual(self.openai.chat.completions.create.call_count, 4)
+
+    @override_settings(CV_PARSER_MODE="local")
+    def test_separate_uploads_of_the_same_cvs_share_replies(self):
+        files = {}
+        for name, lines in (("ann.docx", ["Ann Lee", "Python"]), ("bob.docx", ["Bob"])):
+            document = Document()
+            for line in lines:
+                document.add_paragraph(line)
+            buffer = io.BytesIO()
+            document.save(buffer)
+            files[name] = buffer.getvalue()
+
+        replies = []
+        # Each team member uploads the files, in a different order
+        for names in (["ann.docx", "bob.docx"], ["bob.docx", "ann.docx"]):
+            client = Client()
+            self.upload(*[(name, files[name]) for name in names], client=client)
+            response = client.post(reverse("chatbot"), {"message": "Who?"})
+            replies.append(response.context["conversation"][-1]["content"])
+
+        self.assertEqual(CVDocument.objects.filter(file__endswith=".docx").count(), 4)
+        self.assertEqual(replies, ["Ann does.", "Ann does."])
+        self.assertEqual(self.openai.chat.completions.create.call_count, 1)
+        self.assertEqual(chatbot_cache_stats()["hits"], 1)
+
+    def test_errors_are_not_cached(self):
+        self.openai.chat.completions.create.side_effect = Exception("timeout")
+        self.ask("Who has Python experience?")
+        self.openai.chat.completions.create.side_effect = None
+        self.assertEqual(self.ask("Who has Python experience?"), "Ann does.")
+
+    @override_settings(CHATBOT_CACHE_ENABLED=False)
+    def test_cache_can_be_bypassed(self):
+        self.ask("Who has Python experience?")
+        self.ask("Who has Python experience?")
+        self.assertEqual(self.openai.chat.completions.create.call_count, 2)
+        self.assertEqual(chatbot_cache_stats()["hits"], 0)
+
+    async def test_streamed_reply_is_cached(self):
+        client = fake_stream_client("Ann ", "does.")
+        with override_settings(OPENAI_ASYNC_CLIENT=client):
+            for _ in range(2):
+                # A fresh client each time, so the history is the same
+                response = await AsyncClient().post(
+                    reverse("chatbot_stream"), {"message": "Python?"}
+                )
+                body = b"".join([c async for c in response.streaming_content])
+        self.assertEqual(len(client.chat.completions.create.calls), 1)
+        self.assertIn('data: {"delta": "Ann does."}', body.decode())
+
+
+PARSED_CV = {
+    "personal_info": {"name": "Jane Doe", "emails": [], "phones": []},
+    "education": [],
+    "work_experience": [],
+    "skills": ["Python"],
+    "projects": [],
+    "certifications": None,
+}
+
+
+def stub_openai_client(parsed):
+    """
+    A client whose parsing replies are `parsed` for every CV in the prompt,
+    answering batched prompts with one entry per CV.
+    """
+
+    def create(messages, **kwargs):
+        numbers = re.findall(r"#### CV (\d+) ####", messages[-1]["content"])
+        reply = {number: parsed for number in numbers} if numbers else parsed
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))
+            ]
+        )
+
+    client = mock.MagicMock()
+    client.chat.completions.create.side_effect = create
+    return client
+
+
+class TestIngestCommand(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.corpus = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.corpus, ignore_errors=True)
+        self.openai = stub_openai_client(PARSED_CV)
+        patcher = override_settings(OPENAI_CLIENT=self.openai)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        os.makedirs(os.path.join(self.corpus, "2023"))
+        for name in ("a.pdf", "b.PDF", "2023/c.pdf"):
+            with open(os.path.join(self.corpus, name), "wb") as f:
+                f.write(make_text_pdf([f"Curriculum vitae of candidate {name}"]))
+        with open(os.path.join(self.corpus, "notes.txt"), "w") as f:
+            f.write("not a CV")
+        self.checkpoint = os.path.join(self.corpus, ".ingest_cvs_checkpoint.json")
+
+    def ingest(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            "ingest_cvs",
+            self.corpus,
+            "--workers=2",
+            "--batch-size=2",
+            *args,
+            stdout=out,
+            stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_ingests_directory_and_reports_timings(self):
+        out, err = self.ingest()
+
+        documents = CVDocument.objects.order_by("file")
+        self.assertEqual(documents.count(), 3)
+        self.assertEqual(
+            [doc.extracted_text.strip() for doc in documents],
+            [
+                "Curriculum vitae of candidate a.pdf",
+                "Curriculum vitae of candidate b.PDF",
+                "Curriculum vitae of candidate 2023/c.pdf",
+            ],
+        )
+        self.assertEqual(documents[0].parsed_data, PARSED_CV)
+        # The three CVs are parsed by a single batched request
+        self.assertEqual(self.openai.chat.completions.create.call_count, 1)
+        self.assertIn("Ingested 3 file(s)", out)
+        self.assertIn("files/sec", out)
+        for stage in ("hash", "extract", "parse", "write"):
+            self.assertIn(f"  {stage}", out)
+        self.assertEqual(
+            load_checkpoint(self.checkpoint, self.corpus),
+            {"a.pdf", "b.PDF", os.path.join("2023", "c.pdf")},
+        )
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        save_checkpoint(self.checkpoint, self.corpus, {"a.pdf", "b.PDF"})
+        out, _ = self.ingest()
+        self.assertIn("Ingested 1 file(s)", out)
+        self.assertIn("2 already done", out)
+        self.assertEqual(CVDocument.objects.count(), 1)
+
+        out, _ = self.ingest()
+        self.assertIn("Ingested 0 file(s)", out)
+
+        # Starting over reuses the stored results of identical files
+        out, _ = self.ingest("--restart", "--llm-batch-size=1")
+        self.assertIn("Ingested 3 file(s) (1 from cache)", out)
+        self.assertEqual(self.openai.chat.completions.create.call_count, 3)
+
+    def test_identical_files_are_extracted_once_by_their_sniffed_type(self):
+        shutil.copy(os.path.join(self.corpus, "a.pdf"), self.corpus + "/a copy.pdf")
+        # A PDF saved with the wrong extension
+        shutil.copy(os.path.join(self.corpus, "b.PDF"), self.corpus + "/b.doc")
+        out, _ = self.ingest()
+        self.assertIn("Ingested 5 file(s) (2 from cache)", out)
+        documents = {
+            os.path.basename(doc.file.name): doc
+            for doc in CVDocument.objects.all()
+        }
+        self.assertEqual(
+            documents["a_copy.pdf"].extracted_text,
+            documents["a.pdf"].extracted_text,
+        )
+        self.assertEqual(
+            documents["b.doc"].extracted_text.strip(),
+            "Curriculum vitae of candidate b.PDF",
+        )
+        self.assertEqual(documents["b.doc"].file_type, "pdf")
+
+    @mock.patch(
+        "cvapp.utils.ocr_parser.pdfinfo_from_path", side_effect=Exception("corrupt")
+    )
+    def test_failed_files_are_reported_and_retried(self, mock_pdfinfo):
+        with open(os.path.join(self.corpus, "broken.pdf"), "wb") as f:
+            f.write(b"not a pdf")
+        out, err = self.ingest()
+        self.assertIn("broken.pdf failed", err)
+        self.assertIn("Ingested 3 file(s) (0 from cache), 1 failed", out)
+        self.assertNotIn("broken.pdf", load_checkpoint(self.checkpoint, self.corpus))
+
+    @unittest.skipUnless(
+        shutil.which("pdftoppm") and shutil.which("tesseract"),
+        "poppler and tesseract are needed to OCR the sample CVs",
+    )
+    def test_sample_corpus(self):
+        corpus = os.path.join(settings.BASE_DIR, "data", "sample_cvs")
+        out = io.StringIO()
+        call_command(
+            "ingest_cvs",
+            corpus,
+            f"--checkpoint={os.path.join(self.corpus, 'samples.json')}",
+            stdout=out,
+        )
+        self.assertEqual(CVDocument.objects.count(), len(os.listdir(corpus)))
+        self.assertTrue(all(d.extracted_text for d in CVDocument.objects.all()))
+
+
+class TestReprocessCommand(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.openai = stub_openai_client(PARSED_CV)
+        patcher = override_settings(OPENAI_CLIENT=self.openai)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        self.documents = []
+        for name in ("a", "b"):
+            content = make_text_pdf([f"Curriculum vitae of candidate {name}"])
+            self.documents.append(
+                CVDocument.objects.create(
+                    file=SimpleUploadedFile(f"{name}.pdf", content),
+                    content_hash=hashlib.sha256(content).hexdigest(),
+                    file_type="pdf",
+                )
+            )
+        self.assertEqual(process_documents(self.documents), [None, None])
+        self.openai.chat.completions.create.reset_mock()
+
+    def reprocess(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command("reprocess", "--concurrency=2", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_nothing_is_stale_after_processing(self):
+        out, _ = self.reprocess()
+        self.assertIn("0 document(s) with stale text, 0 with stale parsed data", out)
+        self.assertIn("Reprocessed 0 document(s)", out)
+
+    @mock.patch("cvapp.pipeline.PARSER_VERSION", "gpt-4-prompt-changed")
+    def test_prompt_change_reparses_without_extracting(self):
+        out, _ = self.reprocess("--dry-run")
+        self.assertIn("0 document(s) with stale text, 2 with stale parsed data", out)
+        self.assertEqual(self.openai.chat.completions.create.call_count, 0)
+
+        with mock.patch("cvapp.reprocess.extract_text") as mock_extract:
+            out, _ = self.reprocess()
+        mock_extract.assert_not_called()
+        self.assertEqual(self.openai.chat.completions.create.call_count, 2)
+        self.assertIn("2/2 documents", out)
+        self.assertIn("0 extraction(s), 2 parse(s)", out)
+        self.assertEqual(
+            set(CVDocument.objects.values_list("parser_version", flat=True)),
+            {"gpt-4-prompt-changed"},
+        )
+
+    @mock.patch("cvapp.utils.ocr_parser.EXTRACTOR_VERSION", "next")
+    def test_extractor_change_keeps_parse_when_text_is_unchanged(self):
+        out, _ = self.reprocess()
+        self.assertIn("2 extraction(s), 0 parse(s), 2 parse(s) kept", out)
+        self.assertEqual(self.openai.chat.completions.create.call_count, 0)
+        self.assertTrue(
+            all(
+                doc.extractor_version.startswith("next:")
+                for doc in CVDocument.objects.all()
+            )
+        )
+
+    @mock.patch("cvapp.utils.ocr_parser.EXTRACTOR_VERSION", "next")
+    def test_changed_text_is_parsed_again(self):
+        with mock.patch("cvapp.reprocess.extract_text", return_value="New text"):
+            out, _ = self.reprocess()
+        self.assertIn("2 extraction(s), 2 parse(s), 0 parse(s) kept", out)
+        for doc in CVDocument.objects.all():
+            self.assertEqual(doc.extracted_text, "New text")
+            self.assertEqual(doc.parsed_text_hash, doc.text_hash)
+        self.assertIn("0 with stale parsed data", self.reprocess("--dry-run")[0])
+
+    @mock.patch("cvapp.utils.ocr_parser.EXTRACTOR_VERSION", "next")
+    def test_failures_are_reported_and_stay_stale(self):
+        os.remove(self.documents[0].file.path)
+        out, err = self.reprocess()
+        self.assertIn(f"Document {self.documents[0].pk} failed", err)
+        self.assertIn("Reprocessed 1 document(s), 1 failed", out)
+        self.assertIn("1 document(s) with stale text", self.reprocess("--dry-run")[0])
+
+    def test_parses_without_a_text_hash_are_stale(self):
+        CVDocument.objects.filter(pk=self.documents[0].pk).update(parsed_text_hash=None)
+        out, _ = self.reprocess()
+        self.assertIn("0 document(s) with stale text, 1 with stale parsed data", out)
+        self.assertIn("0 extraction(s), 1 parse(s)", out)
+
+
+@override_settings(
+    LLM_PARSE_BATCH_SIZE=3,
+    LLM_PARSE_BATCH_TOKENS=1000,
+    LLM_PARSE_OUTPUT_TOKENS_PER_CV=50,
+)
+class TestBatchedParsing(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def parse(self, texts, client):
+        with override_settings(OPENAI_CLIENT=client):
+            return parse_cvs_with_gpt(texts)
+
+    def test_cvs_share_requests_within_size_and_token_limits(self):
+        client = stub_openai_client(PARSED_CV)
+        texts = ["short cv"] * 4 + ["x" * 4000, "short cv"]
+        self.assertEqual(self.parse(texts, client), [PARSED_CV] * 6)
+
+        prompts = [
+            call.kwargs["messages"][-1]["content"]
+            for call in client.chat.completions.create.call_args_list
+        ]
+        # 3 CVs, then 1 (the next is over the token budget), then the large
+        # one alone, then the last
+        self.assertEqual(
+            [len(re.findall(r"#### CV \d", prompt)) for prompt in prompts], [3, 0, 0, 0]
+        )
+        self.assertEqual(len(prompts), 4)
+        self.assertEqual(prompts[0].count("Extract the following information"), 1)
+
+    @override_settings(LLM_PARSE_CONTEXT_TOKENS=350)
+    def test_reply_allowance_fits_the_context_and_limits_the_reply(self):
+        client = stub_openai_client(PARSED_CV)
+        self.assertEqual(self.parse(["short cv"] * 4, client), [PARSED_CV] * 4)
+
+        calls = client.chat.completions.create.call_args_list
+        # The context, not LLM_PARSE_BATCH_TOKENS, leaves room for 2 CVs
+        self.assertEqual([call.kwargs["max_tokens"] for call in calls], [100, 100])
+        for call in calls:
+            prompt = call.kwargs["messages"][-1]["content"]
+            self.assertLessEqual(count_tokens(prompt) + call.kwargs["max_tokens"], 350)
+
+    def test_truncated_reply_costs_one_retry_per_cv(self):
+        def create(messages, **kwargs):
+            prompt = messages[-1]["content"]
+            if "#### CV" in prompt:
+                reply = json.dumps({"1": PARSED_CV, "2": PARSED_CV})[:60]
+                finish_reason = "length"
+            else:
+                reply = json.dumps(PARSED_CV)
+                finish_reason = "stop"
+            return SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(content=reply),
+                        finish_reason=finish_reason,
+                    )
+                ]
+            )
+
+        client = mock.MagicMock()
+        client.chat.completions.create.side_effect = create
+        self.assertEqual(self.parse(["a", "b", "c"], client), [PARSED_CV] * 3)
+        # One batched request, then one request per CV; never more than that
+        self.assertEqual(client.chat.completions.create.call_count, 4)
+        self.assertEqual(metrics.get("llm_parse_retries"), 3)
+        batch_call = client.chat.completions.create.call_args_list[0]
+        self.assertEqual(batch_call.kwargs["max_tokens"], 150)
+
+    def test_invalid_or_missing_results_are_retried_individually(self):
+        invalid = dict(PARSED_CV, skills="Python")
+        replies = [
+            json.dumps({"1": PARSED_CV, "2": invalid}),
+            json.dumps(PARSED_CV),
+            json.dumps(PARSED_CV),
+        ]
+        client = mock.MagicMock()
+        client.chat.completions.create.side_effect = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=r))]
+            )
+            for r in replies
+        ]
+        self.assertEqual(self.parse(["a", "b", "c"], client), [PARSED_CV] * 3)
+        self.assertEqual(client.chat.completions.create.call_count, 3)
+        self.assertEqual(metrics.get("llm_parse_retries"), 2)
+
+    def test_failed_request_falls_back_to_one_request_per_cv(self):
+        client = mock.MagicMock()
+        client.chat.completions.create.side_effect = [
+            Exception("rate limited"),
+            SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))]
+            ),
+            Exception("rate limited"),
+        ]
+        results = self.parse(["a", "b"], client)
+        self.assertEqual(results[0], {})
+        self.assertIsInstance(results[1], Exception)
+
+    def test_schema_validation(self):
+        self.assertTrue(is_valid_parse(PARSED_CV))
+        self.assertFalse(is_valid_parse({"skills": []}))
+        self.assertFalse(is_valid_parse(dict(PARSED_CV, personal_info=[])))
+        self.assertTrue(is_valid_parse({"skills": None}, sections=["skills"]))
+
+
+class TestBenchmarkCommand(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.output = os.path.join(self.directory, "results.json")
+        self.baseline = os.path.join(self.directory, "baseline.json")
+
+    def benchmark(self, **options):
+        options = {
+            "samples": os.path.join(self.directory, "no-samples"),
+            "sizes": "1",
+            "stages": (
+                "extract_text_from_docx,python_docx_paragraphs,"
+                "parse_cv,legacy_parse_cv,upload_cv"
+            ),
+            "repeat": 1,
+            "llm_latency": 0,
+            "output": self.output,
+            "baseline": self.baseline,
+            "stdout": io.StringIO(),
+            **options,
+        }
+        call_command("benchmark", **options)
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_results_are_written_as_json(self):
+        results = self.benchmark(no_compare=True)["results"]
+        for name in (
+            "extract_text_from_docx:synthetic-1kb",
+            "parse_cv:synthetic-1kb",
+            "upload_cv:synthetic-1kb",
+        ):
+            self.assertEqual(results[name]["runs"], 1)
+            self.assertGreater(results[name]["median"], 0)
+        self.assertIn(
+            "no .docx files", results["extract_text_from_docx:sample"]["skipped"]
+        )
+        self.assertEqual(
+            results["extract_text_from_docx:synthetic-1kb"]["found"],
+            ["header", "text box", "table", "footer"],
+        )
+        self.assertEqual(results["python_docx_paragraphs:synthetic-1kb"]["found"], [])
+        self.assertTrue(results["legacy_parse_cv:synthetic-1kb"]["same_output"])
+        # Uploads were rolled back
+        self.assertFalse(CVDocument.objects.exists())
+
+    def test_first_run_records_the_baseline(self):
+        stdout = io.StringIO()
+        first = self.benchmark(stages="parse_cv", stdout=stdout)
+        self.assertIn("saved these results as the baseline", stdout.getvalue())
+        with open(self.baseline) as f:
+            self.assertEqual(json.load(f), first)
+
+        stdout = io.StringIO()
+        self.benchmark(stages="parse_cv", tolerance=100, stdout=stdout)
+        self.assertIn("No regressions.", stdout.getvalue())
+
+    def test_regression_against_the_baseline_fails(self):
+        baseline = self.benchmark(save_baseline=True)
+        self.benchmark(tolerance=100)
+
+        baseline["results"]["parse_cv:synthetic-1kb"]["median"] = 1e-9
+        with open(self.baseline, "w") as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, "parse_cv:synthetic-1kb"):
+            self.benchmark(stages="parse_cv", min_delta=0)
+
+        with self.assertRaisesMessage(CommandError, "llm_latency"):
+            self.benchmark(stages="parse_cv", llm_latency=1)
+
+    def test_compare(self):
+        def run(results):
+            return {"meta": {}, "results": results}
+
+        rows = compare(
+            run(
+                {
+                    "a": {"median": 1.0},
+                    "b": {"median": 2.0},
+                    "c": {"median": 1.0},
+                    "d": {"skipped": "no tool"},
+                }
+            ),
+            run({"a": {"median": 0.9}, "b": {"median": 1.0}}),
+            tolerance=0.25,
+        )
+        self.assertEqual(
+            [row["status"] for row in rows], ["ok", "regression", "new", "skipped"]
+        )
+
+
+class TestMetrics(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        patcher = override_settings(
+            OPENAI_CLIENT=stub_openai_client(PARSED_CV), METRICS_ENABLED=True
+        )
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def upload_cv(self):
+        return self.upload(("cv.pdf", make_text_pdf([WELL_FORMATTED_CV])))
+
+    def test_upload_reports_its_stages(self):
+        response = self.upload_cv()
+        self.assertRedirects(response, reverse("cv_summary"))
+        stages = [
+            entry.split(";")[0] for entry in response["Server-Timing"].split(", ")
+        ]
+        for stage in ("store", "pdf_text_layer", "extract", "llm_parse", "parse"):
+            self.assertIn(stage, stages)
+        self.assertEqual(stages[-1], "total")
+        self.assertEqual(metrics.histogram("stage_seconds", stage="llm_parse")[0], 1)
+        self.assertEqual(metrics.histogram("pdf_pages", method="text_layer"), (1, 1))
+
+    async def test_async_requests_are_timed_without_adapting_the_middleware(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+        cv = ("cv.pdf", make_text_pdf([WELL_FORMATTED_CV]))
+        response = await self.upload(cv, client=AsyncClient())
+        stages = [
+            entry.split(";")[0] for entry in response["Server-Timing"].split(", ")
+        ]
+        self.assertIn("llm_parse", stages)
+        self.assertEqual(stages[-1], "total")
+
+    def test_metrics_endpoint(self):
+        self.upload_cv()
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn("# TYPE cvapp_llm_parse_requests_total counter", body)
+        self.assertIn("cvapp_llm_parse_requests_total 1", body)
+        self.assertIn("# TYPE cvapp_stage_seconds histogram", body)
+        self.assertIn('cvapp_stage_seconds_bucket{stage="llm_parse",le="+Inf"} 1', body)
+        self.assertIn('cvapp_request_seconds_count{view="upload_cv"} 1', body)
+
+    def test_token_usage_is_recorded(self):
+        completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Yes."))],
+            usage=SimpleNamespace(prompt_tokens=300, completion_tokens=20),
+        )
+        client = mock.MagicMock()
+        client.chat.completions.create.return_value = completion
+        with override_settings(OPENAI_CLIENT=client):
+            query_chatbot("Does she know Python?", "CV text", [])
+        self.assertEqual(
+            metrics.histogram("llm_tokens", call="chatbot", direction="in"), (1, 300)
+        )
+        self.assertEqual(
+            metrics.histogram("llm_tokens", call="chatbot", direction="out"), (1, 20)
+        )
+
+    def test_prometheus_histogram_buckets_are_cumulative(self):
+        for value in (0.003, 0.2, 0.2, 100):
+            metrics.observe("stage_seconds", value, stage="ocr")
+        lines = metrics.render_prometheus().splitlines()
+        self.assertIn('cvapp_stage_seconds_bucket{stage="ocr",le="0.005"} 1', lines)
+        self.assertIn('cvapp_stage_seconds_bucket{stage="ocr",le="0.25"} 3', lines)
+        self.assertIn('cvapp_stage_seconds_bucket{stage="ocr",le="60"} 3', lines)
+        self.assertIn('cvapp_stage_seconds_bucket{stage="ocr",le="+Inf"} 4', lines)
+        self.assertIn('cvapp_stage_seconds_count{stage="ocr"} 4', lines)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.upload_cv()
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(metrics.histogram("stage_seconds", stage="llm_parse"), (0, 0))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+
+class TestCandidateSearch(MediaRootMixin, TestCase):
+    def add_document(self, parsed):
+        cv_doc = CVDocument.objects.create(file="cv.pdf", parsed_data=parsed)
+        index_document(cv_doc)
+        return cv_doc
+
+    def search(self, **params):
+        return self.client.get(reverse("search_candidates"), params).json()
+
+    def test_extract_terms(self):
+        terms = extract_terms(
+            {
+                "skills": ["Python", " machine  learning ", {"name": "SQL"}, "x" * 200],
+                "work_experience": [
+                    "Backend Developer, Acme Ltd, 2019-2024",
+                    "Data Engineer at Globex: built pipelines",
+                    "Maintained the billing system",
+                    {"title": "Analyst", "company": "Initech"},
+                ],
+                "education": [
+                    "BSc Computer Science, University of Leeds",
+                    {"degree": "MSc", "institution": "Imperial College London"},
+                ],
+            }
+        )
+        self.assertEqual(terms["skills"], {"python", "machine learning", "sql"})
+        self.assertEqual(terms["employers"], {"acme ltd", "globex", "initech"})
+        self.assertEqual(
+            terms["institutions"], {"university of leeds", "imperial college london"}
+        )
+        self.assertEqual(
+            extract_terms(None),
+            {"skills": set(), "employers": set(), "institutions": set()},
+        )
+
+    @override_settings(CV_PARSER_MODE="local")
+    @mock.patch("cvapp.pipeline.extract_text", return_value=WELL_FORMATTED_CV)
+    def test_uploads_are_indexed_at_parse_time(self, mock_extract):
+        self.upload("cv.pdf")
+        results = self.search(skill="PYTHON", employer="Acme Ltd")["results"]
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["name"], "Jane Doe")
+        self.assertEqual(results[0]["institutions"], ["university of leeds"])
+
+    def test_filters_are_combined(self):
+        self.add_document({"skills": ["Python", "Django"]})
+        self.add_document({"skills": ["Python", "Go"]})
+        self.assertEqual(self.search(skill="python")["count"], 2)
+        self.assertEqual(self.search(skill=["python", "go"])["count"], 1)
+        self.assertEqual(self.search(skill="python", employer="acme")["count"], 0)
+
+    def test_reindexing_replaces_terms(self):
+        cv_doc = self.add_document({"skills": ["Python"]})
+        cv_doc.parsed_data = {"skills": ["Rust"]}
+        index_document(cv_doc)
+        self.assertEqual(self.search(skill="python")["count"], 0)
+        self.assertEqual(self.search(skill="rust")["count"], 1)
+
+    def test_pagination_uses_a_fixed_number_of_queries(self):
+        for number in range(5):
+            self.add_document({"skills": ["Python"], "education": [f"School {number}"]})
+        with self.assertNumQueries(5):
+            data = self.search(skill="python", page_size=2, page=2)
+        self.assertEqual((data["count"], data["page"], data["num_pages"]), (5, 2, 3))
+        self.assertEqual(
+            [result["institutions"] for result in data["results"]],
+            [["school 2"], ["school 1"]],
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("search_candidates"), {"page_size": "x"}
+            ).status_code,
+            400,
+        )
+
+
+class TestFullTextSearch(TestCase):
+    def add_document(self, text, name="Jane Doe"):
+        return CVDocument.objects.create(
+            file="cv.pdf",
+            extracted_text=text,
+            parsed_data={"personal_info": {"name": name}},
+        )
+
+    def ids(self, query):
+        return [result["id"] for result in search_text(query)[1]]
+
+    def test_index_follows_saves_updates_and_deletes(self):
+        cv_doc = self.add_document("Senior Python developer")
+        other = self.add_document("Java developer")
+        self.assertEqual(self.ids("python"), [cv_doc.pk])
+        # Stemmed, so "developers" matches "developer"
+        self.assertEqual(set(self.ids("developers")), {cv_doc.pk, other.pk})
+
+        cv_doc.extracted_text = "Senior Rust developer"
+        cv_doc.save()
+        self.assertEqual(self.ids("python"), [])
+        self.assertEqual(self.ids("rust"), [cv_doc.pk])
+
+        CVDocument.objects.filter(pk=other.pk).update(extracted_text="Go developer")
+        self.assertEqual(self.ids("java"), [])
+        CVDocument.objects.filter(pk=cv_doc.pk).delete()
+        self.assertEqual(self.ids("developer"), [other.pk])
+
+    def test_results_are_ranked_with_escaped_snippets(self):
+        self.add_document("Knows some Python. " + "Many other things. " * 50)
+        best = self.add_document("Python, Python and more Python <script>")
+        count, results = search_text("python")
+        self.assertEqual(count, 2)
+        self.assertEqual(results[0]["id"], best.pk)
+        self.assertLess(results[0]["rank"], results[1]["rank"])
+        self.assertIn("<mark>Python</mark>", results[0]["snippet"])
+        self.assertIn("&lt;script&gt;", results[0]["snippet"])
+
+    def test_query_syntax_is_searched_literally(self):
+        self.assertEqual(
+            to_match_query('C++ AND "machine learning" NOT"'),
+            '"C" "AND" "machine learning" "NOT"',
+        )
+        self.assertEqual(to_match_query(' "" ** '), "")
+        self.add_document("Machine learning engineer")
+        self.assertEqual(len(self.ids('"machine learning" (engineer*')), 1)
+
+    def test_view_paginates(self):
+        for number in range(3):
+            self.add_document(f"Python developer number {number}", name=f"C{number}")
+        response = self.client.get(
+            reverse("search_text"), {"q": "python", "page_size": 2, "page": 2}
+        )
+        data = response.json()
+        self.assertEqual((data["count"], data["page"], data["num_pages"]), (3, 2, 2))
+        self.assertEqual(len(data["results"]), 1)
+        self.assertIn(data["results"][0]["name"], {"C0", "C1", "C2"})
+        self.assertEqual(
+            self.client.get(reverse("search_text"), {"q": "  "}).status_code, 400
+        )
+
+    def test_rebuild_command(self):
+        cv_doc = self.add_document("Python developer")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO cvapp_cvdocument_fts(cvapp_cvdocument_fts) "
+                "VALUES ('delete-all')"
+            )
+        self.assertEqual(self.ids("python"), [])
+        out = io.StringIO()
+        call_command("rebuild_fulltext_index", optimize=True, stdout=out)
+        self.assertIn("Indexed 1 document(s)", out.getvalue())
+        self.assertEqual(self.ids("python"), [cv_doc.pk])
+
+    def drop_triggers(self):
+        # As when a migration rebuilds the cvapp_cvdocument table
+        with connection.cursor() as cursor:
+            for name in fulltext.TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+
+    def test_rebuild_command_recreates_missing_triggers(self):
+        self.drop_triggers()
+        cv_doc = self.add_document("Python developer")
+        self.assertEqual(self.ids("python"), [])
+        out = io.StringIO()
+        call_command("rebuild_fulltext_index", stdout=out)
+        self.assertIn("Recreated missing trigger(s)", out.getvalue())
+        self.assertEqual(self.ids("python"), [cv_doc.pk])
+        cv_doc.extracted_text = "Rust developer"
+        cv_doc.save()
+        self.assertEqual((self.ids("python"), self.ids("rust")), ([], [cv_doc.pk]))
+
+    def test_migrate_restores_missing_triggers(self):
+        self.drop_triggers()
+        cv_doc = self.add_document("Python developer")
+        emit_post_migrate_signal(0, False, "default")
+        self.assertEqual(self.ids("python"), [cv_doc.pk])
+        CVDocument.objects.filter(pk=cv_doc.pk).delete()
+        self.assertEqual(self.ids("python"), [])
+        self.assertEqual(fulltext.restore_triggers(), [])
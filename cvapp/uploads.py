@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+
+from .utils import metrics
+
+# Extensions upload_cv accepts. The type a file is extracted as is sniffed
+# from its content, not taken from the extension.
+ALLOWED_EXTENSIONS = (".pdf", ".doc", ".docx")
+# PDF readers accept the "%PDF-" header anywhere in the first kilobyte
+SNIFF_BYTES = 1024
+PDF_MAGIC = b"%PDF-"
+# .docx files are ZIP archives; .doc files are OLE2 compound files
+ZIP_MAGIC = b"PK\x03\x04"
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def sniff_file_type(head):
+    """
+    Returns the type of a CV file from its first bytes: "pdf", "docx" or
+    "doc", or None if they match none of these (yet, for a short `head`).
+    """
+    if head.startswith(OLE2_MAGIC):
+        return "doc"
+    if head.startswith(ZIP_MAGIC):
+        return "docx"
+    if PDF_MAGIC in head[:SNIFF_BYTES]:
+        return "pdf"
+    return None
+
+
+class CVUploadHandler(TemporaryFileUploadHandler):
+    """
+    Checks uploaded CVs while their chunks arrive, before they are stored.
+
+    Files are rejected as soon as their extension is not supported, their
+    first bytes show they are not a PDF, DOC or DOCX file, or they take the
+    file past CV_UPLOAD_MAX_FILE_SIZE or the request past
+    CV_UPLOAD_MAX_REQUEST_SIZE (which counts every byte received, including
+    rejected files). The rest of a rejected file is discarded unread, and
+    (file name, reason) is added to request.upload_rejections.
+
+    Accepted files are streamed to a temporary file, which the storage
+    moves into MEDIA_ROOT, and carry the SHA-256 of their content as
+    `content_hash` and their sniffed type as `file_type`, so they do not have
+    to be read again before extraction.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        request.upload_rejections = []
+        self.request_size = 0
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args):
+        super().new_file(field_name, file_name, content_type, content_length, *args)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.file_type = None
+        if os.path.splitext(file_name)[1].lower() not in ALLOWED_EXTENSIONS:
+            self.reject("unsupported file extension")
+        if content_length and content_length > settings.CV_UPLOAD_MAX_FILE_SIZE:
+            self.reject(self.file_size_reason())
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self.request_size += len(raw_data)
+        if self.size > settings.CV_UPLOAD_MAX_FILE_SIZE:
+            self.reject(self.file_size_reason())
+        if self.request_size > settings.CV_UPLOAD_MAX_REQUEST_SIZE:
+            self.reject(
+                "the upload is larger than "
+                f"{filesizeformat(settings.CV_UPLOAD_MAX_REQUEST_SIZE)} in total"
+            )
+        if self.file_type is None:
+            self.head += raw_data[: SNIFF_BYTES - len(self.head)]
+            self.file_type = sniff_file_type(self.head)
+            if self.file_type is None and len(self.head) >= SNIFF_BYTES:
+                self.reject("not a PDF, DOC or DOCX file")
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.file_type is None:
+            # Files shorter than SNIFF_BYTES are only known once complete;
+            # returning no file leaves them out of request.FILES
+            self.file.close()
+            self.record_rejection("not a PDF, DOC or DOCX file")
+            return None
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.content_hash = self.digest.hexdigest()
+        uploaded_file.file_type = self.file_type
+        return uploaded_file
+
+    def reject(self, reason):
+        self.record_rejection(reason)
+        raise SkipFile(reason)
+
+    def record_rejection(self, reason):
+        self.request.upload_rejections.append((self.file_name, reason))
+        metrics.incr("uploads_rejected")
+
+    def file_size_reason(self):
+        return f"larger than {filesizeformat(settings.CV_UPLOAD_MAX_FILE_SIZE)}"
@@ -5,7 +5,12 @@ from . import views
 urlpatterns = [
     path("", views.upload_cv, name="upload_cv"),
     path("summary/", views.cv_summary, name="cv_summary"),
+    path("summary/status/", views.job_status, name="job_status"),
     path("upload/success/", views.upload_success, name="cv_upload_success"),
     path("chat/", views.chatbot_view, name="chatbot"),
+    path("chat/stream/", views.chatbot_stream, name="chatbot_stream"),
     path("chat/clear/", views.clear_chat, name="clear_chat"),
+    path("search/", views.search_candidates, name="search_candidates"),
+    path("search/text/", views.search_text, name="search_text"),
+    path("metrics/", views.metrics_view, name="metrics"),
 ]
@@ -0,0 +1,198 @@
+import atexit
+import multiprocessing
+import os
+import resource
+import signal
+import subprocess
+import threading
+
+import textract
+
+from .doc_text import extract_doc_text
+
+
+class DocExtractionTimeout(Exception):
+    """
+    A job ran longer than its timeout; its worker was killed.
+    """
+
+
+class DocExtractionFailed(Exception):
+    """
+    A job raised an error, or its worker died (e.g. over the memory limit).
+    """
+
+
+def extract_with_textract(file_path):
+    text = textract.process(file_path)
+    return text.decode("utf-8") if isinstance(text, bytes) else text
+
+
+def extract_with_antiword(file_path):
+    # -w 0 keeps each paragraph on one line instead of wrapping it
+    result = subprocess.run(
+        ["antiword", "-w", "0", file_path], capture_output=True, check=True
+    )
+    return result.stdout.decode("utf-8", "replace")
+
+
+# Extractors that DOC_EXTRACTORS can list, by name
+DOC_EXTRACTORS = {
+    "textract": extract_with_textract,
+    "antiword": extract_with_antiword,
+    "olefile": extract_doc_text,
+}
+
+# Workers are started by a fork server rather than forked from the process
+# handling the request: they start small, so their memory limit bounds the
+# extractor rather than a copy of the whole server process, and they do not
+# inherit locks held by its other threads. Jobs must therefore be functions
+# that a fresh interpreter can import.
+_context = multiprocessing.get_context("forkserver")
+
+
+def _serve(connection, memory_limit):
+    """
+    Runs in a worker process: applies the sandbox, then runs the
+    (function, file_path) jobs it receives and sends back (ok, result), where
+    result is the text or the error message.
+    """
+    # Its own process group, so that converters it starts are killed with it
+    os.setsid()
+    if memory_limit:
+        # Caps the virtual address space, inherited by the converters too
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    connection.send(os.getpid())
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        function, file_path = job
+        try:
+            connection.send((True, function(file_path)))
+        except Exception as e:
+            connection.send((False, str(e) or type(e).__name__))
+
+
+class _Worker:
+    def __init__(self, memory_limit):
+        self.connection, child_connection = _context.Pipe()
+        self.process = _context.Process(
+            target=_serve, args=(child_connection, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        # Wait until it leads its own process group, so kill() cannot hit ours
+        try:
+            self.connection.recv()
+        except EOFError:
+            self.process.join()
+            raise DocExtractionFailed("the worker could not start")
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.connection.close()
+
+
+class DocExtractionPool:
+    """
+    A fixed number of reusable worker processes for extractors that run
+    untrusted files through external converters.
+
+    Each worker is started by a fork server, leads its own process group and
+    is limited to `memory_limit` bytes of virtual address space (each of its
+    converters too). A job that takes longer
+    than its timeout gets its worker killed, with every process it started,
+    and a worker that died is replaced by a fresh one on the next job, so a
+    bad file can only ever cost one worker for `timeout` seconds. Callers
+    beyond `workers` wait for a free worker.
+    """
+
+    def __init__(self, workers, memory_limit):
+        self.memory_limit = memory_limit
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def run(self, function, file_path, timeout):
+        """
+        Runs function(file_path) in a worker and returns its result. Raises
+        DocExtractionTimeout after `timeout` seconds, and DocExtractionFailed
+        when the function raises or its worker dies.
+        """
+        with self._slots:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is None:
+                worker = _Worker(self.memory_limit)
+            try:
+                worker.connection.send((function, file_path))
+                if not worker.connection.poll(timeout):
+                    raise DocExtractionTimeout(f"timed out after {timeout:g}s")
+                ok, result = worker.connection.recv()
+            except (EOFError, OSError):
+                worker.kill()
+                raise DocExtractionFailed("the worker died")
+            except DocExtractionTimeout:
+                worker.kill()
+                raise
+            with self._lock:
+                self._idle.append(worker)
+        if not ok:
+            raise DocExtractionFailed(result)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+
+# .doc extraction pool shared by every request handled by this process.
+_doc_pool = None
+_doc_pool_lock = threading.Lock()
+
+
+def get_doc_pool(workers, memory_limit):
+    """
+    Returns the shared .doc extraction pool, creating it on first use. The
+    pool is reused by all later requests.
+    """
+    global _doc_pool
+    with _doc_pool_lock:
+        if _doc_pool is None:
+            _doc_pool = DocExtractionPool(workers, memory_limit)
+        return _doc_pool
+
+
+def shutdown_doc_pool():
+    """
+    Stops the shared pool's workers; the next .doc extraction starts a new one.
+    """
+    global _doc_pool
+    with _doc_pool_lock:
+        if _doc_pool is not None:
+            _doc_pool.shutdown()
+            _doc_pool = None
+
+
+atexit.register(shutdown_doc_pool)
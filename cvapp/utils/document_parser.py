@@ -1,5 +1,145 @@
 import re
 
+# Bump whenever the parsing rules below change, so that documents parsed under
+# the old version are parsed again.
+LOCAL_PARSER_VERSION = "2"
+
+SECTIONS = (
+    "personal_info",
+    "education",
+    "work_experience",
+    "skills",
+    "projects",
+    "certifications",
+)
+
+# Headings of each list section. These are matched wherever they appear in
+# the text, as they always have been.
+SECTION_HEADINGS = {
+    "education": ("Education",),
+    "work_experience": ("Work Experience", "Experience"),
+    "skills": ("Skills",),
+    "projects": ("Projects",),
+    "certifications": ("Certifications",),
+}
+# Other headings used for the same sections. Since words such as "employment"
+# are common in running text, these only count at the start of a line, and
+# only when the text has none of the headings above for that section.
+# Headings that contain one of the above (e.g. "Technical Skills") need no
+# synonym.
+SECTION_HEADING_SYNONYMS = {
+    "education": ("Academic Background", "Academic History", "Academics"),
+    "work_experience": (
+        "Employment History",
+        "Employment",
+        "Work History",
+        "Career History",
+        "Professional Background",
+    ),
+    "skills": ("Core Competencies", "Competencies", "Expertise", "Tech Stack"),
+    "projects": ("Portfolio",),
+    "certifications": ("Certificates", "Licenses", "Accreditations"),
+}
+OPTIONAL_SECTIONS = ("projects", "certifications")
+# Entries longer than this on average suggest the section ran into other text
+MAX_ENTRY_CHARS = 200
+
+HEADING_SECTIONS = {
+    heading.lower(): section
+    for headings in (SECTION_HEADINGS, SECTION_HEADING_SYNONYMS)
+    for section, names in headings.items()
+    for heading in names
+}
+SYNONYM_HEADINGS = {
+    synonym.lower()
+    for synonyms in SECTION_HEADING_SYNONYMS.values()
+    for synonym in synonyms
+}
+
+
+def _heading_pattern(flags=0):
+    """
+    One pattern for every heading. Literal alternatives only, since CPython
+    scans those much faster than named groups or case-insensitive matching;
+    the section is looked up from the matched text instead.
+    """
+    anywhere = sorted(HEADING_SECTIONS.keys() - SYNONYM_HEADINGS, key=len)[::-1]
+    line_start = sorted(SYNONYM_HEADINGS, key=len)[::-1]
+    return re.compile(
+        "|".join(map(re.escape, anywhere))
+        + r"|\n[ \t]*(?:%s)" % "|".join(map(re.escape, line_start)),
+        flags,
+    )
+
+
+# Used on the lower-cased text, or on the text itself when lower-casing would
+# not match what re.IGNORECASE matches
+HEADING_PATTERN = _heading_pattern()
+HEADING_PATTERN_IGNORECASE = _heading_pattern(re.IGNORECASE)
+# Characters that re.IGNORECASE matches to an ASCII letter but lower() keeps
+CASE_FOLDING_CHARS = ("\u017f", "\u0131")
+# A section runs until the next blank line (or the end of the text)
+SECTION_END_PATTERN = re.compile(r"\n\s*\n")
+FIRST_NON_SPACE_PATTERN = re.compile(r"\S")
+
+EMAIL_PATTERN = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b")
+# Every match starts with "+" or a digit; the lookahead lets the scan skip
+# other positions quickly.
+PHONE_PATTERN = re.compile(
+    r"(?=[+\d])\b(?:\+?(\d{1,3})[-.\s]?)?(\d{3})[-.\s]?(\d{3})[-.\s]?(\d{4})\b"
+)
+
+NAME_PATTERN = re.compile(r"^[^\W\d_]+(?:[ .'-]+[^\W\d_]+){1,3}\.?$")
+# Document titles that look like a name but are not one
+DOCUMENT_TITLES = ("curriculum vitae", "resume", "résumé")
+
+
+def segment_sections(text):
+    """
+    Finds the heading of every list section in one pass over the text.
+
+    Returns a dict mapping each section found to (heading_start, start, end):
+    where its heading starts, and the span of its content, which runs from
+    the end of the heading to the next blank line. The first occurrence of a
+    section's heading is used, and synonyms only when there is none.
+    """
+    # The leading newline lets synonyms match on the first line, and shifts
+    # match positions one past the corresponding positions in `text`
+    lowered = text.lower()
+    if len(lowered) == len(text) and not any(c in text for c in CASE_FOLDING_CHARS):
+        matches = HEADING_PATTERN.finditer("\n" + lowered)
+    else:
+        matches = HEADING_PATTERN_IGNORECASE.finditer("\n" + text)
+
+    headings = {}
+    synonyms = {}
+    for match in matches:
+        heading = match.group().lstrip()
+        section = _heading_section(heading)
+        found = synonyms if heading.lower() in SYNONYM_HEADINGS else headings
+        if section not in found:
+            found[section] = match.end() - 1 - len(heading), match.end() - 1
+            if len(headings) == len(SECTION_HEADINGS):
+                break
+
+    segments = {}
+    for section in SECTION_HEADINGS:
+        if section in headings or section in synonyms:
+            heading_start, start = headings.get(section) or synonyms[section]
+            end = SECTION_END_PATTERN.search(text, start)
+            segments[section] = heading_start, start, end.start() if end else len(text)
+    return segments
+
+
+def _heading_section(heading):
+    section = HEADING_SECTIONS.get(heading.lower())
+    if section is None:
+        # Only reached for headings spelt with case-folding characters
+        for name, section in HEADING_SECTIONS.items():
+            if re.fullmatch(re.escape(name), heading, re.IGNORECASE):
+                break
+    return section
+
 
 def parse_personal_information(text):
     """
@@ -8,20 +148,29 @@ def parse_personal_information(text):
     """
     personal_info = {}
 
-    # Extract emails
-    email_pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
-    emails = re.findall(email_pattern, text)
+    # Extract emails. An address never spans lines, so only lines with an
+    # "@" are searched.
+    emails = []
+    at = text.find("@")
+    while at != -1:
+        line_start = text.rfind("\n", 0, at) + 1
+        line_end = text.find("\n", at)
+        if line_end == -1:
+            line_end = len(text)
+        emails += EMAIL_PATTERN.findall(text, line_start, line_end)
+        at = text.find("@", line_end)
     personal_info["emails"] = emails
 
     # Extract phone numbers (simple pattern)
-    phone_pattern = r"\b(?:\+?(\d{1,3})[-.\s]?)?(\d{3})[-.\s]?(\d{3})[-.\s]?(\d{4})\b"
-    phones = re.findall(phone_pattern, text)
+    phones = PHONE_PATTERN.findall(text)
     personal_info["phones"] = ["".join(match) for match in phones]
 
     # Assume the first non-empty line is the candidate's name
-    lines = [line.strip() for line in text.split("\n") if line.strip()]
-    if lines:
-        personal_info["name"] = lines[0]
+    first = FIRST_NON_SPACE_PATTERN.search(text)
+    if first:
+        start = text.rfind("\n", 0, first.start()) + 1
+        end = text.find("\n", first.start())
+        personal_info["name"] = text[start : end if end != -1 else len(text)].strip()
 
     return personal_info
 
@@ -30,30 +179,14 @@ def parse_education(text):
     """
     Looks for an "Education" section and extracts its content.
     """
-    education = []
-    education_section = re.search(
-        r"Education(.*?)(?:\n\s*\n|\Z)", text, re.DOTALL | re.IGNORECASE
-    )
-    if education_section:
-        lines = education_section.group(1).strip().split("\n")
-        education = [line.strip() for line in lines if line.strip()]
-    return education
+    return _section_lines(text, segment_sections(text).get("education"))
 
 
 def parse_work_experience(text):
     """
     Extracts a section labeled "Experience" or "Work Experience".
     """
-    work_experience = []
-    work_section = re.search(
-        r"(?:Experience|Work Experience)(.*?)(?:\n\s*\n|\Z)",
-        text,
-        re.DOTALL | re.IGNORECASE,
-    )
-    if work_section:
-        lines = work_section.group(1).strip().split("\n")
-        work_experience = [line.strip() for line in lines if line.strip()]
-    return work_experience
+    return _section_lines(text, segment_sections(text).get("work_experience"))
 
 
 def parse_skills(text):
@@ -61,56 +194,115 @@ def parse_skills(text):
     Extracts skills from a section labeled "Skills".
     Assumes skills are listed either as comma separated values or on separate lines.
     """
-    skills = []
-    skills_section = re.search(
-        r"Skills(.*?)(?:\n\s*\n|\Z)", text, re.DOTALL | re.IGNORECASE
-    )
-    if skills_section:
-        skills_text = skills_section.group(1)
-        # Split on commas or new lines
-        skills = [
-            skill.strip() for skill in re.split(r",|\n", skills_text) if skill.strip()
-        ]
-    return skills
+    return _section_skills(text, segment_sections(text).get("skills"))
 
 
 def parse_projects(text):
     """
     Extracts projects from a section labeled "Projects".
     """
-    projects = []
-    projects_section = re.search(
-        r"Projects(.*?)(?:\n\s*\n|\Z)", text, re.DOTALL | re.IGNORECASE
-    )
-    if projects_section:
-        lines = projects_section.group(1).strip().split("\n")
-        projects = [line.strip() for line in lines if line.strip()]
-    return projects
+    return _section_lines(text, segment_sections(text).get("projects"))
 
 
 def parse_certifications(text):
     """
     Extracts certifications from a section labeled "Certifications".
     """
-    certifications = []
-    cert_section = re.search(
-        r"Certifications(.*?)(?:\n\s*\n|\Z)", text, re.DOTALL | re.IGNORECASE
-    )
-    if cert_section:
-        lines = cert_section.group(1).strip().split("\n")
-        certifications = [line.strip() for line in lines if line.strip()]
-    return certifications
+    return _section_lines(text, segment_sections(text).get("certifications"))
+
+
+def _section_lines(text, segment):
+    """
+    Returns the non-empty, stripped lines of a section's content.
+    """
+    if segment is None:
+        return []
+    _, start, end = segment
+    return [line.strip() for line in text[start:end].split("\n") if line.strip()]
+
+
+def _section_skills(text, segment):
+    """
+    Returns the skills of a skills section, split on commas or new lines.
+    """
+    if segment is None:
+        return []
+    _, start, end = segment
+    skills = text[start:end].replace(",", "\n").split("\n")
+    return [skill.strip() for skill in skills if skill.strip()]
 
 
 def parse_cv(text):
     """
     Combines all parsing functions to generate a structured representation of the CV.
+    The section headings are located once and each parser only reads its section.
     """
+    segments = segment_sections(text)
     return {
         "personal_info": parse_personal_information(text),
-        "education": parse_education(text),
-        "work_experience": parse_work_experience(text),
-        "skills": parse_skills(text),
-        "projects": parse_projects(text),
-        "certifications": parse_certifications(text),
+        "education": _section_lines(text, segments.get("education")),
+        "work_experience": _section_lines(text, segments.get("work_experience")),
+        "skills": _section_skills(text, segments.get("skills")),
+        "projects": _section_lines(text, segments.get("projects")),
+        "certifications": _section_lines(text, segments.get("certifications")),
     }
+
+
+def score_sections(text, parsed):
+    """
+    Estimates how much the output of parse_cv can be trusted, per section.
+
+    Returns a dict mapping each section to a confidence between 0 and 1. A
+    list section scores high when its heading stands on a line of its own and
+    is followed by its entries; a missing optional section scores high, a
+    missing core section (which may just use a heading the parser does not
+    know) scores 0.
+    """
+    segments = segment_sections(text)
+    scores = {"personal_info": _personal_info_confidence(parsed["personal_info"])}
+    for section in SECTION_HEADINGS:
+        scores[section] = _section_confidence(
+            text, segments.get(section), parsed[section], section in OPTIONAL_SECTIONS
+        )
+    return scores
+
+
+def _personal_info_confidence(personal_info):
+    """
+    Half of the confidence comes from a plausible name on the first line, the
+    rest from having found an email address and a phone number.
+    """
+    score = 0.0
+    name = personal_info.get("name", "")
+    if NAME_PATTERN.match(name) and name.lower() not in DOCUMENT_TITLES:
+        score += 0.5
+    if personal_info.get("emails"):
+        score += 0.25
+    if personal_info.get("phones"):
+        score += 0.25
+    return score
+
+
+def _section_confidence(text, segment, entries, optional):
+    if segment is None or not entries and not _is_heading_line(text, segment):
+        return 1.0 if optional else 0.0
+    if not _is_heading_line(text, segment):
+        # The heading word was matched inside some other text
+        return 0.2
+    if not entries:
+        return 0.2
+    if sum(len(entry) for entry in entries) / len(entries) > MAX_ENTRY_CHARS:
+        return 0.5
+    return 1.0
+
+
+def _is_heading_line(text, segment):
+    """
+    Whether a section's heading stands on a line of its own (optionally
+    followed by a colon).
+    """
+    heading_start, start, _ = segment
+    line_start = text.rfind("\n", 0, heading_start) + 1
+    line_end = text.find("\n", start)
+    rest = text[start : line_end if line_end != -1 else len(text)]
+    return not text[line_start:heading_start].strip() and rest.strip() in ("", ":")
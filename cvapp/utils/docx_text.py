@@ -0,0 +1,137 @@
+import re
+import zipfile
+
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Word stores text boxes twice: as DrawingML in mc:Choice and as VML in
+# mc:Fallback. Only the first copy is read.
+FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+DOCUMENT_PART = "word/document.xml"
+HEADER_PART_PATTERN = re.compile(r"word/header(\d*)\.xml")
+FOOTER_PART_PATTERN = re.compile(r"word/footer(\d*)\.xml")
+
+# Elements whose events the extractor handles; everything else is parsed
+# without being reported
+TAGS = (
+    W + "p",
+    W + "t",
+    W + "tab",
+    W + "br",
+    W + "cr",
+    W + "noBreakHyphen",
+    W + "tc",
+    W + "tr",
+    W + "tbl",
+    FALLBACK,
+)
+# Characters produced by run content elements other than w:t
+RUN_CHARACTERS = {
+    W + "tab": "\t",
+    W + "br": "\n",
+    W + "cr": "\n",
+    W + "noBreakHyphen": "-",
+}
+
+
+def extract_docx_text(file_path):
+    """
+    Extracts the text of a .docx file by streaming its XML parts from the
+    zip with lxml's iterparse, without building a document model.
+
+    Returns the headers, the body and then the footers, one paragraph per
+    line (see iter_part_lines). Headers and footers repeated across
+    sections are only included once.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        parts = (
+            _numbered_parts(names, HEADER_PART_PATTERN)
+            + [DOCUMENT_PART]
+            + _numbered_parts(names, FOOTER_PART_PATTERN)
+        )
+        blocks = []
+        for part in parts:
+            with archive.open(part) as source:
+                block = "\n".join(iter_part_lines(source))
+            if part == DOCUMENT_PART or (block.strip() and block not in blocks):
+                blocks.append(block)
+    return "\n".join(blocks)
+
+
+def _numbered_parts(names, pattern):
+    matches = [pattern.fullmatch(name) for name in names]
+    return [
+        match.group(0)
+        for match in sorted(
+            filter(None, matches), key=lambda match: int(match.group(1) or 0)
+        )
+    ]
+
+
+def iter_part_lines(source):
+    """
+    Yields the text of a WordprocessingML part (document, header or footer)
+    in document order: one line per paragraph, including empty ones, which
+    separate sections for the CV parser. Text boxes are yielded where they
+    are anchored, before the paragraph holding them.
+
+    A table row is one line with its cells separated by tabs, unless a cell
+    has several non-empty paragraphs; then each of them is a line.
+
+    Elements are freed as soon as they are handled, so memory use depends
+    on the largest paragraph or table row rather than on the document size.
+    """
+    paragraphs = []  # text pieces of each open paragraph (text boxes nest)
+    containers = [[]]  # finished lines of the part, then of each open cell
+    rows = []  # cells of each open table row (tables nest)
+    skipping = 0
+
+    for event, element in etree.iterparse(
+        source, events=("start", "end"), tag=TAGS, resolve_entities=False
+    ):
+        tag = element.tag
+        if tag == FALLBACK:
+            skipping += 1 if event == "start" else -1
+            continue
+        if skipping:
+            continue
+
+        if event == "start":
+            if tag == W + "p":
+                paragraphs.append([])
+            elif tag == W + "tc":
+                containers.append([])
+            elif tag == W + "tr":
+                rows.append([])
+            continue
+
+        if tag == W + "t":
+            if paragraphs and element.text:
+                paragraphs[-1].append(element.text)
+        elif tag in RUN_CHARACTERS:
+            if paragraphs:
+                paragraphs[-1].append(RUN_CHARACTERS[tag])
+        elif tag == W + "p":
+            containers[-1].append("".join(paragraphs.pop()))
+        elif tag == W + "tc":
+            rows[-1].append([line for line in containers.pop() if line.strip()])
+        elif tag == W + "tr":
+            cells = rows.pop()
+            if any(len(cell) > 1 for cell in cells):
+                containers[-1].extend(line for cell in cells for line in cell)
+            elif any(cells):
+                containers[-1].append(
+                    "\t".join(cell[0] if cell else "" for cell in cells)
+                )
+
+        if tag in (W + "p", W + "tr", W + "tbl"):
+            # Nothing else refers to a finished paragraph, row or table; the
+            # rows of a long table are freed before the table ends
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        if len(containers) == 1 and containers[0]:
+            yield from containers[0]
+            containers[0].clear()
@@ -1,13 +1,57 @@
+import time
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
+from . import metrics, response_cache
+from .history import count_tokens
+
+ERROR_REPLY = "Sorry, I'm having trouble processing your request at the moment."
+
+
+def build_chatbot_messages(extracted_data, conversation_history, history_summary=""):
+    """
+    Builds the message list sent to GPT-4: the system prompt with the CV
+    excerpts, the summary of older turns (if any), then the recent conversation.
+    """
+    summary_messages = []
+    if history_summary:
+        summary_messages.append(
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{history_summary}",
+            }
+        )
+    return [
+        {
+            "role": "system",
+            "content": f"""You are an expert HR assistant. The following are the parts of the CVs of one or more candidates that are most relevant to the question, separated by four hashes (####). Each part starts with the candidate it belongs to.
+                    Read this information carefully and answer any queries about the candidates accurately. Refer to candidates by name and number, and say so if the information needed is not included.
+                    \n\n
+                    {extracted_data}
+                    \n\n
+                    """,
+        },
+        *summary_messages,
+        *conversation_history,  # Unpack the conversation history
+    ]
+
 
-def query_chatbot(user_query, extracted_data, conversation_history):
+def query_chatbot(
+    user_query,
+    extracted_data,
+    conversation_history,
+    history_summary="",
+    cv_fingerprints=(),
+):
     """
     Calls GPT-4 to process the conversation and returns the assistant's response.
 
     Parameters:
     - user_query: The latest message from the user.
     - conversation_history: A list of dictionaries, each with keys "role" and "content", representing the conversation so far.
+    - history_summary: Summary of older turns that are no longer sent verbatim.
+    - cv_fingerprints: Identify the CVs asked about in the response cache (see response_cache.cache_key).
 
     Returns:
     - The assistant's reply as a string.
@@ -15,28 +59,148 @@ def query_chatbot(user_query, extracted_data, conversation_history):
 
     # Append the latest user query to the conversation history
     conversation_history.append({"role": "user", "content": user_query})
+    messages = build_chatbot_messages(
+        extracted_data, conversation_history, history_summary
+    )
+
+    # Identical questions about the same CVs and history reuse the earlier reply
+    key = _reply_cache_key(messages, cv_fingerprints)
+    cached_reply = response_cache.get_reply(key)
+    if cached_reply is not None:
+        return cached_reply
 
     try:
         client = settings.OPENAI_CLIENT
+        start = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""You are an expert HR assistant. The following is the CV information of the one or more candidates separeated by four hashes (####).
-                    Read this information carefully and answer any queries about the candidates accurately.
-                    \n\n
-                    {extracted_data}
-                    \n\n
-                    """,
-                },
-                *conversation_history,  # Unpack the conversation history
-            ],
+            messages=messages,
             temperature=0.2,  # Lower temperature for more deterministic responses
             max_tokens=500,
         )
+        seconds = time.perf_counter() - start
+        metrics.record_stage("chatbot_llm", seconds)
+        metrics.observe_llm_usage("chatbot", response)
         assistant_reply = response.choices[0].message.content
+        response_cache.store_reply(key, assistant_reply, seconds)
         return assistant_reply
     except Exception as e:
         print(f"Error calling GPT-4: {e}")
-        return "Sorry, I'm having trouble processing your request at the moment."
+        return ERROR_REPLY
+
+
+async def stream_chatbot(
+    user_query,
+    extracted_data,
+    conversation_history,
+    history_summary="",
+    cv_fingerprints=(),
+):
+    """
+    Async version of query_chatbot that yields the assistant's reply piece by
+    piece as GPT-4 generates it.
+
+    Parameters are the same as for query_chatbot. If the call fails, the
+    error reply is yielded instead (after any text already streamed).
+    """
+    conversation_history.append({"role": "user", "content": user_query})
+    messages = build_chatbot_messages(
+        extracted_data, conversation_history, history_summary
+    )
+
+    # A cached reply is sent as a single piece
+    key = _reply_cache_key(messages, cv_fingerprints)
+    cached_reply = await sync_to_async(response_cache.get_reply)(key)
+    if cached_reply is not None:
+        yield cached_reply
+        return
+
+    try:
+        client = settings.OPENAI_ASYNC_CLIENT
+        start = time.perf_counter()
+        stream = await client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            temperature=0.2,
+            max_tokens=500,
+            stream=True,
+        )
+        reply_parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                reply_parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        seconds = time.perf_counter() - start
+        reply = "".join(reply_parts)
+        # Streamed replies carry no usage, so the tokens are estimated
+        metrics.record_stage("chatbot_llm", seconds)
+        for direction, text in (
+            ("in", "".join(message["content"] for message in messages)),
+            ("out", reply),
+        ):
+            metrics.observe(
+                "llm_tokens",
+                count_tokens(text),
+                metrics.TOKEN_BUCKETS,
+                call="chatbot",
+                direction=direction,
+            )
+        await sync_to_async(response_cache.store_reply)(key, reply, seconds)
+    except Exception as e:
+        print(f"Error calling GPT-4: {e}")
+        yield ERROR_REPLY
+
+
+def _reply_cache_key(messages, cv_fingerprints):
+    """
+    Returns the response cache key for the messages of a chatbot request, with
+    the latest question normalized.
+    """
+    question = response_cache.normalize_question(messages[-1]["content"])
+    return response_cache.cache_key(
+        "gpt-4",
+        messages[:-1] + [{"role": "user", "content": question}],
+        cv_fingerprints,
+    )
+
+
+def summarize_conversation(summary, messages):
+    """
+    Folds `messages` into the running summary of a screening conversation and
+    returns the new summary, at most CHATBOT_SUMMARY_TOKEN_BUDGET tokens long.
+
+    If GPT-4 cannot be reached, the messages are appended to the summary in
+    shortened form instead, so the conversation can continue.
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = f"""
+        Update the summary of a conversation between a recruiter and an HR assistant about candidate CVs.
+        Keep the candidates discussed, the recruiter's requirements, and any conclusions reached. Be concise.
+
+        Current summary:
+        {summary or "(none)"}
+
+        New messages:
+        {transcript}
+
+        Respond only with the updated summary.
+    """
+    try:
+        client = settings.OPENAI_CLIENT
+        with metrics.timed("chatbot_summary"):
+            completion = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0,
+                max_tokens=settings.CHATBOT_SUMMARY_TOKEN_BUDGET,
+            )
+        metrics.observe_llm_usage("summary", completion)
+        return completion.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error summarizing conversation: {e}")
+        limit = settings.CHATBOT_SUMMARY_TOKEN_BUDGET * 4
+        shortened = "\n".join(f"{m['role']}: {m['content'][:200]}" for m in messages)
+        return f"{summary}\n{shortened}".strip()[-limit:]
@@ -0,0 +1,76 @@
+import math
+
+from django.conf import settings
+
+from . import metrics
+
+# Tokens the chat format adds around each message (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    """
+    Estimates the number of GPT-4 tokens in `text`.
+
+    Uses the usual approximation of four characters per token for English,
+    which is close enough for budgeting and avoids a tokenizer dependency.
+    """
+    return math.ceil(len(text or "") / 4)
+
+
+def count_message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def prepare_history(history, summary, summarized_count, summarize):
+    """
+    Chooses what part of the conversation is sent with the next question.
+
+    The most recent messages are kept verbatim as long as they fit in
+    CHATBOT_HISTORY_TOKEN_BUDGET. Older messages that no longer fit are folded
+    into the running summary with summarize(summary, messages), which only
+    happens once per message: `summarized_count` tracks how many messages from
+    the start of `history` the summary already covers.
+
+    Returns a dict with:
+    - messages: the recent messages to send verbatim.
+    - summary / summarized_count: the updated running summary and its coverage.
+    - usage: token accounting for the request (history_tokens is what sending
+      the whole history would have cost, sent_tokens what is actually sent).
+    """
+    pending = history[summarized_count:]
+    budget = settings.CHATBOT_HISTORY_TOKEN_BUDGET
+
+    kept = 0
+    used = 0
+    for message in reversed(pending):
+        cost = count_message_tokens(message)
+        if used + cost > budget:
+            break
+        kept += 1
+        used += cost
+
+    overflow = pending[: len(pending) - kept]
+    if overflow:
+        summary = summarize(summary, overflow)
+        summarized_count += len(overflow)
+    recent = pending[len(pending) - kept :]
+
+    history_tokens = sum(count_message_tokens(message) for message in history)
+    sent_tokens = used + (count_tokens(summary) if summary else 0)
+    usage = {
+        "history_tokens": history_tokens,
+        "sent_tokens": sent_tokens,
+        "saved_tokens": max(history_tokens - sent_tokens, 0),
+        "summarized_messages": summarized_count,
+    }
+    metrics.incr("chat_history_tokens", history_tokens)
+    metrics.incr("chat_history_tokens_sent", sent_tokens)
+    metrics.incr("chat_history_summarizations", 1 if overflow else 0)
+
+    return {
+        "messages": recent,
+        "summary": summary,
+        "summarized_count": summarized_count,
+        "usage": usage,
+    }
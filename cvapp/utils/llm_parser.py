@@ -2,8 +2,26 @@ import json
 
 from django.conf import settings
 
+from . import metrics
+from .history import count_tokens
 
-def parse_cv_with_gpt(text):
+# Bump whenever the prompt or model below changes, so that documents parsed
+# under the old version are parsed again (`manage.py reprocess` re-parses the
+# stored ones without extracting them again).
+PARSER_VERSION = "gpt-4-1"
+
+
+SECTION_DESCRIPTIONS = {
+    "personal_info": 'An object containing "name", "emails", and "phones".',
+    "education": "A list of education entries.",
+    "work_experience": "A list of work experience entries.",
+    "skills": "A list of skills.",
+    "projects": "A list of projects.",
+    "certifications": "A list of certifications.",
+}
+
+
+def parse_cv_with_gpt(text, sections=None):
     """
     Uses GPT-4 to parse CV text and return structured JSON data.
     The JSON includes keys:
@@ -13,15 +31,12 @@ def parse_cv_with_gpt(text):
     - skills (list)
     - projects (list)
     - certifications (list)
+
+    If `sections` is given, only those keys are requested (and returned).
     """
     prompt = f"""
         You are an expert HR assistant. Extract the following information from the provided CV text and return it as valid JSON with the following keys:
-        - "personal_info": An object containing "name", "emails", and "phones".
-        - "education": A list of education entries.
-        - "work_experience": A list of work experience entries.
-        - "skills": A list of skills.
-        - "projects": A list of projects.
-        - "certifications": A list of certifications.
+        {_section_keys(sections)}
 
         If any of these sections are not present, return an empty list or null for that section.
 
@@ -34,7 +49,138 @@ def parse_cv_with_gpt(text):
         Respond only with valid JSON and nothing else. Your output will be parsed by python json.loads() function.
     """
     try:
-        client = settings.OPENAI_CLIENT
+        return json.loads(_complete(prompt))
+    except Exception as e:
+        print(f"Error during GPT-4 parsing: {e}")
+        raise Exception(f"Error during GPT-4 parsing: {e}")
+
+
+def parse_cvs_with_gpt(texts):
+    """
+    Parses several CV texts with as few GPT-4 requests as possible.
+
+    The CVs are packed into requests of at most LLM_PARSE_BATCH_SIZE CVs, so
+    the instructions are sent once per request instead of once per CV. Each
+    CV also reserves LLM_PARSE_OUTPUT_TOKENS_PER_CV tokens for its share of
+    the reply, which is the request's max_tokens, and the prompt plus the
+    reply must fit in LLM_PARSE_BATCH_TOKENS and the model's context
+    (LLM_PARSE_CONTEXT_TOKENS). A CV too large for the budget gets a request
+    of its own.
+
+    Each CV's result is checked against the schema; a CV whose result is
+    missing or invalid (or whose whole request failed) is retried alone with
+    parse_cv_with_gpt.
+
+    Returns one entry per text, in order: the parsed dict, or the exception
+    raised by the individual retry.
+    """
+    results = [None] * len(texts)
+    for batch in _pack_batches(texts):
+        if len(batch) == 1:
+            parsed = {}
+        else:
+            prompt = _batch_prompt([texts[i] for i in batch])
+            try:
+                max_tokens = len(batch) * settings.LLM_PARSE_OUTPUT_TOKENS_PER_CV
+                parsed = json.loads(_complete(prompt, max_tokens))
+                metrics.incr("llm_parse_batched_documents", len(batch))
+            except Exception as e:
+                print(f"Error during batched GPT-4 parsing: {e}")
+                parsed = {}
+        for number, index in enumerate(batch, start=1):
+            result = parsed.get(str(number)) if isinstance(parsed, dict) else None
+            if is_valid_parse(result):
+                results[index] = result
+                continue
+            if len(batch) > 1:
+                metrics.incr("llm_parse_retries")
+            try:
+                results[index] = parse_cv_with_gpt(texts[index])
+            except Exception as e:
+                results[index] = e
+    return results
+
+
+def is_valid_parse(parsed, sections=None):
+    """
+    Whether `parsed` has the schema parse_cv_with_gpt asks for: every section
+    present, personal_info an object and the others lists (any may be null).
+    """
+    if not isinstance(parsed, dict):
+        return False
+    for section in sections or SECTION_DESCRIPTIONS:
+        if section not in parsed:
+            return False
+        expected = dict if section == "personal_info" else list
+        if parsed[section] is not None and not isinstance(parsed[section], expected):
+            return False
+    return True
+
+
+def _section_keys(sections=None):
+    return "\n        ".join(
+        f'- "{section}": {SECTION_DESCRIPTIONS[section]}'
+        for section in sections or SECTION_DESCRIPTIONS
+    )
+
+
+def _batch_prompt(texts):
+    cvs = "\n\n        ".join(
+        f"#### CV {number} ####\n        {text}"
+        for number, text in enumerate(texts, start=1)
+    )
+    return f"""
+        You are an expert HR assistant. Extract the following information from each of the CVs below and return it as valid JSON with the following keys:
+        {_section_keys()}
+
+        If any of these sections are not present, return an empty list or null for that section.
+
+        Each CV starts with a line "#### CV <number> ####".
+
+        {cvs}
+
+        Respond only with a valid JSON object that maps each CV number (as a string, e.g. "1") to the JSON for that CV, and nothing else. Your output will be parsed by python json.loads() function.
+    """
+
+
+def _pack_batches(texts):
+    """
+    Splits the indexes of `texts` into consecutive batches within the size
+    and token limits. Each CV costs its prompt tokens (with its heading) plus
+    its output allowance.
+    """
+    total = min(settings.LLM_PARSE_BATCH_TOKENS, settings.LLM_PARSE_CONTEXT_TOKENS)
+    budget = total - count_tokens(_batch_prompt([]))
+    batches = []
+    batch = []
+    used = 0
+    for index, text in enumerate(texts):
+        tokens = (
+            count_tokens(f"#### CV {len(batch) + 1} ####\n        {text}")
+            + settings.LLM_PARSE_OUTPUT_TOKENS_PER_CV
+        )
+        if batch and (
+            len(batch) >= settings.LLM_PARSE_BATCH_SIZE or used + tokens > budget
+        ):
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append(index)
+        used += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _complete(prompt, max_tokens=None):
+    """
+    Sends one parsing prompt to GPT-4 and returns the text of the reply,
+    which is limited to `max_tokens` if given.
+    """
+    metrics.incr("llm_parse_requests")
+    client = settings.OPENAI_CLIENT
+    options = {} if max_tokens is None else {"max_tokens": max_tokens}
+    with metrics.timed("llm_parse"):
         completion = client.chat.completions.create(
             model="gpt-4",
             messages=[
@@ -42,11 +188,7 @@ def parse_cv_with_gpt(text):
                 {"role": "user", "content": prompt},
             ],
             temperature=0,
+            **options,
         )
-
-        output = completion.choices[0].message.content
-        parsed = json.loads(output)
-        return parsed
-    except Exception as e:
-        print(f"Error during GPT-4 parsing: {e}")
-        raise Exception(f"Error during GPT-4 parsing: {e}")
+    metrics.observe_llm_usage("parse", completion)
+    return completion.choices[0].message.content
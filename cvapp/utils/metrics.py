@@ -0,0 +1,194 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+# (name, labels) -> [count per bucket..., count above the last bucket, sum]
+_histograms = {}
+_buckets = {}
+
+# Upper bounds of the histogram buckets, in seconds, pages and tokens
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Seconds per stage of the request being handled, for its Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_NOT_TIMED = nullcontext()
+_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def incr(name, amount=1):
+    """
+    Adds `amount` to the process-local counter called `name`.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name):
+    """
+    Returns the current value of a counter (0 if it was never incremented).
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """
+    Returns a copy of all counters.
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """
+    Clears all counters and histograms. Mainly useful in tests.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _buckets.clear()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """
+    Records `value` in the process-local histogram called `name`, with the
+    given labels. Does nothing unless METRICS_ENABLED is set.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            _buckets[name] = buckets
+        histogram[bisect.bisect_left(_buckets[name], value)] += 1
+        histogram[-1] += value
+
+
+def histogram(name, **labels):
+    """
+    Returns (count, sum) of a histogram, or (0, 0) if nothing was recorded.
+    """
+    with _lock:
+        histogram = _histograms.get((name, tuple(sorted(labels.items()))))
+        if histogram is None:
+            return 0, 0
+        return sum(histogram[:-1]), histogram[-1]
+
+
+def record_stage(stage, seconds):
+    """
+    Records how long a pipeline stage took: in the stage_seconds histogram
+    and in the Server-Timing header of the current request.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    observe("stage_seconds", seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class _Timer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, time.perf_counter() - self.started)
+
+
+def timed(stage):
+    """
+    Context manager timing a pipeline stage with record_stage. When metrics
+    are disabled it returns a shared no-op context manager.
+    """
+    if not settings.METRICS_ENABLED:
+        return _NOT_TIMED
+    return _Timer(stage)
+
+
+def observe_llm_usage(call, completion):
+    """
+    Records the prompt and completion tokens of an OpenAI chat completion, as
+    reported in its usage, in the llm_tokens histogram.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    usage = getattr(completion, "usage", None)
+    for direction, field in (("in", "prompt_tokens"), ("out", "completion_tokens")):
+        tokens = getattr(usage, field, None)
+        if isinstance(tokens, int):
+            observe("llm_tokens", tokens, TOKEN_BUCKETS, call=call, direction=direction)
+
+
+def start_request():
+    """
+    Starts collecting stage timings for the current request. Returns the
+    dict they are collected in and a token for finish_request.
+    """
+    timings = {}
+    return timings, _request_timings.set(timings)
+
+
+def finish_request(token):
+    _request_timings.reset(token)
+
+
+def server_timing(timings, total):
+    """
+    Formats stage timings (in seconds) as a Server-Timing header value, in
+    milliseconds.
+    """
+    entries = [
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_prometheus():
+    """
+    Returns all counters and histograms in the Prometheus text exposition
+    format, with names prefixed by "cvapp_".
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        buckets = dict(_buckets)
+
+    lines = []
+    for name, value in sorted(counters.items()):
+        name = f"cvapp_{_NAME_PATTERN.sub('_', name)}_total"
+        lines += [f"# TYPE {name} counter", f"{name} {value:g}"]
+
+    typed = set()
+    for (name, labels), values in sorted(histograms.items()):
+        metric = f"cvapp_{_NAME_PATTERN.sub('_', name)}"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        label_text = "".join(f'{key}="{value}",' for key, value in labels)
+        cumulative = 0
+        for bound, count in zip((*buckets[name], "+Inf"), values[:-1]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{label_text}le="{bound}"}} {cumulative}')
+        label_text = "{%s}" % label_text.rstrip(",") if labels else ""
+        lines.append(f"{metric}_sum{label_text} {values[-1]:g}")
+        lines.append(f"{metric}_count{label_text} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,91 @@
+import os
+import threading
+
+import pytesseract
+
+try:
+    # Optional: Tesseract bindings that run in-process (pip install tesserocr)
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+class PytesseractEngine:
+    """
+    Runs the tesseract command once per image: the image is written to a
+    temporary file and the language model is loaded again on every call.
+    Works wherever the tesseract binary is installed.
+    """
+
+    name = "pytesseract"
+
+    def image_to_string(self, image, psm=None):
+        if psm is None:
+            return pytesseract.image_to_string(image)
+        return pytesseract.image_to_string(image, config=f"--psm {psm}")
+
+
+class TesserocrEngine:
+    """
+    Keeps one initialized Tesseract instance per thread (and process) and
+    passes images to it in memory, so the model is loaded once per OCR
+    worker instead of once per page. Requires tesserocr.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang="eng"):
+        self.lang = lang
+        self._local = threading.local()
+
+    def _api(self):
+        # An instance inherited from the parent of a forked pool worker is
+        # not reused, as its native state is not safe to share.
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.pid = os.getpid()
+        return self._local.api
+
+    def image_to_string(self, image, psm=None):
+        api = self._api()
+        api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+
+ENGINES = {engine.name: engine for engine in (PytesseractEngine, TesserocrEngine)}
+
+# One engine of each kind per process, so their Tesseract instances are reused
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def available_engines():
+    """
+    Returns the names of the engines that can run here.
+    """
+    return [name for name in ENGINES if name != "tesserocr" or tesserocr]
+
+
+def resolve_engine_name(name):
+    """
+    Returns the engine used for the OCR_ENGINE value `name`: "auto" prefers
+    tesserocr, and tesserocr falls back to pytesseract when not installed.
+    """
+    if name not in ("auto", *ENGINES):
+        raise ValueError(f"Unknown OCR engine: {name}")
+    if name == "pytesseract" or not tesserocr:
+        return "pytesseract"
+    return "tesserocr"
+
+
+def get_engine(name):
+    """
+    Returns this process's engine for the OCR_ENGINE value `name` (see
+    resolve_engine_name), creating it on first use.
+    """
+    name = resolve_engine_name(name)
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = ENGINES[name]()
+        return _engines[name]
@@ -1,62 +1,452 @@
+import atexit
 import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 
-import pytesseract
-import textract  # New dependency for .doc files
-from docx import Document
-from pdf2image import convert_from_path
+from django.conf import settings
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextContainer
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from PIL import Image
+
+from . import metrics
+from .doc_extraction import (
+    DOC_EXTRACTORS,
+    DocExtractionFailed,
+    DocExtractionTimeout,
+    get_doc_pool,
+)
+from .docx_text import extract_docx_text
+from .ocr_engines import get_engine, resolve_engine_name
+from .ocr_preprocessing import PROBE_DPI, binarize, plan_page
+
+# Bump whenever the extracted text for a given file could change, so that
+# documents cached under the old version are extracted again.
+EXTRACTOR_VERSION = "3"
+
+# Glyphs pdfminer could not map to unicode come out as "(cid:123)".
+UNMAPPED_GLYPH_PATTERN = re.compile(r"\(cid:\d+\)|\ufffd")
+
+# OCR process pool shared by every request handled by this process.
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def get_extractor_version():
+    """
+    Returns the cache key for the current extractor: the code version plus the
+    settings that change which text a file produces.
+    """
+    if settings.PDF_EXTRACTION_MODE == "ocr":
+        version = f"{EXTRACTOR_VERSION}:ocr"
+    else:
+        version = (
+            f"{EXTRACTOR_VERSION}:hybrid:{settings.PDF_TEXT_MIN_CHARS}"
+            f":{settings.PDF_TEXT_MIN_ALNUM_RATIO}"
+        )
+    if settings.OCR_PREPROCESSING == "adaptive":
+        version += (
+            f":adaptive:{settings.OCR_MIN_DPI}:{settings.OCR_MAX_DPI}"
+            f":{settings.OCR_TARGET_LINE_PIXELS}"
+        )
+    engine = resolve_engine_name(settings.OCR_ENGINE)
+    if engine != "pytesseract":
+        version += f":{engine}"
+    return version
+
+
+def extract_pdf_text_layer(file_path):
+    """
+    Reads the embedded text layer of a PDF with pdfminer.
+    Returns one string per page (empty for pages that only contain images).
+    """
+    resource_manager = PDFResourceManager()
+    device = PDFPageAggregator(resource_manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resource_manager, device)
+
+    pages = []
+    with open(file_path, "rb") as fp:
+        for page in PDFPage.get_pages(fp):
+            interpreter.process_page(page)
+            layout = device.get_result()
+            pages.append(
+                "".join(
+                    element.get_text()
+                    for element in layout
+                    if isinstance(element, LTTextContainer)
+                )
+            )
+    return pages
+
+
+def is_usable_text(text):
+    """
+    Decides whether a page's embedded text is good enough to skip OCR.
+
+    The page needs at least PDF_TEXT_MIN_CHARS visible characters, and at least
+    PDF_TEXT_MIN_ALNUM_RATIO of them must be letters or digits. Unmapped glyphs
+    count as visible but never as alphanumeric, so pages with broken font
+    encodings fall back to OCR.
+    """
+    unmapped = len(UNMAPPED_GLYPH_PATTERN.findall(text))
+    mapped = UNMAPPED_GLYPH_PATTERN.sub("", text)
+    visible = [char for char in mapped if not char.isspace()]
+    total = len(visible) + unmapped
+    if total < settings.PDF_TEXT_MIN_CHARS:
+        return False
+    alnum = sum(1 for char in visible if char.isalnum())
+    return alnum / total >= settings.PDF_TEXT_MIN_ALNUM_RATIO
+
+
+def iter_pdf_page_images(file_path, first_page, last_page, **render_options):
+    """
+    Yields (page_number, image) for a range of PDF pages, one page at a time.
+    `render_options` (e.g. dpi, grayscale) are passed on to convert_from_path.
+
+    The range is rendered by a single pdftoppm call into a temporary directory.
+    Each image is only decoded when it is yielded, and it is closed and its
+    file removed before the next page is loaded, so memory use does not grow
+    with the number of pages.
+    """
+    with tempfile.TemporaryDirectory() as output_folder:
+        try:
+            paths = convert_from_path(
+                file_path,
+                first_page=first_page,
+                last_page=last_page,
+                output_folder=output_folder,
+                paths_only=True,
+                **render_options,
+            )
+        except Exception as e:
+            raise Exception(f"Error converting PDF: {e}")
+
+        for page_number, path in zip(range(first_page, last_page + 1), paths):
+            with Image.open(path) as image:
+                yield page_number, image
+            os.remove(path)
+
+
+def ocr_pdf_page_range(file_path, first_page, last_page):
+    """
+    Rasterizes PDF pages first_page..last_page (1-based, inclusive) and runs
+    Tesseract OCR on each. Returns the text of each page in order.
+    """
+    texts, _, _ = ocr_pdf_page_range_timed(
+        file_path, first_page, last_page, ocr_options()
+    )
+    return texts
+
+
+def ocr_options():
+    """
+    Returns the engine and preprocessing settings for
+    ocr_pdf_page_range_timed. They are passed explicitly so that pool workers
+    do not depend on Django settings.
+    """
+    return {
+        "engine": settings.OCR_ENGINE,
+        "preprocessing": settings.OCR_PREPROCESSING,
+        "min_dpi": settings.OCR_MIN_DPI,
+        "max_dpi": settings.OCR_MAX_DPI,
+        "target_line_pixels": settings.OCR_TARGET_LINE_PIXELS,
+    }
+
+
+def ocr_pdf_page_range_timed(file_path, first_page, last_page, options=None):
+    """
+    Like ocr_pdf_page_range, but returns (texts, rasterize_seconds,
+    ocr_seconds), so that pool workers can report where their time went.
+    With adaptive preprocessing in `options` (see ocr_options) the pages are
+    OCR'd by ocr_pdf_page_range_adaptive instead.
+    """
+    if options["preprocessing"] == "adaptive":
+        return ocr_pdf_page_range_adaptive(file_path, first_page, last_page, options)
+
+    engine = get_engine(options["engine"])
+    texts = []
+    rasterize_seconds = ocr_seconds = 0.0
+    started = time.perf_counter()
+    for _, image in iter_pdf_page_images(file_path, first_page, last_page):
+        # Time spent waiting for the next page is rendering and cleanup
+        rendered = time.perf_counter()
+        rasterize_seconds += rendered - started
+        texts.append(engine.image_to_string(image))
+        started = time.perf_counter()
+        ocr_seconds += started - rendered
+    rasterize_seconds += time.perf_counter() - started
+    return texts, rasterize_seconds, ocr_seconds
+
+
+def ocr_pdf_page_range_adaptive(file_path, first_page, last_page, options):
+    """
+    OCRs a range of PDF pages with adaptive preprocessing (see plan_page).
+
+    The range is first rendered at PROBE_DPI in grayscale, which is cheap, to
+    plan each page. Blank pages are not OCR'd at all; the others are rendered
+    again at their planned resolution, consecutive pages with the same one in
+    a single pdftoppm call, then binarized and passed to Tesseract with their
+    page segmentation mode. Returns (texts, rasterize_seconds, ocr_seconds),
+    where probing and binarizing count as rasterizing.
+    """
+    engine = get_engine(options["engine"])
+    started = time.perf_counter()
+    plans = {
+        number: plan_page(
+            image,
+            options["min_dpi"],
+            options["max_dpi"],
+            options["target_line_pixels"],
+        )
+        for number, image in iter_pdf_page_images(
+            file_path, first_page, last_page, dpi=PROBE_DPI, grayscale=True
+        )
+    }
+    rasterize_seconds = time.perf_counter() - started
+    ocr_seconds = 0.0
+
+    # [dpi, first, last] of each run of consecutive pages to render together
+    runs = []
+    for number in range(first_page, last_page + 1):
+        plan = plans.get(number)
+        if plan is None:
+            continue
+        if runs and runs[-1][0] == plan[0] and runs[-1][2] == number - 1:
+            runs[-1][2] = number
+        else:
+            runs.append([plan[0], number, number])
+
+    texts = {}
+    for dpi, first, last in runs:
+        started = time.perf_counter()
+        for number, image in iter_pdf_page_images(
+            file_path, first, last, dpi=dpi, grayscale=True
+        ):
+            image = binarize(image)
+            rendered = time.perf_counter()
+            rasterize_seconds += rendered - started
+            texts[number] = engine.image_to_string(image, psm=plans[number][1])
+            started = time.perf_counter()
+            ocr_seconds += started - rendered
+        rasterize_seconds += time.perf_counter() - started
+    texts = [texts.get(number, "") for number in range(first_page, last_page + 1)]
+    return texts, rasterize_seconds, ocr_seconds
+
+
+def split_page_ranges(page_numbers, max_pages):
+    """
+    Groups sorted page numbers into (first, last) runs of consecutive pages,
+    each at most max_pages long.
+    """
+    ranges = []
+    for number in page_numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            first, last = ranges[-1]
+            if last - first + 1 < max_pages:
+                ranges[-1] = (first, number)
+                continue
+        ranges.append((number, number))
+    return ranges
+
+
+def get_ocr_pool():
+    """
+    Returns the process pool used for parallel OCR, creating it on first use
+    with OCR_WORKERS processes. The pool is reused by all later requests.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=settings.OCR_WORKERS)
+        return _ocr_pool
+
+
+def shutdown_ocr_pool():
+    """
+    Shuts down the shared OCR pool; the next parallel OCR call starts a new one.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(cancel_futures=True)
+            _ocr_pool = None
+
+
+atexit.register(shutdown_ocr_pool)
+
+
+def ocr_pdf_pages(file_path, page_numbers):
+    """
+    OCRs the given pages (1-based, ascending) of a PDF and returns their text
+    in the same order.
+
+    Pages are rendered in ranges of at most OCR_RENDER_BATCH_PAGES pages and
+    OCR'd one image at a time, with OCR_PREPROCESSING applied. With
+    OCR_WORKERS > 1 the ranges are spread over the shared process pool, each
+    worker rendering and OCRing its own range.
+    """
+    workers = settings.OCR_WORKERS
+    batch_pages = settings.OCR_RENDER_BATCH_PAGES
+    if workers > 1:
+        # Make sure there is at least one range per worker.
+        batch_pages = min(batch_pages, -(-len(page_numbers) // workers))
+    ranges = split_page_ranges(page_numbers, max(batch_pages, 1))
+    options = ocr_options()
+
+    if workers <= 1 or len(ranges) < 2:
+        results = [
+            ocr_pdf_page_range_timed(file_path, *page_range, options)
+            for page_range in ranges
+        ]
+    else:
+        firsts, lasts = zip(*ranges)
+        try:
+            results = list(
+                get_ocr_pool().map(
+                    ocr_pdf_page_range_timed,
+                    repeat(file_path),
+                    firsts,
+                    lasts,
+                    repeat(options),
+                )
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start fresh on the next call.
+            shutdown_ocr_pool()
+            raise
+
+    # Summed over workers, so with a pool this can exceed the elapsed time
+    metrics.record_stage("pdf_rasterize", sum(result[1] for result in results))
+    metrics.record_stage("ocr", sum(result[2] for result in results))
+    metrics.observe("pdf_pages", len(page_numbers), metrics.PAGE_BUCKETS, method="ocr")
+    return [text for texts, _, _ in results for text in texts]
 
 
 def extract_text_from_pdf(file_path):
     """
-    Convert PDF pages to images and use Tesseract OCR to extract text.
+    Extract text from a PDF.
+
+    In "hybrid" mode (the default) the embedded text layer is used for every
+    page where it passes is_usable_text(), and only the remaining pages are
+    converted to images and OCR'd with Tesseract. In "ocr" mode, or when the
+    text layer cannot be read at all, every page is OCR'd.
     """
-    try:
-        images = convert_from_path(file_path)
-    except Exception as e:
-        raise Exception(f"Error converting PDF: {e}")
+    pages = None
+    if settings.PDF_EXTRACTION_MODE != "ocr":
+        try:
+            with metrics.timed("pdf_text_layer"):
+                pages = extract_pdf_text_layer(file_path)
+        except Exception as e:
+            print(f"Could not read PDF text layer, falling back to OCR: {e}")
+
+    if pages is None:
+        try:
+            page_count = pdfinfo_from_path(file_path)["Pages"]
+        except Exception as e:
+            raise Exception(f"Error converting PDF: {e}")
+        pages = [""] * page_count
 
-    text = ""
-    for image in images:
-        # You can adjust pytesseract configuration if needed.
-        text += pytesseract.image_to_string(image)
-    return text
+    ocr_numbers = [
+        number
+        for number, text in enumerate(pages, start=1)
+        if settings.PDF_EXTRACTION_MODE == "ocr" or not is_usable_text(text)
+    ]
+    metrics.observe(
+        "pdf_pages",
+        len(pages) - len(ocr_numbers),
+        metrics.PAGE_BUCKETS,
+        method="text_layer",
+    )
+    if ocr_numbers:
+        for number, text in zip(ocr_numbers, ocr_pdf_pages(file_path, ocr_numbers)):
+            pages[number - 1] = text
+    return "".join(pages)
 
 
 def extract_text_from_docx(file_path):
     """
-    Extract text from a .docx file using python-docx.
+    Extract text from a .docx file, including its tables, text boxes,
+    headers and footers, by streaming its XML (see extract_docx_text).
     """
-    try:
-        doc = Document(file_path)
-    except Exception as e:
-        raise Exception(f"Error processing DOCX: {e}")
-
-    text = "\n".join([para.text for para in doc.paragraphs])
-    return text
+    with metrics.timed("docx"):
+        try:
+            return extract_docx_text(file_path)
+        except Exception as e:
+            raise Exception(f"Error processing DOCX: {e}")
 
 
 def extract_text_from_doc(file_path):
     """
-    Extract text from a .doc file using textract.
+    Extract text from a .doc file with the extractors listed in
+    DOC_EXTRACTORS, trying each in turn until one returns text.
+
+    Every attempt runs in the shared sandboxed pool (see DocExtractionPool)
+    and is stopped after DOC_EXTRACTION_TIMEOUT seconds, so a file that
+    hangs or crashes a converter only costs that attempt. Timeouts and
+    failures are counted per extractor.
     """
-    try:
-        text = textract.process(file_path)
-        # Decode bytes to string if necessary.
-        return text.decode("utf-8") if isinstance(text, bytes) else text
-    except Exception as e:
-        raise Exception(f"Error processing DOC: {e}")
+    names = [name.strip() for name in settings.DOC_EXTRACTORS.split(",")]
+    for name in names:
+        if name not in DOC_EXTRACTORS:
+            raise ValueError(f"Unknown .doc extractor: {name}")
+    pool = get_doc_pool(
+        settings.DOC_EXTRACTION_WORKERS, settings.DOC_EXTRACTION_MEMORY_LIMIT
+    )
+
+    errors = []
+    empty = False
+    with metrics.timed("doc"):
+        for name in names:
+            try:
+                text = pool.run(
+                    DOC_EXTRACTORS[name], file_path, settings.DOC_EXTRACTION_TIMEOUT
+                )
+            except DocExtractionTimeout as e:
+                metrics.incr(f"doc_extraction_{name}_timeouts")
+                errors.append(f"{name}: {e}")
+                continue
+            except DocExtractionFailed as e:
+                metrics.incr(f"doc_extraction_{name}_failures")
+                errors.append(f"{name}: {e}")
+                continue
+            if text.strip():
+                return text
+            empty = True
+    if empty:
+        # The document may really have no text; that is not an error
+        return ""
+    raise Exception(f"Error processing DOC: {'; '.join(errors)}")
 
 
-def extract_text(file_path):
+def extract_text(file_path, file_type=None):
     """
-    Determine the file type and extract text accordingly.
+    Extract text according to the file type ("pdf", "docx" or "doc"), which
+    is taken from the extension when not given.
     """
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".pdf":
+    if file_type is None:
+        file_type = os.path.splitext(file_path)[1].lower().lstrip(".")
+    if file_type == "pdf":
         return extract_text_from_pdf(file_path)
-    elif ext == ".docx":
+    elif file_type == "docx":
         return extract_text_from_docx(file_path)
-    elif ext == ".doc":
+    elif file_type == "doc":
         return extract_text_from_doc(file_path)
     else:
         raise ValueError("Unsupported file extension for OCR extraction")
+
+
+def extract_text_timed(file_path, file_type=None):
+    """
+    Runs extract_text and returns (text, seconds). Meant to be submitted to a
+    process pool, so that the time measured excludes waiting in the queue.
+    """
+    started = time.perf_counter()
+    text = extract_text(file_path, file_type)
+    return text, time.perf_counter() - started
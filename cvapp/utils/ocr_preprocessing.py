@@ -0,0 +1,143 @@
+import statistics
+
+from PIL import Image
+
+# Tesseract page segmentation modes (--psm)
+PSM_AUTO = 3
+PSM_SINGLE_COLUMN = 4
+PSM_SPARSE_TEXT = 11
+
+# Resolution of the quick rendering each page is probed with
+PROBE_DPI = 72
+# Chosen resolutions are rounded down to a multiple of this, so consecutive
+# pages usually share one and are rendered by one pdftoppm call
+DPI_STEP = 25
+# Very large pages are rendered at a lower resolution to stay within this
+MAX_PAGE_PIXELS = 12_000_000
+
+# Rows (or columns) with less than this share of dark pixels are background
+INK_RATIO = 0.005
+# Runs of inked rows shorter than this (in probe pixels) are specks, not text
+MIN_LINE_PIXELS = 2
+# Pages with at most this many text lines are OCR'd as sparse text
+SPARSE_MAX_LINES = 3
+# A blank band at least this share of the text's width, with text on both
+# sides, separates two columns
+COLUMN_GAP_RATIO = 0.03
+
+
+def otsu_threshold(histogram):
+    """
+    Returns the grey level that best separates the dark and light pixels of a
+    256-bin histogram (Otsu's method). Pixels at or below it are ink.
+    """
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_variance, threshold = -1, 127
+    for level, count in enumerate(histogram):
+        background += count
+        if not background:
+            continue
+        foreground = total - background
+        if not foreground:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance, threshold = variance, level
+    return threshold
+
+
+def binarize(image):
+    """
+    Converts a page image to black text on a white background, thresholded
+    with Otsu's method.
+    """
+    gray = image.convert("L")
+    threshold = otsu_threshold(gray.histogram())
+    return gray.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+def plan_page(image, min_dpi, max_dpi, target_line_pixels):
+    """
+    Decides how to OCR a page from its rendering at PROBE_DPI.
+
+    Returns None for a blank page, otherwise (dpi, psm): the resolution at
+    which the page's median text line is about `target_line_pixels` tall
+    (within min_dpi..max_dpi, and lower for very large pages), and the page
+    segmentation mode for its layout: sparse text for pages with only a few
+    lines, automatic for multi-column pages and a single column otherwise.
+    """
+    binary = binarize(image)
+    width, height = binary.size
+    # Shrinking to one pixel per row averages each row, which is much faster
+    # than counting pixels in Python
+    rows = _ink_ratios(binary.resize((1, height), Image.BOX))
+    lines = [
+        (start, end)
+        for start, end in _runs(ratio >= INK_RATIO for ratio in rows)
+        if end - start >= MIN_LINE_PIXELS
+    ]
+    if not lines:
+        return None
+
+    line_inches = statistics.median(end - start for start, end in lines) / PROBE_DPI
+    dpi = min(max(target_line_pixels / line_inches, min_dpi), max_dpi)
+    page_square_inches = width * height / PROBE_DPI**2
+    dpi = min(dpi, (MAX_PAGE_PIXELS / page_square_inches) ** 0.5)
+    dpi = max(int(dpi // DPI_STEP * DPI_STEP), DPI_STEP)
+
+    if len(lines) <= SPARSE_MAX_LINES:
+        psm = PSM_SPARSE_TEXT
+    elif _has_column_gap(_ink_ratios(binary.resize((width, 1), Image.BOX))):
+        psm = PSM_AUTO
+    else:
+        psm = PSM_SINGLE_COLUMN
+    return dpi, psm
+
+
+def _ink_ratios(strip):
+    return [1 - value / 255 for value in strip.getdata()]
+
+
+def _runs(flags):
+    """
+    Returns the (start, end) index ranges of the consecutive true values.
+    """
+    runs = []
+    start = None
+    for index, flag in enumerate(flags):
+        if flag and start is None:
+            start = index
+        elif not flag and start is not None:
+            runs.append((start, index))
+            start = None
+    if start is not None:
+        runs.append((start, index + 1))
+    return runs
+
+
+def _has_column_gap(columns):
+    """
+    Whether the column profile of a page has a blank band in the middle of its
+    text. Headings that span the columns only add a little ink to the band,
+    so columns with under a tenth of the typical ink count as blank.
+    """
+    inked = [ratio for ratio in columns if ratio >= INK_RATIO]
+    if not inked:
+        return False
+    blank_below = statistics.median(inked) / 10
+    text = [index for index, ratio in enumerate(columns) if ratio >= blank_below]
+    first, last = text[0], text[-1]
+    text_width = last - first
+    for start, end in _runs(ratio < blank_below for ratio in columns[first:last]):
+        middle = (start + end) / 2
+        if (
+            end - start >= COLUMN_GAP_RATIO * text_width
+            and 0.2 * text_width <= middle <= 0.8 * text_width
+        ):
+            return True
+    return False
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+CACHE_ALIAS = "chatbot"
+
+
+def normalize_question(question):
+    """
+    Lower-cases the question, collapses whitespace and drops trailing
+    punctuation, so trivially different phrasings share a cache entry.
+    """
+    question = re.sub(r"\s+", " ", question).strip().lower()
+    return question.rstrip("?!. ")
+
+
+def cache_key(model, messages, cv_fingerprints=()):
+    """
+    Returns the cache key for a chatbot request: a hash of the model, the
+    fingerprints of the CVs asked about and the exact messages sent.
+
+    A CV's fingerprint is its content and text hashes with the extractor
+    and parser versions (see views._chatbot_context), so the key does not
+    depend on document ids and uploads of the same files share entries. The
+    messages contain the CV excerpts, whose candidate labels do not include
+    ids either, the history summary, the recent turns and the (normalized)
+    question, so a change to any of them is a different entry.
+    """
+    payload = json.dumps(
+        [model, sorted(map(list, cv_fingerprints)), messages], sort_keys=True
+    )
+    return f"chatbot-reply:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def get_reply(key):
+    """
+    Returns the cached reply for `key`, or None. Hits and misses are counted,
+    and each hit adds the latency of the original GPT-4 call to the saved time.
+    """
+    if not settings.CHATBOT_CACHE_ENABLED:
+        return None
+    try:
+        entry = caches[CACHE_ALIAS].get(key)
+    except Exception as e:
+        print(f"Error reading chatbot cache: {e}")
+        entry = None
+    if entry is None:
+        metrics.incr("chatbot_cache_misses")
+        return None
+    metrics.incr("chatbot_cache_hits")
+    metrics.incr("chatbot_cache_saved_seconds", entry["seconds"])
+    return entry["reply"]
+
+
+def store_reply(key, reply, seconds):
+    """
+    Caches a reply that took `seconds` to generate, for CHATBOT_CACHE_TTL
+    seconds. A failing cache backend never fails the chat request.
+    """
+    if not settings.CHATBOT_CACHE_ENABLED:
+        return
+    try:
+        caches[CACHE_ALIAS].set(key, {"reply": reply, "seconds": seconds})
+    except Exception as e:
+        print(f"Error writing chatbot cache: {e}")
+
+
+def cache_stats():
+    """
+    Summarises the chatbot response cache counters of this process.
+    """
+    hits = metrics.get("chatbot_cache_hits")
+    misses = metrics.get("chatbot_cache_misses")
+    return {
+        "hits": int(hits),
+        "misses": int(misses),
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_seconds": metrics.get("chatbot_cache_saved_seconds"),
+    }
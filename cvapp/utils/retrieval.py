@@ -0,0 +1,181 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+
+TOKEN_PATTERN = re.compile(r"\w[\w+#]*")
+
+# Words too common in questions and CVs to say anything about relevance.
+STOP_WORDS = frozenset(
+    """a about an and any are as at be by can do does for from has have he her
+    his how i in is it its me of on or our she that the their them there they
+    this to was we were what when where which who whom why with you your""".split()
+)
+
+# Indexes built for recent sets of documents, most recently used last.
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+INDEX_CACHE_SIZE = 32
+
+
+def tokenize(text):
+    """
+    Lowercases text and splits it into search terms, dropping stop words.
+    Keeps "+" and "#" inside words so that "C++" and "C#" stay searchable.
+    """
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def chunk_text(text, chunk_words, overlap_words):
+    """
+    Splits text into windows of `chunk_words` words, each overlapping the
+    previous one by `overlap_words` words.
+    """
+    words = text.split()
+    step = max(chunk_words - overlap_words, 1)
+    return [
+        " ".join(words[start : start + chunk_words])
+        for start in range(0, max(len(words) - overlap_words, 1), step)
+        if words[start : start + chunk_words]
+    ]
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 inverted index over text chunks.
+
+    Each chunk is stored with the label of the candidate it came from, so that
+    search results can be attributed.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        """
+        chunks: list of (label, text) pairs.
+        """
+        self.k1 = k1
+        self.b = b
+        self.labels = []
+        self.texts = []
+        self.lengths = []
+        self.postings = defaultdict(list)  # term -> [(chunk index, term frequency)]
+
+        for label, text in chunks:
+            index = len(self.texts)
+            terms = tokenize(text)
+            self.labels.append(label)
+            self.texts.append(text)
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((index, frequency))
+
+        self.average_length = (
+            sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        )
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query, top_k):
+        """
+        Returns up to top_k (score, chunk index) pairs, best first. Only chunks
+        sharing at least one term with the query are returned.
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (len(self) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for index, frequency in postings:
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.lengths[index] / self.average_length
+                )
+                scores[index] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, index) for index, score in ranked[:top_k]]
+
+
+def candidate_label(cv_doc, number):
+    """
+    Identifies a candidate in the prompt: their number in the set of CVs
+    plus name when known. Document ids are left out, so the same CVs get the
+    same labels in every upload and share cached replies.
+    """
+    name = ((cv_doc.parsed_data or {}).get("personal_info") or {}).get("name")
+    return f"Candidate #{number} ({name})" if name else f"Candidate #{number}"
+
+
+def build_index(cv_docs):
+    """
+    Chunks the extracted_text of each CVDocument and indexes the chunks under
+    the candidate's label, numbering candidates in the order of `cv_docs`.
+    """
+    chunks = []
+    for number, cv_doc in enumerate(cv_docs, start=1):
+        label = candidate_label(cv_doc, number)
+        for chunk in chunk_text(
+            cv_doc.extracted_text or "",
+            settings.CHATBOT_CHUNK_WORDS,
+            settings.CHATBOT_CHUNK_OVERLAP_WORDS,
+        ):
+            chunks.append((label, chunk))
+    return BM25Index(chunks)
+
+
+def get_index(key, load_documents):
+    """
+    Returns the index for the set of documents identified by `key`, reusing
+    the one built for an earlier question about the same documents with the
+    same chunk settings.
+
+    load_documents() is only called on a cache miss, so the CV texts do not
+    have to be read from the database on every question.
+    """
+    key = (key, settings.CHATBOT_CHUNK_WORDS, settings.CHATBOT_CHUNK_OVERLAP_WORDS)
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    index = build_index(load_documents())
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def build_context(index, query, top_k):
+    """
+    Selects the top_k chunks most relevant to `query` and formats them for the
+    system prompt, each under the label of its candidate and separated by four
+    hashes. Chunks from the same candidate are kept together.
+
+    When nothing matches (e.g. "summarise everyone"), the first chunk of each
+    candidate is used instead, up to top_k.
+    """
+    indexes = [index_ for _, index_ in index.search(query, top_k)]
+    if not indexes:
+        seen = set()
+        for position, label in enumerate(index.labels):
+            if label not in seen:
+                seen.add(label)
+                indexes.append(position)
+        indexes = indexes[:top_k]
+
+    by_candidate = OrderedDict()
+    for position in sorted(indexes):
+        by_candidate.setdefault(index.labels[position], []).append(
+            index.texts[position]
+        )
+    return "\n\n####\n\n".join(
+        f"{label}:\n" + "\n...\n".join(texts) for label, texts in by_candidate.items()
+    )
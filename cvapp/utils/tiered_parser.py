@@ -0,0 +1,36 @@
+from . import metrics
+from .document_parser import parse_cv, score_sections
+from .llm_parser import is_valid_parse
+
+
+def parse_cv_tiered(text, llm_parse=None, threshold=0.6):
+    """
+    Parses CV text with the local rule-based parser first, and asks the LLM
+    only for the sections whose confidence is below `threshold`.
+
+    `llm_parse(text, sections=[...])` should return a dict with those
+    sections; without it (local mode) the local result is used as is. A
+    section the LLM leaves out or returns with the wrong type (see
+    is_valid_parse) keeps the local value.
+
+    Returns (parsed, sources), where sources maps every section to the tier
+    that produced it: "local" or "llm".
+    """
+    parsed = parse_cv(text)
+    sources = dict.fromkeys(parsed, "local")
+    scores = score_sections(text, parsed)
+    weak = [section for section in parsed if scores[section] < threshold]
+
+    if weak and llm_parse is not None:
+        llm_parsed = llm_parse(text, sections=weak)
+        for section in weak:
+            if not is_valid_parse(llm_parsed, [section]):
+                metrics.incr("parser_llm_invalid_sections")
+                continue
+            parsed[section] = llm_parsed[section]
+            sources[section] = "llm"
+        metrics.incr("parser_llm_calls")
+
+    metrics.incr("parser_sections_local", list(sources.values()).count("local"))
+    metrics.incr("parser_sections_llm", list(sources.values()).count("llm"))
+    return parsed, sources
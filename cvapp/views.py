@@ -1,68 +1,87 @@
 import json
-import os
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.db.models.functions import Length
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
+from . import fulltext
 from .forms import CVDocumentForm
-from .models import CVDocument
-from .utils.gpt_chatbot import query_chatbot
-from .utils.llm_parser import parse_cv_with_gpt
-from .utils.ocr_parser import extract_text
+from .jobs import enqueue_document, latest_jobs
+from .models import Conversation, CVDocument, IngestionJob
+from .pipeline import process_documents
+from .search import search_documents
+from .uploads import CVUploadHandler
+from .utils import metrics
+from .utils.gpt_chatbot import query_chatbot, stream_chatbot, summarize_conversation
+from .utils.history import prepare_history
+from .utils.retrieval import build_context, get_index
 
 
+@csrf_exempt
 def upload_cv(request):
+    if request.method == "POST":
+        # Check, hash and store the files while they are received. Upload
+        # handlers must be set before the body is read, which the CSRF check
+        # would do, so it runs afterwards in _upload_cv.
+        request.upload_handlers = [CVUploadHandler(request)]
+    return _upload_cv(request)
+
+
+@csrf_protect
+def _upload_cv(request):
     if request.method == "POST":
         files = request.FILES.getlist("file")
-        valid_extensions = [".pdf", ".doc", ".docx"]
+        for name, reason in request.upload_rejections:
+            messages.error(request, f"Rejected file {name}: {reason}.")
         if not files:
-            messages.error(request, "No files were selected.")
+            if not request.upload_rejections:
+                messages.error(request, "No files were selected.")
             return redirect("upload_cv")
 
-        aggregated_texts = []
-        aggregated_json = []
-
+        cv_docs = []
+        file_names = []
         for file in files:
-            ext = os.path.splitext(file.name)[1]
-            if ext.lower() not in valid_extensions:
-                messages.error(
-                    request,
-                    f"Unsupported file extension for file {file.name}.",
-                )
-                return render(
-                    request, "cvapp/upload_cv.html", {"form": CVDocumentForm()}
-                )
-
-            cv_doc = CVDocument.objects.create(file=file)
-            try:
-                # Extract text from the file using OCR or native parsing
-                text = extract_text(cv_doc.file.path)
-                cv_doc.extracted_text = text
-
-                # Parse the text into structured data
-                parsed = parse_cv_with_gpt(text)
-                cv_doc.parsed_data = parsed
-                cv_doc.save()
-
-                aggregated_texts.append(text)
-                aggregated_json.append(parsed)
-            except Exception as e:
-                messages.error(request, f"Error processing file {file.name}: {e}")
-                return render(
-                    request, "cvapp/upload_cv.html", {"form": CVDocumentForm()}
+            with metrics.timed("store"):
+                cv_doc = CVDocument.objects.create(
+                    file=file, content_hash=file.content_hash, file_type=file.file_type
                 )
+            cv_docs.append(cv_doc)
+            file_names.append(file.name)
+            if settings.CV_BACKGROUND_INGESTION:
+                # The process_jobs worker extracts and parses the file
+                enqueue_document(cv_doc)
 
-        # Join all extracted texts with a separator
-        aggregated_text = "\n\n####\n\n".join(aggregated_texts)
+        if not settings.CV_BACKGROUND_INGESTION:
+            # Extract and parse the files concurrently, reusing results for
+            # identical uploads; a failed file does not stop the others
+            errors = process_documents(cv_docs)
+            for name, error in zip(file_names, errors):
+                if error is not None:
+                    messages.error(request, f"Error processing file {name}: {error}")
+            cv_docs = [
+                cv_doc for cv_doc, error in zip(cv_docs, errors) if error is None
+            ]
 
-        # Store the aggregated text in session for use in the chatbot system prompt
-        request.session["cv_extracted_text"] = aggregated_text
+        if not cv_docs:
+            return render(request, "cvapp/upload_cv.html", {"form": CVDocumentForm()})
 
-        # Store the aggregated json in session to present the summary
-        request.session["cv_parsed_data"] = aggregated_json
+        # The session only references the documents of this upload; their
+        # text and parsed data are loaded from the database when needed
+        request.session["cv_document_ids"] = [cv_doc.pk for cv_doc in cv_docs]
 
-        # Reset conversation history if needed
-        request.session["conversation_history"] = []
+        # Start a new conversation about the new documents
+        request.session.pop("conversation_id", None)
 
         return redirect("cv_summary")
     else:
@@ -72,46 +91,346 @@ def upload_cv(request):
 
 def chatbot_view(request):
     # Retrieve the conversation history; initialize if not present.
-    conversation_history = request.session.get("conversation_history", [])
-    cv_extracted_text = request.session.get("cv_extracted_text", "")
+    conversation = _get_conversation(request, create=request.method == "POST")
+    conversation_history = conversation.history() if conversation else []
+    token_usage = None
 
     if request.method == "POST":
         user_message = request.POST.get("message")
         if user_message:
+            # Send only the recent turns that fit the token budget, plus a
+            # summary of the older ones
+            window = _budgeted_history(conversation, conversation_history)
+            token_usage = window["usage"]
+
+            cv_context, cv_fingerprints = _chatbot_context(
+                request, user_message, conversation_history
+            )
             # Pass the conversation history and new user message to the GPT-4 helper
             assistant_reply = query_chatbot(
                 user_message,
-                extracted_data=cv_extracted_text,
-                conversation_history=conversation_history.copy(),
+                extracted_data=cv_context,
+                conversation_history=window["messages"],
+                history_summary=window["summary"],
+                cv_fingerprints=cv_fingerprints,
             )
             # Append both the user message and the assistant reply to the conversation
+            conversation.add_exchange(user_message, assistant_reply)
             conversation_history.append({"role": "user", "content": user_message})
             conversation_history.append(
                 {"role": "assistant", "content": assistant_reply}
             )
-            request.session["conversation_history"] = conversation_history
         else:
             messages.error(request, "Please enter a message.")
 
-    return render(request, "cvapp/chatbot.html", {"conversation": conversation_history})
+    response = render(
+        request, "cvapp/chatbot.html", {"conversation": conversation_history}
+    )
+    if token_usage:
+        response["X-Chat-History-Tokens"] = _format_token_usage(token_usage)
+    return response
+
+
+async def chatbot_stream(request):
+    """
+    Streams the assistant's reply to the browser as server-sent events while
+    GPT-4 generates it, then saves the exchange to the conversation history.
+
+    Each event carries {"delta": "..."}; a final "done" event marks the end
+    and reports the token accounting of the conversation history.
+    Served without blocking a worker when the project runs under ASGI.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    user_message = request.POST.get("message")
+    if not user_message:
+        return JsonResponse({"error": "Please enter a message."}, status=400)
+
+    conversation = await sync_to_async(_get_conversation)(request, create=True)
+    conversation_history = await sync_to_async(conversation.history)()
+    cv_context, cv_fingerprints = await sync_to_async(_chatbot_context)(
+        request, user_message, conversation_history
+    )
+    window = await sync_to_async(_budgeted_history)(conversation, conversation_history)
+
+    async def events():
+        reply_parts = []
+        async for delta in stream_chatbot(
+            user_message,
+            extracted_data=cv_context,
+            conversation_history=window["messages"],
+            history_summary=window["summary"],
+            cv_fingerprints=cv_fingerprints,
+        ):
+            reply_parts.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+
+        await sync_to_async(conversation.add_exchange)(
+            user_message, "".join(reply_parts)
+        )
+        yield f"event: done\ndata: {json.dumps({'usage': window['usage']})}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    response["X-Chat-History-Tokens"] = _format_token_usage(window["usage"])
+    return response
 
 
 def cv_summary(request):
-    # Retrieve the parsed data from the session (list of dicts)
-    cv_parsed_data = request.session.get("cv_parsed_data", [])
+    # Each document of the upload with its parsed data (raw and pretty-printed)
+    # and, for background uploads, its job status
+    data_list = _document_summaries(request)
+    pending = any(
+        item["status"] in (IngestionJob.QUEUED, IngestionJob.RUNNING)
+        for item in data_list
+    )
+    return render(
+        request,
+        "cvapp/cv_summary.html",
+        {"cv_parsed_data": data_list, "pending": pending},
+    )
 
-    # Build a new list that includes both the raw dictionary and a pretty version
-    data_list = []
-    for entry in cv_parsed_data:
-        data_list.append({"raw": entry, "pretty_json": json.dumps(entry, indent=4)})
 
-    return render(request, "cvapp/cv_summary.html", {"cv_parsed_data": data_list})
+def job_status(request):
+    """
+    Reports the ingestion progress of the documents in the current upload.
+    Polled by the summary page while background jobs are running.
+    """
+    data_list = _document_summaries(request)
+    completed = sum(
+        1
+        for item in data_list
+        if item["status"] in (IngestionJob.DONE, IngestionJob.FAILED)
+    )
+    return JsonResponse(
+        {"documents": data_list, "completed": completed, "total": len(data_list)}
+    )
 
 
 def clear_chat(request):
-    request.session["conversation_history"] = []
+    conversation = _get_conversation(request)
+    if conversation:
+        conversation.delete()
+    request.session.pop("conversation_id", None)
     return redirect("chatbot")
 
 
 def upload_success(request):
     return render(request, "cvapp/upload_success.html")
+
+
+def search_candidates(request):
+    """
+    Finds stored CVs by skill, employer and institution.
+
+    Each of the `skill`, `employer` and `institution` query parameters may be
+    repeated, and a CV must match all of them. Results are newest first and
+    paginated with `page` and `page_size` (at most SEARCH_MAX_PAGE_SIZE).
+    """
+    try:
+        page_size = int(request.GET.get("page_size", settings.SEARCH_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "page_size must be a number."}, status=400)
+    page_size = max(1, min(page_size, settings.SEARCH_MAX_PAGE_SIZE))
+
+    documents = search_documents(
+        skills=request.GET.getlist("skill"),
+        employers=request.GET.getlist("employer"),
+        institutions=request.GET.getlist("institution"),
+    )
+    paginator = Paginator(
+        documents.only("id", "uploaded_at", "parsed_data").prefetch_related(
+            "skills", "employers", "institutions"
+        ),
+        page_size,
+    )
+    page = paginator.get_page(request.GET.get("page"))
+    return JsonResponse(
+        {
+            "count": paginator.count,
+            "page": page.number,
+            "num_pages": paginator.num_pages,
+            "results": [_search_result(cv_doc) for cv_doc in page],
+        }
+    )
+
+
+def search_text(request):
+    """
+    Full-text search over the extracted text of every stored CV.
+
+    `q` holds the words (and "quoted phrases") a CV must contain. Results are
+    ranked by BM25, paginated like search_candidates, and each comes with an
+    HTML snippet of the text around the matches.
+    """
+    if not fulltext.is_available():
+        return JsonResponse(
+            {"error": "Full-text search requires the SQLite database."}, status=501
+        )
+    query = request.GET.get("q", "")
+    if not fulltext.to_match_query(query):
+        return JsonResponse({"error": "Please enter a search query."}, status=400)
+    try:
+        page_size = int(request.GET.get("page_size", settings.SEARCH_PAGE_SIZE))
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        return JsonResponse(
+            {"error": "page and page_size must be numbers."}, status=400
+        )
+    page_size = max(1, min(page_size, settings.SEARCH_MAX_PAGE_SIZE))
+    page = max(1, page)
+
+    count, results = fulltext.search_text(query, page_size, (page - 1) * page_size)
+    documents = CVDocument.objects.only("parsed_data").in_bulk(
+        [result["id"] for result in results]
+    )
+    for result in results:
+        # A document deleted since the search has no name
+        parsed = getattr(documents.get(result["id"]), "parsed_data", None) or {}
+        result["name"] = (parsed.get("personal_info") or {}).get("name")
+    return JsonResponse(
+        {
+            "count": count,
+            "page": page,
+            "num_pages": max(1, -(-count // page_size)),
+            "results": results,
+        }
+    )
+
+
+def metrics_view(request):
+    """
+    Exposes the counters and histograms of this process in the Prometheus
+    text format. Only available when METRICS_ENABLED is set.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(
+        metrics.render_prometheus(), content_type="text/plain; version=0.0.4"
+    )
+
+
+def _chatbot_context(request, user_message, conversation_history):
+    """
+    Returns the excerpts of the current upload's CVs that are most relevant to
+    the user's message, so the prompt size does not grow with the number of CVs,
+    and the fingerprints of those CVs for the response cache.
+
+    The CVs are ordered by content, so the same files are numbered the same
+    way (see retrieval.candidate_label) whatever order they were uploaded in.
+    """
+    documents = CVDocument.objects.filter(
+        pk__in=request.session.get("cv_document_ids", []),
+        extracted_text__isnull=False,
+    ).order_by("text_hash", "content_hash", "pk")
+    rows = documents.values_list(
+        "pk",
+        "content_hash",
+        "extractor_version",
+        Length("extracted_text"),
+        "parsed_text_hash",
+        "parser_version",
+        "text_hash",
+    )
+    # The labels come from parsed_data, so a new parse also changes the index
+    key = tuple(row[:6] for row in rows)
+    fingerprints = [
+        (content_hash, text_hash, extractor_version, parser_version)
+        for _, content_hash, extractor_version, _, _, parser_version, text_hash in rows
+    ]
+    if not key:
+        return "", fingerprints
+    with metrics.timed("index"):
+        index = get_index(key, lambda: documents.only("extracted_text", "parsed_data"))
+
+    # Include the previous question so that follow-ups such as "what about
+    # her education?" still find the candidate being discussed
+    previous = [m["content"] for m in conversation_history if m["role"] == "user"]
+    query = " ".join(previous[-1:] + [user_message])
+    with metrics.timed("retrieval"):
+        context = build_context(index, query, settings.CHATBOT_RETRIEVAL_TOP_K)
+    return context, fingerprints
+
+
+def _get_conversation(request, create=False):
+    """
+    Returns the Conversation referenced by the session, or None. With `create`,
+    a new one is started (and referenced) when there is none.
+    """
+    conversation_id = request.session.get("conversation_id")
+    conversation = None
+    if conversation_id:
+        conversation = Conversation.objects.filter(pk=conversation_id).first()
+    if conversation is None and create:
+        conversation = Conversation.objects.create()
+        request.session["conversation_id"] = conversation.pk
+    return conversation
+
+
+def _budgeted_history(conversation, conversation_history):
+    """
+    Applies the history token budget to the conversation, updating its running
+    summary of older turns.
+    """
+    window = prepare_history(
+        conversation_history,
+        conversation.summary,
+        conversation.summarized_count,
+        summarize_conversation,
+    )
+    if window["summarized_count"] != conversation.summarized_count:
+        conversation.summary = window["summary"]
+        conversation.summarized_count = window["summarized_count"]
+        conversation.save(update_fields=["summary", "summarized_count"])
+    return window
+
+
+def _format_token_usage(usage):
+    return ", ".join(
+        f"{key}={usage[key]}"
+        for key in ("history_tokens", "sent_tokens", "saved_tokens")
+    )
+
+
+def _session_documents(request):
+    """
+    Returns the CVDocuments of the current upload, in upload order.
+    """
+    document_ids = request.session.get("cv_document_ids", [])
+    documents = CVDocument.objects.in_bulk(document_ids)
+    return [documents[pk] for pk in document_ids if pk in documents]
+
+
+def _document_summaries(request):
+    documents = _session_documents(request)
+    jobs = latest_jobs([doc.pk for doc in documents])
+
+    data_list = []
+    for doc in documents:
+        job = jobs.get(doc.pk)
+        entry = doc.parsed_data
+        data_list.append(
+            {
+                "id": doc.pk,
+                # Documents processed inside the request have no job
+                "status": job.status if job else IngestionJob.DONE,
+                "error": job.error if job else None,
+                "raw": entry,
+                "pretty_json": json.dumps(entry, indent=4) if entry else "",
+            }
+        )
+    return data_list
+
+
+def _search_result(cv_doc):
+    personal_info = (cv_doc.parsed_data or {}).get("personal_info") or {}
+    return {
+        "id": cv_doc.pk,
+        "name": personal_info.get("name"),
+        "uploaded_at": cv_doc.uploaded_at.isoformat(),
+        "skills": [skill.name for skill in cv_doc.skills.all()],
+        "employers": [employer.name for employer in cv_doc.employers.all()],
+        "institutions": [institution.name for institution in cv_doc.institutions.all()],
+    }